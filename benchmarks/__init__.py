@@ -0,0 +1,4 @@
+"""
+Benchmarks for Rota
+Run from the repository root, e.g. python -m benchmarks.e2e
+"""
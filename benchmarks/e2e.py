@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+End-to-end data-plane benchmark for Rota
+Starts a local origin and N fake upstream proxies in one process and a load
+generator in another, then runs Rota in this process once per server engine
+and rotation strategy. Throughput, latency percentiles, CPU and RSS of the
+Rota process are printed and saved as JSON; --baseline compares a run against
+an earlier results file and exits non-zero on regressions.
+
+    python -m benchmarks.e2e --duration 10 --concurrency 64
+    python -m benchmarks.e2e --baseline benchmarks/results/e2e-previous.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rota.config import Config, RotationStrategy
+from rota.proxy_manager import ProxyManager
+
+from benchmarks.load import run_load
+from benchmarks.stubs import run_stubs
+
+
+ENGINES = ('threaded', 'asyncio')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, where the platform exposes it"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def start_server(config: Config, manager: ProxyManager):
+    """Start Rota's server for the configured engine, returning (server, listening port)"""
+    if config.server_engine == 'asyncio':
+        from rota.async_server import AsyncProxyServer
+        server = AsyncProxyServer(config, manager)
+        server.start()
+        return server, server.server.sockets[0].getsockname()[1]
+    from rota.server import ProxyServer
+    server = ProxyServer(config, manager)
+    server.start()
+    return server, server.server.server_address[1]
+
+
+def run_case(args, context, engine: str, strategy: RotationStrategy, origin_port: int,
+             proxy_file: str) -> Dict:
+    """Benchmark one engine and rotation strategy"""
+    config = Config()
+    config.host = '127.0.0.1'
+    config.port = 0
+    config.server_engine = engine
+    config.rotation_strategy = strategy
+    config.proxy_files = [proxy_file]
+    config.health_check_url = f"http://127.0.0.1:{origin_port}/"
+    config.health_cache_enabled = False
+    config.rate_limit_enabled = False
+    config.max_connections = max(config.max_connections, args.concurrency * 2)
+    if args.mode == 'socks':
+        config.socks_enabled = True
+        config.socks_port = 0
+    
+    manager = ProxyManager(config)
+    manager.load_proxies()
+    server, port = start_server(config, manager)
+    if args.mode == 'socks':
+        port = server.socks_port
+    receiver, sender = context.Pipe(duplex=False)
+    load = context.Process(target=run_load, args=(
+        sender, '127.0.0.1', port, f"127.0.0.1:{origin_port}", args.mode, args.concurrency,
+        args.warmup, args.duration
+    ))
+    try:
+        load.start()
+        # CPU is sampled over the measured window only
+        time.sleep(args.warmup)
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        raw = receiver.recv()
+        cpu_seconds = time.process_time() - cpu_started
+        wall_seconds = time.perf_counter() - wall_started
+        load.join()
+        rss = rss_bytes()
+    finally:
+        server.stop()
+        manager.stop_health_check()
+    
+    latencies = sorted(raw['latencies'])
+    completed = len(latencies)
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'engine': engine,
+        'strategy': strategy.value,
+        'requests': completed,
+        'errors': raw['errors'],
+        'statuses': {str(status): count for status, count in sorted(raw['statuses'].items())},
+        'rps': round(completed / raw['elapsed'], 1) if raw['elapsed'] > 0 else 0.0,
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+        'p999_ms': to_ms(percentile(latencies, 0.999)),
+        'cpu_percent': round(100 * cpu_seconds / wall_seconds, 1) if wall_seconds > 0 else None,
+        'rss_mb': None if rss is None else round(rss / (1024 * 1024), 1)
+    }
+
+
+def compare(report: Dict, baseline_path: str, tolerance: float) -> int:
+    """Print changes against an earlier results file; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get('parameters') != report['parameters']:
+        print("Warning: the baseline was run with different parameters; changes may not be meaningful")
+    previous = {(case['engine'], case['strategy']): case for case in baseline.get('results', [])}
+    regressions = 0
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision') or 'unknown revision'}):")
+    for case in report['results']:
+        before = previous.get((case['engine'], case['strategy']))
+        if before is None:
+            continue
+        notes = []
+        if before['rps'] and case['rps'] < before['rps'] * (1 - tolerance):
+            notes.append("throughput")
+        if before['p99_ms'] and case['p99_ms'] and case['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            notes.append("p99")
+        regressions += bool(notes)
+        rps_change = 100 * (case['rps'] / before['rps'] - 1) if before['rps'] else 0.0
+        p99_change = 100 * (case['p99_ms'] / before['p99_ms'] - 1) if before['p99_ms'] and case['p99_ms'] else 0.0
+        print(f"  {case['engine']:<9} {case['strategy']:<11} rps {rps_change:+6.1f}%  p99 {p99_change:+6.1f}%"
+              f"{'  REGRESSION: ' + ', '.join(notes) if notes else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rota end-to-end benchmark")
+    parser.add_argument("--engines", nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--strategies", nargs='+', choices=[s.value for s in RotationStrategy],
+                        default=[s.value for s in RotationStrategy])
+    parser.add_argument("--proxies", type=int, default=20, help="Fake upstream proxies to start")
+    parser.add_argument("--upstream-protocol", choices=('http', 'socks4', 'socks5'), default='http')
+    parser.add_argument("--mode", choices=('http', 'connect', 'socks'), default='http',
+                        help="Keep-alive plain HTTP requests, or one CONNECT or SOCKS5 tunnel per request")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent client connections")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of load before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per case")
+    parser.add_argument("--body-size", type=int, default=1024, help="Origin response body bytes")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/e2e-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative throughput drop or p99 rise counted as a regression")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    # Separate processes keep the stubs and the load generator off Rota's GIL
+    context = multiprocessing.get_context('spawn')
+    stub_control, stub_end = context.Pipe()
+    stubs = context.Process(target=run_stubs, args=(stub_end, args.upstream_protocol, args.proxies,
+                                                    args.body_size), daemon=True)
+    stubs.start()
+    origin_port, proxy_ports = stub_control.recv()
+    
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        proxy_file = os.path.join(directory, 'proxies.txt')
+        with open(proxy_file, 'w') as f:
+            f.writelines(f"{args.upstream_protocol}://127.0.0.1:{port}\n" for port in proxy_ports)
+        
+        print(f"{'engine':<9} {'strategy':<11} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} "
+              f"{'errors':>7} {'cpu %':>6} {'rss MB':>7}")
+        for engine in args.engines:
+            for strategy in args.strategies:
+                case = run_case(args, context, engine, RotationStrategy(strategy), origin_port, proxy_file)
+                results.append(case)
+                print(f"{engine:<9} {strategy:<11} {case['rps']:>9.1f} {case['p50_ms'] or 0:>8.2f} "
+                      f"{case['p99_ms'] or 0:>8.2f} {case['p999_ms'] or 0:>8.2f} {case['errors']:>7} "
+                      f"{case['cpu_percent'] or 0:>6.1f} {case['rss_mb'] or 0:>7.1f}")
+    
+    stub_control.send('stop')
+    stubs.join(timeout=5)
+    
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {name: value for name, value in vars(args).items()
+                       if name not in ('output', 'baseline', 'tolerance')},
+        'results': results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+    
+    if args.baseline and compare(report, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
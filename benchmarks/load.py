@@ -0,0 +1,148 @@
+"""
+Closed-loop load generator for the benchmarks
+A fixed number of keep-alive clients each send a request, wait for the full
+response and send the next one, through Rota as their HTTP proxy.
+"""
+
+import asyncio
+import struct
+import time
+from typing import Dict, List, Tuple
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bool]:
+    """Read one response with a Content-Length body, returning (status code, keep-alive)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    keep_alive = True
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value.strip() or 0)
+        elif name == b'connection':
+            keep_alive = value.strip().lower() != b'close'
+    if length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+class _Client:
+    def __init__(self, host: str, port: int, origin: str, mode: str, deadline: float, measure_from: float):
+        self.host = host
+        self.port = port
+        self.origin = origin
+        self.mode = mode
+        self.deadline = deadline
+        self.measure_from = measure_from
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[int, int] = {}
+    
+    async def run(self):
+        while time.perf_counter() < self.deadline:
+            try:
+                if self.mode == 'connect':
+                    await self._run_tunnel()
+                elif self.mode == 'socks':
+                    await self._run_socks()
+                else:
+                    await self._run_keep_alive()
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                self._record_error()
+                await asyncio.sleep(0.01)
+    
+    async def _run_keep_alive(self):
+        """Plain HTTP requests on one keep-alive connection to Rota"""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        request = (f"GET http://{self.origin}/ HTTP/1.1\r\nHost: {self.origin}\r\n\r\n").encode()
+        try:
+            while time.perf_counter() < self.deadline:
+                started = time.perf_counter()
+                writer.write(request)
+                status, keep_alive = await _read_response(reader)
+                self._record(started, status)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+    
+    async def _run_tunnel(self):
+        """One CONNECT tunnel per request, carrying a single GET to the origin"""
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f"CONNECT {self.origin} HTTP/1.1\r\nHost: {self.origin}\r\n\r\n".encode())
+            head = await reader.readuntil(b'\r\n\r\n')
+            status = int(head.split(b' ', 2)[1])
+            if status == 200:
+                writer.write(f"GET / HTTP/1.1\r\nHost: {self.origin}\r\n\r\n".encode())
+                status = (await _read_response(reader))[0]
+            self._record(started, status)
+        finally:
+            writer.close()
+    
+    async def _run_socks(self):
+        """One SOCKS5 CONNECT per request, carrying a single GET to the origin"""
+        started = time.perf_counter()
+        host, _, port = self.origin.rpartition(':')
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            # Greeting, then a CONNECT by hostname so Rota resolves nothing itself
+            name = host.encode()
+            writer.write(b'\x05\x01\x00' + b'\x05\x01\x00\x03' + bytes([len(name)]) + name +
+                         struct.pack('>H', int(port)))
+            await reader.readexactly(2)
+            reply = await reader.readexactly(10)
+            if reply[1] != 0:
+                # Mirror an HTTP proxy's 502 so failures are counted the same way
+                self._record(started, 502)
+                return
+            writer.write(f"GET / HTTP/1.1\r\nHost: {self.origin}\r\n\r\n".encode())
+            status = (await _read_response(reader))[0]
+            self._record(started, status)
+        finally:
+            writer.close()
+    
+    def _record(self, started: float, status: int):
+        if started < self.measure_from:
+            return
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == 200:
+            self.latencies.append(time.perf_counter() - started)
+        else:
+            self.errors += 1
+    
+    def _record_error(self):
+        if time.perf_counter() >= self.measure_from:
+            self.errors += 1
+
+
+async def _generate(host: str, port: int, origin: str, mode: str, concurrency: int,
+                    warmup: float, duration: float) -> Dict:
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    clients = [_Client(host, port, origin, mode, deadline, measure_from) for _ in range(concurrency)]
+    await asyncio.gather(*(client.run() for client in clients))
+    statuses: Dict[int, int] = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return {
+        'latencies': [latency for client in clients for latency in client.latencies],
+        'errors': sum(client.errors for client in clients),
+        'statuses': statuses,
+        'elapsed': time.perf_counter() - measure_from
+    }
+
+
+def run_load(connection, host: str, port: int, origin: str, mode: str, concurrency: int,
+             warmup: float, duration: float):
+    """Process entry point: drive load at Rota and send back the raw results"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    connection.send(loop.run_until_complete(
+        _generate(host, port, origin, mode, concurrency, warmup, duration)
+    ))
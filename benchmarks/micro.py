@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of proxy selection and pool maintenance for Rota
+Builds synthetic pools of 10k to 1M proxies and times loading the proxy file,
+applying health check results, ProxyManager.get_proxy/acquire_proxy and the
+selection functions in rota.rotation_strategies, single-threaded and with
+several threads at once. Each operation reports ops/sec and the memory it
+allocates, so work that grows with the pool shows up as falling throughput
+or rising allocation across sizes.
+
+    python -m benchmarks.micro --sizes 10000 100000 1000000
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rota import rotation_strategies
+from rota.config import Config, RotationStrategy
+from rota.proxy_manager import ProxyManager
+
+from benchmarks.e2e import RESULTS_DIR, git_revision
+
+
+# Share of the pool that passes health checks, as with typical public lists
+HEALTHY_SHARE = 0.1
+
+# Results applied per _apply_health_results() call, as _check_proxies batches them
+HEALTH_BATCH = 1000
+
+SELECTION_FUNCTIONS = {
+    'get_random_proxy': rotation_strategies.get_random_proxy,
+    'get_round_robin_proxy': rotation_strategies.get_round_robin_proxy,
+    'get_least_connections_proxy': rotation_strategies.get_least_connections_proxy,
+    'get_time_based_proxy': rotation_strategies.get_time_based_proxy,
+    'get_latency_ewma_proxy': rotation_strategies.get_latency_ewma_proxy,
+}
+
+
+def write_proxy_file(path: str, size: int, seed: int):
+    """Synthetic proxy list: mostly plain IPv4 HTTP, some SOCKS, some with credentials"""
+    rng = random.Random(seed)
+    protocols = ['http'] * 7 + ['socks5'] * 2 + ['socks4']
+    with open(path, 'w') as f:
+        for index in range(size):
+            host = f"{10 + (index >> 24)}.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+            protocol = rng.choice(protocols)
+            if rng.random() < 0.05:
+                f.write(f"{protocol}://user{index}:secret@{host}:{rng.randint(1024, 65535)}\n")
+            else:
+                f.write(f"{protocol}://{host}:{rng.randint(1024, 65535)}\n")
+
+
+def measure(operation: Callable[[], object], budget: float, threads: int = 1) -> float:
+    """Calls per second of an operation, run for about budget seconds on each of several threads"""
+    counts = [0] * threads
+    start_barrier = threading.Barrier(threads + 1)
+    stop_at = [0.0]
+    
+    def worker(slot: int):
+        start_barrier.wait()
+        calls = 0
+        deadline = stop_at[0]
+        # Batches of calls keep the clock out of the measurement
+        while time.perf_counter() < deadline:
+            for _ in range(16):
+                operation()
+            calls += 16
+        counts[slot] = calls
+    
+    workers = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in workers:
+        thread.start()
+    started = time.perf_counter()
+    stop_at[0] = started + budget
+    start_barrier.wait()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def allocations(operation: Callable[[], object], calls: int) -> Dict[str, float]:
+    """Memory an operation allocates: peak extra bytes while running, and bytes retained per call"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(calls):
+            operation()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_kb': round((peak - baseline) / 1024, 1),
+        'retained_bytes_per_op': round((current - baseline) / calls, 1)
+    }
+
+
+def build_manager(size: int, directory: str, seed: int) -> Dict:
+    """Load a synthetic pool and mark part of it healthy, timing both"""
+    path = os.path.join(directory, f"proxies-{size}.txt")
+    write_proxy_file(path, size, seed)
+    config = Config()
+    config.proxy_files = [path]
+    config.health_check_enabled = False
+    config.health_cache_enabled = False
+    manager = ProxyManager(config)
+    
+    gc.collect()
+    started = time.perf_counter()
+    loaded = manager._load_proxies_from_file(path)
+    load_seconds = time.perf_counter() - started
+    
+    # Results are built a batch at a time so only applying them is timed
+    rng = random.Random(seed)
+    health_seconds = 0.0
+    for offset in range(0, loaded, HEALTH_BATCH):
+        results = [
+            (manager.proxies[row], rng.random() < HEALTHY_SHARE, rng.uniform(0.05, 2.0))
+            for row in range(offset, min(offset + HEALTH_BATCH, loaded))
+        ]
+        started = time.perf_counter()
+        manager._apply_health_results(results)
+        health_seconds += time.perf_counter() - started
+    return {
+        'manager': manager,
+        'path': path,
+        'loaded': loaded,
+        'load': {'ops_per_sec': round(loaded / load_seconds), 'seconds': round(load_seconds, 3)},
+        'health': {'ops_per_sec': round(loaded / health_seconds), 'seconds': round(health_seconds, 3)},
+    }
+
+
+def run_size(size: int, args, directory: str) -> List[Dict]:
+    """All operations against one pool size"""
+    built = build_manager(size, directory, args.seed)
+    manager: ProxyManager = built['manager']
+    healthy = manager._healthy_snapshot
+    rows = []
+    
+    def add(name: str, single: float, contended, memory: Dict):
+        row = {'size': size, 'operation': name, 'ops_per_sec': round(single),
+               'contended_ops_per_sec': None if contended is None else round(contended)}
+        row.update(memory)
+        rows.append(row)
+        contended_text = '-' if contended is None else f"{contended:,.0f}"
+        print(f"{size:>9,} {name:<42} {single:>14,.0f} {contended_text:>14} "
+              f"{memory.get('peak_kb', 0):>10,.1f} {memory.get('retained_bytes_per_op', 0):>9,.1f}")
+    
+    # One-off bulk operations: the rate is proxies (or results) per second
+    add('load_proxies_from_file', built['load']['ops_per_sec'], None, {})
+    add('apply_health_results', built['health']['ops_per_sec'], None, {})
+    
+    # Health results for a slice of the pool, re-applied repeatedly
+    sample = [manager.proxies[row] for row in random.Random(args.seed).sample(range(len(manager.proxies)),
+                                                                               min(HEALTH_BATCH, size))]
+    batch = [(proxy, proxy.is_healthy, proxy.response_time or 0.5) for proxy in sample]
+    apply_batch = lambda: manager._apply_health_results(batch)
+    add(f'apply_health_results[{len(batch)}]', measure(apply_batch, args.budget) * len(batch),
+        measure(apply_batch, args.budget, args.threads) * len(batch), allocations(apply_batch, 5))
+    
+    for strategy in RotationStrategy:
+        get = lambda strategy=strategy: manager.get_proxy(strategy)
+        add(f'get_proxy[{strategy.value}]', measure(get, args.budget),
+            measure(get, args.budget, args.threads), allocations(get, args.alloc_calls))
+        
+        def acquire_release(strategy=strategy):
+            proxy = manager.acquire_proxy(strategy)
+            if proxy is not None:
+                manager.release_proxy(proxy)
+        add(f'acquire_release[{strategy.value}]', measure(acquire_release, args.budget),
+            measure(acquire_release, args.budget, args.threads), allocations(acquire_release, args.alloc_calls))
+    
+    for name, function in SELECTION_FUNCTIONS.items():
+        select = lambda function=function: function(healthy)
+        add(name, measure(select, args.budget), measure(select, args.budget, args.threads),
+            allocations(select, args.alloc_calls))
+    
+    manager.stop_health_check()
+    os.unlink(built['path'])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rota selection and pool micro-benchmarks")
+    parser.add_argument("--sizes", nargs='+', type=int, default=[10000, 100000, 1000000],
+                        help="Pool sizes to build")
+    parser.add_argument("--threads", type=int, default=8, help="Threads for the contended runs")
+    parser.add_argument("--budget", type=float, default=0.5, help="Seconds spent timing each operation")
+    parser.add_argument("--alloc-calls", type=int, default=200, help="Calls traced for allocations")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/micro-<time>.json)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    # Health results are logged per proxy at INFO; keep that out of the timings
+    logging.getLogger('rota').setLevel(logging.WARNING)
+    
+    print(f"{'size':>9} {'operation':<42} {'ops/s':>14} {f'{args.threads} threads':>14} "
+          f"{'peak KB':>10} {'B/op kept':>9}")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results.extend(run_size(size, args, directory))
+    
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {name: value for name, value in vars(args).items() if name != 'output'},
+        'results': results
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"micro-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Local stand-ins for the outside world used by the benchmarks
+An origin web server and fake upstream HTTP, SOCKS4 and SOCKS5 proxies, all
+on one asyncio event loop so they can run in a process of their own.
+"""
+
+import asyncio
+import socket
+import struct
+from typing import List, Optional, Tuple
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one request head, or None at a clean end of stream"""
+    try:
+        return await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+
+
+def _content_length(head: bytes) -> int:
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            return int(value.strip() or 0)
+    return 0
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _splice(client: Tuple[asyncio.StreamReader, asyncio.StreamWriter],
+                  upstream: Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+    await asyncio.gather(_pipe(client[0], upstream[1]), _pipe(upstream[0], client[1]))
+
+
+class Origin:
+    """Keep-alive HTTP/1.1 server answering every request with a fixed body"""
+    
+    def __init__(self, body_size: int):
+        body = b'x' * body_size
+        self.response = (
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+        )
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await _read_head(reader)
+                if head is None:
+                    break
+                length = _content_length(head)
+                if length:
+                    await reader.readexactly(length)
+                writer.write(self.response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _http_proxy(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Forward proxy: absolute-URI requests and CONNECT tunnels"""
+    # One origin connection per client connection, reused while the target stays the same
+    upstream = None
+    upstream_target = None
+    try:
+        while True:
+            head = await _read_head(reader)
+            if head is None:
+                break
+            request_line, _, rest = head.partition(b'\r\n')
+            method, target, version = request_line.split(b' ', 2)
+            if method == b'CONNECT':
+                host, _, port = target.rpartition(b':')
+                tunnel = await asyncio.open_connection(host.decode(), int(port))
+                writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                await writer.drain()
+                await _splice((reader, writer), tunnel)
+                return
+            
+            # http://host:port/path -> /path against host:port
+            authority, _, path = target.partition(b'://')[2].partition(b'/')
+            host, _, port = authority.rpartition(b':')
+            if upstream is None or upstream_target != authority:
+                if upstream is not None:
+                    upstream[1].close()
+                upstream = await asyncio.open_connection(host.decode(), int(port or 80))
+                upstream_target = authority
+            body = b''
+            length = _content_length(head)
+            if length:
+                body = await reader.readexactly(length)
+            upstream[1].write(b' '.join((method, b'/' + path, version)) + b'\r\n' + rest + body)
+            response_head = await upstream[0].readuntil(b'\r\n\r\n')
+            response_body = await upstream[0].readexactly(_content_length(response_head))
+            writer.write(response_head + response_body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+        pass
+    finally:
+        if upstream is not None:
+            upstream[1].close()
+        writer.close()
+
+
+async def _socks_proxy(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """SOCKS4, SOCKS4a and SOCKS5 (no authentication) CONNECT proxy"""
+    try:
+        version = (await reader.readexactly(1))[0]
+        if version == 4:
+            _, port = struct.unpack('!BH', await reader.readexactly(3))
+            address = await reader.readexactly(4)
+            await reader.readuntil(b'\x00')  # user id
+            if address[:3] == b'\x00\x00\x00' and address[3]:
+                host = (await reader.readuntil(b'\x00'))[:-1].decode()
+            else:
+                host = socket.inet_ntoa(address)
+            upstream = await asyncio.open_connection(host, port)
+            writer.write(b'\x00\x5a' + b'\x00' * 6)
+        else:
+            methods = await reader.readexactly((await reader.readexactly(1))[0])
+            if 0 not in methods:
+                writer.write(b'\x05\xff')
+                return
+            writer.write(b'\x05\x00')
+            _, _, _, address_type = await reader.readexactly(4)
+            if address_type == 1:
+                host = socket.inet_ntoa(await reader.readexactly(4))
+            elif address_type == 3:
+                host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+            else:
+                host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+            port = struct.unpack('!H', await reader.readexactly(2))[0]
+            upstream = await asyncio.open_connection(host, port)
+            writer.write(b'\x05\x00\x00\x01' + b'\x00' * 6)
+        await writer.drain()
+        await _splice((reader, writer), upstream)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError, ValueError):
+        writer.close()
+
+
+async def _serve(protocol: str, proxies: int, body_size: int, host: str) -> Tuple[int, List[int]]:
+    origin = await asyncio.start_server(Origin(body_size).handle, host, 0, backlog=4096)
+    handler = _http_proxy if protocol in ('http', 'https') else _socks_proxy
+    upstreams = [await asyncio.start_server(handler, host, 0, backlog=4096) for _ in range(proxies)]
+    return (
+        origin.sockets[0].getsockname()[1],
+        [server.sockets[0].getsockname()[1] for server in upstreams]
+    )
+
+
+def run_stubs(connection, protocol: str, proxies: int, body_size: int, host: str = '127.0.0.1'):
+    """Process entry point: start the stubs, send back (origin port, proxy ports), serve until told to stop"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    connection.send(loop.run_until_complete(_serve(protocol, proxies, body_size, host)))
+    
+    async def wait_for_stop():
+        await loop.run_in_executor(None, connection.recv)
+    
+    loop.run_until_complete(wait_for_stop())
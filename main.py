@@ -28,6 +28,8 @@ class Rota:
         self.config = Config.from_file(config_path)
         self.proxy_manager = ProxyManager(self.config)
         self.server: Optional[HTTPServer] = None
+        self.file_monitor = None
+        self.metrics_server = None
         self._setup_logging()
     
     def _setup_logging(self):
@@ -53,14 +55,35 @@ class Rota:
             # Start proxy health checking
             self.proxy_manager.start_health_check()
             
-            # File monitoring is handled by the health check loop
+            # Apply edits of the proxy files as they happen
+            if self.config.file_monitor_enabled:
+                from rota.file_monitor import ProxyFileMonitor
+                self.file_monitor = ProxyFileMonitor(self.config, self.proxy_manager)
+                self.file_monitor.start()
             
             # Create and start server
-            from rota.server import ProxyServer
-            self.server = ProxyServer(self.config, self.proxy_manager)
+            if self.config.server_engine == 'asyncio':
+                from rota.async_server import AsyncProxyServer
+                self.server = AsyncProxyServer(self.config, self.proxy_manager)
+            else:
+                from rota.server import ProxyServer
+                self.server = ProxyServer(self.config, self.proxy_manager)
             self.server.start()
             
+            # Admin listener for Prometheus scrapes
+            if self.config.metrics_enabled:
+                from rota.metrics import MetricsServer
+                self.metrics_server = MetricsServer(
+                    self.proxy_manager.metrics,
+                    self.config.metrics_host,
+                    self.config.metrics_port,
+                    self.config.metrics_path,
+                    gauges=self.server.get_stats
+                )
+                self.metrics_server.start()
+            
             logger.info(f"Rota server started on {self.config.host}:{self.config.port}")
+            logger.info(f"Server engine: {self.config.server_engine}")
             logger.info(f"Rotation strategy: {self.config.rotation_strategy}")
             stats = self.proxy_manager.get_stats()
             logger.info(f"Active proxies: {stats['healthy_proxies']}/{stats['total_proxies']}")
@@ -82,10 +105,16 @@ class Rota:
         logger.info("Shutting down Rota...")
         
         if self.server:
-            self.server.shutdown()
+            self.server.stop()
+        
+        if self.metrics_server:
+            self.metrics_server.stop()
+        
+        if self.file_monitor:
+            self.file_monitor.stop()
         
         if self.proxy_manager:
-            self.proxy_manager.stop()
+            self.proxy_manager.stop_health_check()
         
         logger.info("Rota stopped gracefully")
 
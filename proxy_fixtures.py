@@ -0,0 +1,51 @@
+"""
+Shared fixtures for the Rota unit tests
+"""
+
+import os
+import tempfile
+from typing import List
+
+from rota.config import Config
+from rota.proxy import Proxy
+from rota.proxy_manager import ProxyManager
+
+
+def make_proxies(count: int, protocol: str = "http", port: int = 8080) -> List[Proxy]:
+    """Distinct proxies 10.0.x.y:port"""
+    return [Proxy(address=f"10.0.{index >> 8 & 255}.{index & 255}:{port}", protocol=protocol)
+            for index in range(count)]
+
+
+def make_manager(proxies: List[Proxy], **settings) -> ProxyManager:
+    """A ProxyManager holding these proxies, all healthy, with no background checks"""
+    config = Config()
+    config.health_check_enabled = False
+    config.health_cache_enabled = False
+    for name, value in settings.items():
+        setattr(config, name, value)
+    
+    handle, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(handle, "w") as f:
+        f.write("".join(f"{proxy.to_url()}\n" for proxy in proxies))
+    config.proxy_files = [path]
+    manager = ProxyManager(config)
+    try:
+        manager._load_proxies_from_file(path)
+    finally:
+        os.unlink(path)
+    manager._apply_health_results([(proxy, True, 0.1) for proxy in manager.proxies])
+    return manager
+
+
+class FakeClock:
+    """Clock that only moves when told to, for components that take a clock"""
+    
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += seconds
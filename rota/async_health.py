@@ -0,0 +1,157 @@
+"""
+asyncio health-check engine for Rota
+Probes speak the HTTP proxy, SOCKS4 and SOCKS5 handshakes directly over
+non-blocking sockets so thousands of checks can share one event loop.
+"""
+
+import asyncio
+import logging
+import ssl
+import urllib.parse
+from typing import Callable, Iterable, Optional, Tuple
+
+from rota.config import Config
+from rota.proxy import Proxy
+from rota.socks import SocksError, is_socks, socks_handshake_async, split_address
+from rota.tunnel import TunnelError, http_connect_async
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# File descriptors kept free for the rest of the process
+_RESERVED_FDS = 64
+
+HealthCallback = Callable[[Proxy, bool, Optional[float]], None]
+
+
+class AsyncHealthChecker:
+    """Runs health probes concurrently on a single event loop"""
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        
+        url = urllib.parse.urlsplit(config.health_check_url)
+        self.scheme = url.scheme or 'http'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.scheme == 'https' else 80)
+        self.path = url.path or '/'
+        if url.query:
+            self.path += '?' + url.query
+        self.host_header = url.netloc.rpartition('@')[2]
+        self.timeout = config.health_check_timeout
+        self.concurrency = self._effective_concurrency(config.health_check_max_in_flight)
+        
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        if self.scheme == 'https':
+            # Mirrors verify=False in the threaded engine
+            self._ssl_context = ssl.create_default_context()
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+            if not hasattr(asyncio.StreamWriter, 'start_tls'):
+                self.logger.warning("HTTPS health check URLs need Python 3.11+ with the asyncio engine")
+    
+    def _effective_concurrency(self, requested: int) -> int:
+        """Clamp concurrency to what the open file limit allows"""
+        if resource is None:
+            return max(1, requested)
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and requested + _RESERVED_FDS > soft:
+            wanted = requested + _RESERVED_FDS
+            if hard == resource.RLIM_INFINITY or hard >= wanted:
+                try:
+                    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+                    return requested
+                except (ValueError, OSError):
+                    pass
+            limited = max(1, soft - _RESERVED_FDS)
+            self.logger.warning(f"Open file limit {soft} caps async health checks at {limited} in flight")
+            return limited
+        return max(1, requested)
+    
+    def check(self, proxies: Iterable[Proxy], on_result: HealthCallback):
+        """Probe all proxies, calling on_result(proxy, healthy, response_time) as each completes"""
+        asyncio.run(self._check_all(iter(proxies), on_result))
+    
+    async def _check_all(self, proxies, on_result: HealthCallback):
+        # A fixed set of workers pulls from the shared iterator so memory
+        # stays bounded by the concurrency, not by the pool size
+        async def worker():
+            for proxy in proxies:
+                healthy, response_time = await self.probe(proxy)
+                on_result(proxy, healthy, response_time)
+        
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+    
+    async def probe(self, proxy: Proxy) -> Tuple[bool, Optional[float]]:
+        """Probe a single proxy, returning (healthy, response_time)"""
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        writer = None
+        try:
+            status, writer = await asyncio.wait_for(self._request(proxy), self.timeout)
+            if status == 200:
+                return True, loop.time() - start_time
+            self.logger.debug(f"Proxy {proxy} returned status code {status}")
+        except asyncio.TimeoutError:
+            self.logger.debug(f"Proxy {proxy} timed out")
+        except (SocksError, TunnelError) as e:
+            self.logger.debug(f"Proxy {proxy} tunnel error: {e}")
+        except (OSError, EOFError, ValueError) as e:
+            self.logger.debug(f"Proxy {proxy} connection error: {e}")
+        except Exception as e:
+            self.logger.debug(f"Proxy {proxy} probe error: {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+        return False, None
+    
+    async def _request(self, proxy: Proxy):
+        proxy_host, proxy_port = split_address(proxy.address)
+        reader, writer = await asyncio.open_connection(proxy_host, proxy_port)
+        try:
+            tunnel = self.scheme == 'https' or is_socks(proxy)
+            if is_socks(proxy):
+                await socks_handshake_async(reader, writer, proxy, self.host, self.port)
+            elif tunnel:
+                await http_connect_async(reader, writer, proxy, self.host, self.port)
+            
+            if self._ssl_context is not None:
+                await writer.start_tls(self._ssl_context, server_hostname=self.host)
+            
+            if tunnel:
+                target = self.path
+                extra = ''
+            else:
+                # Plain HTTP through an HTTP proxy uses the absolute-form request target
+                target = f"http://{self.host_header}{self.path}"
+                extra = self._proxy_auth_header(proxy)
+            
+            writer.write((
+                f"GET {target} HTTP/1.1\r\n"
+                f"Host: {self.host_header}\r\n"
+                f"User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36\r\n"
+                f"Accept: */*\r\n"
+                f"{extra}"
+                f"Connection: close\r\n\r\n"
+            ).encode())
+            await writer.drain()
+            return self._parse_status(await reader.readline()), writer
+        except BaseException:
+            writer.close()
+            raise
+    
+    @staticmethod
+    def _proxy_auth_header(proxy: Proxy) -> str:
+        authorization = proxy.proxy_authorization()
+        return f"Proxy-Authorization: {authorization}\r\n" if authorization else ''
+    
+    @staticmethod
+    def _parse_status(line: bytes) -> int:
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+            raise ValueError(f"Malformed status line {line[:64]!r}")
+        return int(parts[1])
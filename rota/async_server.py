@@ -0,0 +1,623 @@
+"""
+asyncio server engine for Rota
+Serves the same proxy protocol as ProxyServer from a single event loop, so
+each idle or slow client costs a coroutine instead of a thread.
+"""
+
+import asyncio
+import logging
+import ssl
+import threading
+import time
+import urllib.parse
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+from rota.config import Config
+from rota.proxy import Proxy
+from rota.proxy_manager import ProxyManager
+from rota.rate_limiter import TokenBucketRateLimiter
+from rota.server import HOP_BY_HOP_HEADERS, STREAM_CHUNK_SIZE, resolve_session_key, resolve_target_url
+from rota.socks import SocksError, is_socks, split_address
+from rota.socks_server import AsyncSocks5Handler
+from rota.tunnel import TunnelError, open_tunnel_async, relay_async
+
+
+# Upper bound on a request or response header block
+MAX_HEADER_SIZE = 64 * 1024
+
+Streams = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+HeaderList = List[Tuple[str, str]]
+
+
+class BadRequest(Exception):
+    """Raised when a client sends a request we cannot parse"""
+    
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncConnectionPool:
+    """Idle keep-alive upstream streams, keyed like UpstreamConnectionPool"""
+    
+    def __init__(self, max_idle_per_proxy: int = 8, idle_timeout: float = 60):
+        self.max_idle_per_proxy = max_idle_per_proxy
+        self.idle_timeout = idle_timeout
+        # Only touched from the event loop thread, so no lock is needed
+        self._idle: Dict[tuple, List[Tuple[Streams, float]]] = {}
+        self._last_sweep = time.monotonic()
+        
+        # Counters for get_stats()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+    
+    def acquire(self, key: tuple) -> Optional[Streams]:
+        """Pop the most recently used live stream pair for key, if any"""
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            streams, last_used = idle.pop()
+            # An idle keep-alive stream should have seen neither EOF nor a close
+            if now - last_used < self.idle_timeout and not streams[0].at_eof() and not streams[1].is_closing():
+                self.reused += 1
+                return streams
+            self.discard(streams)
+        return None
+    
+    def release(self, key: tuple, streams: Streams):
+        """Return a stream pair whose last response was fully read"""
+        now = time.monotonic()
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_proxy:
+            idle.append((streams, now))
+        else:
+            self.discard(streams)
+        if now - self._last_sweep >= self.idle_timeout / 2:
+            self._last_sweep = now
+            self.evict_idle()
+    
+    def discard(self, streams: Streams):
+        """Close a stream pair that must not be reused"""
+        self.discarded += 1
+        streams[1].close()
+    
+    def evict_idle(self) -> int:
+        """Close streams idle longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = 0
+        for key in list(self._idle):
+            idle = self._idle[key]
+            # Lists are ordered oldest first
+            while idle and idle[0][1] < cutoff:
+                self.discard(idle.pop(0)[0])
+                expired += 1
+            if not idle:
+                del self._idle[key]
+        return expired
+    
+    def close_all(self):
+        """Close every idle stream"""
+        for idle in self._idle.values():
+            for streams, _ in idle:
+                self.discard(streams)
+        self._idle.clear()
+    
+    def get_stats(self) -> Dict:
+        """Get pool statistics"""
+        return {
+            'idle_connections': sum(len(idle) for idle in self._idle.values()),
+            'connections_created': self.created,
+            'connections_reused': self.reused,
+            'connections_discarded': self.discarded
+        }
+
+
+def _parse_head(data: bytes) -> Tuple[str, HeaderList]:
+    """Split a header block into its first line and (name, value) pairs"""
+    lines = data.decode('latin-1').split('\r\n')
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise ValueError(f"Malformed header line {line[:64]!r}")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def _header_map(headers: HeaderList) -> Dict[str, str]:
+    """Lower-cased header lookup; the first occurrence wins"""
+    mapping = {}
+    for name, value in headers:
+        mapping.setdefault(name.lower(), value)
+    return mapping
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one header block, returning None on a clean EOF before any bytes"""
+    try:
+        return await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+
+
+class AsyncProxyServer:
+    """HTTP proxy server with rotation capabilities, running on an asyncio event loop"""
+    
+    def __init__(self, config: Config, proxy_manager: ProxyManager):
+        self.config = config
+        self.proxy_manager = proxy_manager
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.socks_server: Optional[asyncio.AbstractServer] = None
+        self.socks_port: Optional[int] = None
+        self.server_thread: Optional[threading.Thread] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.logger = logging.getLogger(__name__)
+        
+        self.start_time = time.time()
+        
+        self.rate_limiter: Optional[TokenBucketRateLimiter] = None
+        if config.rate_limit_enabled:
+            self.rate_limiter = TokenBucketRateLimiter(config.rate_limit_requests, config.rate_limit_burst)
+        
+        self.connection_pool = AsyncConnectionPool(
+            max_idle_per_proxy=config.pool_max_idle_per_proxy,
+            idle_timeout=config.pool_idle_timeout
+        )
+        self._ssl_context = ssl.create_default_context()
+        self._connection_slots: Optional[asyncio.Semaphore] = None
+        self._started = threading.Event()
+        self._start_error: Optional[BaseException] = None
+    
+    def start(self):
+        """Start the proxy server on a background event loop thread"""
+        self.server_thread = threading.Thread(target=self._run, daemon=True)
+        self.server_thread.start()
+        self._started.wait()
+        if self._start_error is not None:
+            raise self._start_error
+        
+        self.logger.info(f"Async proxy server started on {self.config.host}:{self.config.port}")
+        if self.socks_server is not None:
+            self.logger.info(f"SOCKS5 listener started on {self.config.socks_host}:{self.socks_port}")
+    
+    def stop(self):
+        """Stop the proxy server"""
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.server_thread:
+            self.server_thread.join(timeout=5)
+    
+    def get_stats(self) -> dict:
+        """Get server statistics"""
+        stats = self.proxy_manager.get_stats()
+        stats.update({
+            'request_count': int(self.proxy_manager.metrics.count('rota_requests_total')),
+            'uptime': time.time() - self.start_time
+        })
+        stats.update(self.connection_pool.get_stats())
+        if self.rate_limiter is not None:
+            stats.update(self.rate_limiter.get_stats())
+        return stats
+    
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._connection_slots = asyncio.Semaphore(self.config.max_connections)
+            self.server = self.loop.run_until_complete(asyncio.start_server(
+                self._handle_client, self.config.host, self.config.port,
+                limit=MAX_HEADER_SIZE, backlog=min(self.config.max_connections, 4096)
+            ))
+            if self.config.socks_enabled:
+                handler = AsyncSocks5Handler(self.config, self.proxy_manager, self.rate_limiter,
+                                             self._connection_slots)
+                self.socks_server = self.loop.run_until_complete(asyncio.start_server(
+                    handler, self.config.socks_host, self.config.socks_port,
+                    backlog=min(self.config.max_connections, 4096)
+                ))
+                self.socks_port = self.socks_server.sockets[0].getsockname()[1]
+        except BaseException as e:
+            if self.server is not None:
+                # The SOCKS port could not be bound; release the HTTP one too
+                self.server.close()
+            self._start_error = e
+            self._started.set()
+            self.loop.close()
+            return
+        
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            if self.socks_server is not None:
+                self.socks_server.close()
+            self.connection_pool.close_all()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve keep-alive requests from one client connection"""
+        # Clients beyond max_connections wait here instead of being served
+        async with self._connection_slots:
+            try:
+                while True:
+                    try:
+                        head = await asyncio.wait_for(_read_head(reader), self.config.connection_timeout)
+                    except BadRequest as e:
+                        await self._send_error(writer, e.status, str(e), 'HTTP/1.0')
+                        break
+                    if head is None:
+                        break
+                    if not await self._handle_request(reader, writer, head):
+                        break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                pass
+            except asyncio.CancelledError:
+                # Server shutdown; end quietly rather than failing the task
+                pass
+            except Exception as e:
+                self.logger.debug(f"Client connection error: {e}")
+            finally:
+                writer.close()
+    
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              head: bytes) -> bool:
+        """Handle one request, returning whether the client connection stays open"""
+        try:
+            request_line, headers = _parse_head(head)
+            method, path, version = request_line.split(' ', 2)
+            if not version.startswith('HTTP/1.'):
+                raise ValueError(f"Unsupported version {version}")
+        except ValueError:
+            await self._send_error(writer, HTTPStatus.BAD_REQUEST, "Bad request syntax", 'HTTP/1.0')
+            return False
+        
+        fields = _header_map(headers)
+        connection = fields.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+        
+        self.proxy_manager.metrics.inc('rota_requests_total', 'connect' if method == 'CONNECT' else 'http')
+        # Check rate limiting
+        wait = self._check_rate_limit(writer, fields)
+        if wait:
+            self.proxy_manager.metrics.inc('rota_rate_limited_total')
+            await self._send_error(writer, HTTPStatus.TOO_MANY_REQUESTS, "Rate limit exceeded", version,
+                                   request_line, [('Retry-After', TokenBucketRateLimiter.retry_after(wait))])
+            return False
+        
+        header = self.config.session_header
+        session = resolve_session_key(self.config, fields.get(header.lower()) if header else None,
+                                      fields.get('proxy-authorization'))
+        
+        if method == 'CONNECT':
+            await self._handle_connect(reader, writer, path, version, request_line, session)
+            return False
+        
+        # Get target URL
+        target_url = resolve_target_url(path, fields.get('host'), fields.get('x-forwarded-proto'))
+        if not target_url:
+            await self._send_error(writer, HTTPStatus.BAD_REQUEST, "No target URL specified", version,
+                                   request_line)
+            return False
+        
+        if 'transfer-encoding' in fields:
+            # Chunked uploads would need re-framing; ask for a sized body instead
+            await self._send_error(writer, HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported",
+                                   version, request_line)
+            return False
+        content_length = int(fields.get('content-length', 0) or 0)
+        body = await reader.readexactly(content_length) if content_length > 0 else b''
+        
+        # Select proxy and take a connection slot on it
+        proxy = self.proxy_manager.acquire_proxy(session=session)
+        if not proxy:
+            await self._send_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, "No healthy proxies available",
+                                   version, request_line)
+            return False
+        
+        # Forward request
+        state = {'started': False, 'upstream_started': None, 'upstream_latency': None, 'error': None}
+        try:
+            return await self._forward_request(writer, method, target_url, version, headers, body,
+                                               proxy, keep_alive, state, request_line)
+        except Exception as e:
+            state['error'] = e
+            if state['started']:
+                # Too late for an error page; cut the connection so the client
+                # sees a truncated response instead of a corrupt one
+                return False
+            await self._send_error(writer, HTTPStatus.BAD_GATEWAY, f"Proxy error: {str(e)}", version,
+                                   request_line)
+            return False
+        finally:
+            # A response header block counts as success; failing before one
+            # arrived counts against the proxy only if it was actually contacted
+            if state['upstream_latency'] is not None:
+                self.proxy_manager.report_outcome(proxy, True, state['upstream_latency'])
+            elif state['upstream_started'] is not None:
+                self.proxy_manager.report_outcome(proxy, False, error=state['error'])
+            self.proxy_manager.release_proxy(proxy)
+    
+    async def _handle_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              path: str, version: str, request_line: str, session: Optional[str] = None):
+        """Handle CONNECT requests by tunnelling through an upstream proxy"""
+        try:
+            host, port = split_address(path)
+        except ValueError:
+            await self._send_error(writer, HTTPStatus.BAD_REQUEST, "CONNECT target must be host:port", version,
+                                   request_line)
+            return
+        
+        proxy = self.proxy_manager.acquire_proxy(session=session)
+        if not proxy:
+            await self._send_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, "No healthy proxies available",
+                                   version, request_line)
+            return
+        
+        try:
+            started = time.monotonic()
+            try:
+                upstream = await open_tunnel_async(proxy, host, port, self.config.connection_timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, SocksError, TunnelError) as e:
+                self.proxy_manager.report_outcome(proxy, False, error=e)
+                await self._send_error(writer, HTTPStatus.BAD_GATEWAY, f"Proxy error: {str(e)}", version,
+                                       request_line)
+                return
+            self.proxy_manager.report_outcome(proxy, True, time.monotonic() - started)
+            
+            try:
+                writer.write(f"{version} 200 Connection Established\r\n\r\n".encode('latin-1'))
+                await writer.drain()
+                self._log_request(request_line, HTTPStatus.OK)
+                await relay_async((reader, writer), upstream, self.config.tunnel_idle_timeout)
+            finally:
+                upstream[1].close()
+        finally:
+            self.proxy_manager.release_proxy(proxy)
+    
+    def _check_rate_limit(self, writer: asyncio.StreamWriter, fields: Dict[str, str]) -> float:
+        """Per-client token bucket; returns 0 if allowed, otherwise seconds to wait"""
+        if self.rate_limiter is None:
+            return 0.0
+        
+        key = None
+        if self.config.rate_limit_key_header:
+            key = fields.get(self.config.rate_limit_key_header.lower())
+        if not key:
+            peer = writer.get_extra_info('peername')
+            key = peer[0] if peer else ''
+        return self.rate_limiter.acquire(key)
+    
+    async def _open_upstream(self, proxy: Proxy, scheme: str, host: str, port: int) -> Streams:
+        """Connect to the upstream proxy, tunnelling to the origin when the request needs it"""
+        if scheme == 'https' or is_socks(proxy):
+            reader, writer = await open_tunnel_async(proxy, host, port, self.config.connection_timeout)
+        else:
+            proxy_host, proxy_port = split_address(proxy.address)
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(proxy_host, proxy_port, limit=MAX_HEADER_SIZE),
+                self.config.connection_timeout
+            )
+        if scheme == 'https':
+            try:
+                await asyncio.wait_for(writer.start_tls(self._ssl_context, server_hostname=host),
+                                       self.config.connection_timeout)
+            except BaseException:
+                writer.close()
+                raise
+        self.connection_pool.created += 1
+        return reader, writer
+    
+    async def _forward_request(self, writer: asyncio.StreamWriter, method: str, target_url: str,
+                               version: str, client_headers: HeaderList, body: bytes, proxy: Proxy,
+                               keep_alive: bool, state: dict, request_line: str) -> bool:
+        """Forward request through proxy, returning whether the client connection stays open"""
+        url = urllib.parse.urlsplit(target_url)
+        scheme = url.scheme.lower()
+        if scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f"Unsupported target URL {target_url}")
+        port = url.port or (443 if scheme == 'https' else 80)
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        host_header = url.netloc.rpartition('@')[2]
+        
+        # Prepare headers
+        lines = []
+        session_header = (self.config.session_header or "").lower()
+        for name, value in client_headers:
+            lowered = name.lower()
+            # The session header is addressed to us, not the origin. The body
+            # is re-framed below, so the client's own Content-Length is dropped
+            if (lowered not in ('host', 'content-length') and lowered not in HOP_BY_HOP_HEADERS
+                    and lowered != session_header):
+                lines.append(f"{name}: {value}\r\n")
+        lines.append(f"Host: {host_header}\r\n")
+        # Keep-alive is negotiated per hop, with our own upstream connections
+        lines.append("Connection: keep-alive\r\n")
+        if body:
+            lines.append(f"Content-Length: {len(body)}\r\n")
+        
+        tunnelled = scheme == 'https' or is_socks(proxy)
+        if tunnelled:
+            # The origin sees an ordinary origin-form request
+            request_target = path
+            key = (proxy.key, scheme, url.hostname, port)
+        else:
+            # Plain HTTP proxies take the absolute URL and the credentials per request
+            request_target = f"http://{host_header}{path}"
+            authorization = proxy.proxy_authorization()
+            if authorization:
+                lines.append(f"Proxy-Authorization: {authorization}\r\n")
+            key = (proxy.key,)
+        request = (f"{method} {request_target} HTTP/1.1\r\n" + ''.join(lines) + "\r\n").encode('latin-1') + body
+        
+        state['upstream_started'] = time.monotonic()
+        upstream = self.connection_pool.acquire(key)
+        reused = upstream is not None
+        if upstream is None:
+            upstream = await self._open_upstream(proxy, scheme, url.hostname, port)
+        try:
+            try:
+                head = await self._exchange(upstream, request)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                if not reused:
+                    raise
+                # The pooled connection died while idle; retry once on a fresh one
+                self.connection_pool.discard(upstream)
+                upstream = await self._open_upstream(proxy, scheme, url.hostname, port)
+                head = await self._exchange(upstream, request)
+            state['upstream_latency'] = time.monotonic() - state['upstream_started']
+            
+            upstream_open, client_open = await self._relay_response(
+                upstream[0], writer, method, version, head, keep_alive, state, request_line
+            )
+        except BaseException:
+            self.connection_pool.discard(upstream)
+            raise
+        
+        if upstream_open:
+            self.connection_pool.release(key, upstream)
+        else:
+            self.connection_pool.discard(upstream)
+        return client_open
+    
+    async def _exchange(self, upstream: Streams, request: bytes) -> bytes:
+        """Send a request upstream and read the response header block, skipping 1xx interim responses"""
+        reader, writer = upstream
+        writer.write(request)
+        await writer.drain()
+        while True:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.config.connection_timeout)
+            status_line = head.split(b'\r\n', 1)[0].split(None, 2)
+            if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/'):
+                raise ValueError(f"Malformed status line {head[:64]!r}")
+            if not b'100' <= status_line[1] < b'200' or status_line[1] == b'101':
+                return head
+    
+    async def _relay_response(self, upstream: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              method: str, version: str, head: bytes, keep_alive: bool, state: dict,
+                              request_line: str) -> Tuple[bool, bool]:
+        """Stream an upstream response to the client, returning (upstream reusable, client reusable)"""
+        status_line, headers = _parse_head(head)
+        upstream_version, status, reason = (status_line.split(' ', 2) + [''])[:3]
+        status = int(status)
+        fields = _header_map(headers)
+        upstream_keep_alive = upstream_version == 'HTTP/1.1' and 'close' not in fields.get('connection', '').lower()
+        
+        has_body = (method != 'HEAD' and status >= 200 and
+                    status not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED))
+        upstream_chunked = has_body and 'chunked' in fields.get('transfer-encoding', '').lower()
+        length = None
+        if has_body and not upstream_chunked and 'content-length' in fields:
+            length = int(fields['content-length'])
+        until_eof = has_body and not upstream_chunked and length is None
+        
+        # Bodies of unknown length are re-chunked for HTTP/1.1 clients and
+        # delimited by closing the connection for HTTP/1.0 ones
+        chunked = has_body and length is None and version == 'HTTP/1.1'
+        client_open = keep_alive and not (has_body and length is None and not chunked)
+        
+        lines = [f"{version} {status} {reason}\r\n"]
+        for name, value in headers:
+            if name.lower() not in HOP_BY_HOP_HEADERS:
+                lines.append(f"{name}: {value}\r\n")
+        if chunked:
+            lines.append("Transfer-Encoding: chunked\r\n")
+        if not client_open:
+            lines.append("Connection: close\r\n")
+        elif version == 'HTTP/1.0':
+            lines.append("Connection: keep-alive\r\n")
+        writer.write((''.join(lines) + "\r\n").encode('latin-1'))
+        state['started'] = True
+        self._log_request(request_line, status)
+        
+        if has_body:
+            if upstream_chunked:
+                await self._relay_chunked(upstream, writer, chunked)
+            elif length is not None:
+                remaining = length
+                while remaining:
+                    data = await self._read(upstream, min(remaining, STREAM_CHUNK_SIZE))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    writer.write(data)
+                    await writer.drain()
+                    remaining -= len(data)
+            else:
+                while True:
+                    data = await self._read(upstream, STREAM_CHUNK_SIZE)
+                    if not data:
+                        break
+                    writer.write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+                    await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return upstream_keep_alive and not until_eof, client_open
+    
+    async def _relay_chunked(self, upstream: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             chunked: bool):
+        """Decode a chunked upstream body, re-chunking it for the client when it speaks HTTP/1.1"""
+        while True:
+            size_line = await upstream.readline()
+            if not size_line.endswith(b'\n'):
+                raise asyncio.IncompleteReadError(size_line, None)
+            size = int(size_line.split(b';', 1)[0], 16)
+            if size == 0:
+                # Drop trailers; the terminating chunk is written by the caller
+                while (await upstream.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            if chunked:
+                writer.write(b'%x\r\n' % size)
+            while size:
+                data = await self._read(upstream, min(size, STREAM_CHUNK_SIZE))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', size)
+                writer.write(data)
+                await writer.drain()
+                size -= len(data)
+            await upstream.readexactly(2)
+            if chunked:
+                writer.write(b'\r\n')
+    
+    async def _read(self, upstream: asyncio.StreamReader, size: int) -> bytes:
+        """Read up to size body bytes, giving up on an upstream that stalls"""
+        return await asyncio.wait_for(upstream.read(size), self.config.connection_timeout)
+    
+    async def _send_error(self, writer: asyncio.StreamWriter, status: HTTPStatus, message: str,
+                          version: str, request_line: str = '-', extra_headers: HeaderList = ()):
+        """Send a short error response and mark the connection for closing"""
+        body = f"{status.value} {status.phrase}: {message}\n".encode('utf-8', 'replace')
+        writer.write((
+            f"{version} {status.value} {status.phrase}\r\n"
+            + ''.join(f"{name}: {value}\r\n" for name, value in extra_headers) +
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode('latin-1') + body)
+        self._log_request(request_line, status)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+    
+    def _log_request(self, request_line: str, status: int):
+        """Access log line in the threaded server's format"""
+        self.logger.info(f'"{request_line}" {int(status)} -')
@@ -0,0 +1,181 @@
+"""
+Per-proxy circuit breakers for Rota
+Live request outcomes eject a proxy after consecutive failures; it rejoins
+the rotation only after trial requests in the half-open state succeed.
+"""
+
+import heapq
+import itertools
+import math
+import ssl
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rota.proxy import Proxy
+from rota.socks import SocksDestinationError
+from rota.tunnel import TunnelDestinationError
+
+
+def is_destination_failure(error: Optional[BaseException]) -> bool:
+    """Whether a failed request failed beyond the upstream proxy, saying nothing about the proxy itself"""
+    # The proxy reported that it could not reach the origin, or the origin's
+    # own TLS handshake or certificate failed inside a working tunnel
+    return isinstance(error, (TunnelDestinationError, SocksDestinationError, ssl.SSLError))
+
+
+class _OpenState:
+    """An ejected proxy, either waiting out its cool-down or on trial"""
+    
+    __slots__ = ('proxy', 'open_seconds', 'trial_at', 'trial_in_flight', 'successes')
+    
+    def __init__(self, proxy: Proxy, open_seconds: float):
+        self.proxy = proxy
+        self.open_seconds = open_seconds
+        self.trial_at = 0.0
+        self.trial_in_flight = False
+        self.successes = 0
+
+
+class CircuitBreaker:
+    """Tracks failure streaks per proxy and schedules half-open trials for ejected ones"""
+    
+    def __init__(self, failure_threshold: int, open_seconds: float, half_open_successes: int,
+                 max_open_seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        # Cool-downs double after each failed trial, up to this
+        self.max_open_seconds = max_open_seconds if max_open_seconds is not None else open_seconds * 32
+        self.half_open_successes = max(1, half_open_successes)
+        
+        self._lock = threading.Lock()
+        # Proxies in rotation with a current failure streak
+        self._failures: Dict[Proxy, int] = {}
+        # Ejected proxies
+        self._open: Dict[Proxy, _OpenState] = {}
+        # (trial time, tie-breaker, state); entries whose time no longer
+        # matches state.trial_at are stale and skipped
+        self._trials: List[Tuple[float, int, _OpenState]] = []
+        self._sequence = itertools.count()
+        # Earliest scheduled trial, read without the lock on every request
+        self.next_trial_at = math.inf
+        
+        self.opened = 0
+        self.closed = 0
+        self.trials = 0
+    
+    def record_success(self, proxy: Proxy) -> bool:
+        """Note a successful request; returns True when this closes the proxy's breaker"""
+        # Lock-free fast path for the common case of a proxy with a clean record
+        if proxy not in self._failures and proxy not in self._open:
+            return False
+        with self._lock:
+            state = self._open.get(proxy)
+            if state is None:
+                self._failures.pop(proxy, None)
+                return False
+            if not state.trial_in_flight:
+                # Started before the proxy was ejected; not a trial
+                return False
+            state.trial_in_flight = False
+            state.successes += 1
+            if state.successes < self.half_open_successes:
+                # The next request may run the next trial straight away
+                self._schedule(state, self._clock())
+                return False
+            del self._open[proxy]
+            self._update_next_trial()
+            self.closed += 1
+            return True
+    
+    def record_failure(self, proxy: Proxy) -> bool:
+        """Note a failed request; returns True when this opens the proxy's breaker"""
+        now = self._clock()
+        with self._lock:
+            state = self._open.get(proxy)
+            if state is not None:
+                if state.trial_in_flight:
+                    # Failed trial: back to open, for longer
+                    state.trial_in_flight = False
+                    state.successes = 0
+                    state.open_seconds = min(state.open_seconds * 2, self.max_open_seconds)
+                    self._schedule(state, now + state.open_seconds)
+                return False
+            
+            failures = self._failures.get(proxy, 0) + 1
+            if failures < self.failure_threshold:
+                self._failures[proxy] = failures
+                return False
+            self._failures.pop(proxy, None)
+            state = self._open[proxy] = _OpenState(proxy, self.open_seconds)
+            self._schedule(state, now + self.open_seconds)
+            self.opened += 1
+            return True
+    
+    def record_neutral(self, proxy: Proxy):
+        """Note a request that failed beyond the proxy; it counts neither way"""
+        if proxy not in self._open:
+            return
+        with self._lock:
+            state = self._open.get(proxy)
+            if state is None or not state.trial_in_flight:
+                return
+            # Inconclusive trial; the next request may run another straight away
+            state.trial_in_flight = False
+            self._schedule(state, self._clock())
+    
+    def take_trial(self) -> Optional[Proxy]:
+        """Hand out an ejected proxy whose cool-down is over for a half-open trial request"""
+        now = self._clock()
+        with self._lock:
+            while self._trials and self._trials[0][0] <= now:
+                trial_at, _, state = heapq.heappop(self._trials)
+                if trial_at != state.trial_at or self._open.get(state.proxy) is not state:
+                    continue
+                state.trial_in_flight = True
+                # If the outcome is never reported (e.g. the client went away
+                # first), allow another trial after a further cool-down
+                self._schedule(state, now + state.open_seconds)
+                self.trials += 1
+                return state.proxy
+            self._update_next_trial()
+            return None
+    
+    def is_open(self, proxy: Proxy) -> bool:
+        """Whether a proxy is currently ejected"""
+        return proxy in self._open
+    
+    def forget(self, proxy: Proxy):
+        """Drop all state of a proxy, e.g. once it is unhealthy or removed"""
+        if proxy not in self._failures and proxy not in self._open:
+            return
+        with self._lock:
+            self._failures.pop(proxy, None)
+            if self._open.pop(proxy, None) is not None:
+                self._update_next_trial()
+    
+    def get_stats(self) -> Dict:
+        """Get circuit breaker statistics"""
+        with self._lock:
+            return {
+                'circuit_open_proxies': len(self._open),
+                'circuit_opened_total': self.opened,
+                'circuit_closed_total': self.closed,
+                'circuit_trials_total': self.trials
+            }
+    
+    def _schedule(self, state: _OpenState, trial_at: float):
+        state.trial_at = trial_at
+        heapq.heappush(self._trials, (trial_at, next(self._sequence), state))
+        self._update_next_trial()
+    
+    def _update_next_trial(self):
+        # Discard stale entries so the published time is a real trial
+        while self._trials:
+            trial_at, _, state = self._trials[0]
+            if trial_at == state.trial_at and self._open.get(state.proxy) is state:
+                self.next_trial_at = trial_at
+                return
+            heapq.heappop(self._trials)
+        self.next_trial_at = math.inf
@@ -15,6 +15,7 @@ class RotationStrategy(Enum):
     ROUND_ROBIN = "roundrobin"
     LEAST_CONNECTIONS = "least_conn"
     TIME_BASED = "time_based"
+    LATENCY_EWMA = "ewma"
 
 
 @dataclass
@@ -24,8 +25,20 @@ class Config:
     # Server configuration
     host: str = "127.0.0.1"
     port: int = 8080
+    server_engine: str = "threaded"  # threaded, asyncio
     max_connections: int = 1000
     connection_timeout: int = 30
+    tunnel_idle_timeout: int = 300  # Close CONNECT tunnels idle this long
+    
+    # SOCKS5 listener (optional, for clients that cannot use an HTTP proxy)
+    socks_enabled: bool = False
+    socks_host: str = "127.0.0.1"
+    socks_port: int = 1080
+    
+    # Sticky sessions (requests with the same session key keep their proxy)
+    session_header: str = "X-Rota-Session"  # Request header carrying the session key; "" to ignore it
+    session_from_username: bool = False  # Opt-in: use the Proxy-Authorization / SOCKS5 username as the session key
+    session_ring_replicas: int = 16  # Points per proxy on the consistent-hash ring
     
     # Proxy configuration
     proxy_files: List[str] = None
@@ -33,24 +46,52 @@ class Config:
     max_proxy_age: int = 3600  # 1 hour in seconds
     proxy_check_interval: int = 300  # 5 minutes
     
+    # Upstream connection pooling
+    pool_max_idle_per_proxy: int = 8  # Idle keep-alive connections kept per upstream
+    pool_idle_timeout: int = 60  # seconds
+    
     # Health checking
     health_check_enabled: bool = True
+    health_check_engine: str = "threaded"  # threaded, asyncio
     health_check_url: str = "http://httpbin.org/ip"
     health_check_timeout: int = 10
     health_check_interval: int = 60  # 1 minute
-    max_proxies_per_check: int = 100  # Max proxies to check per health check cycle
+    max_proxies_per_check: int = 100  # Max proxies probed in one scheduling round (also the probe burst)
+    health_check_max_rate: float = 20  # Probes per second across the pool; 0 for no limit
+    health_check_max_backoff: int = 3600  # Longest interval between checks of a failing proxy
+    health_check_workers: int = 128  # Worker threads for the startup health check
+    health_check_max_in_flight: int = 256  # Global limit on concurrent probes
+    
+    # Circuit breaker (passive health from live traffic)
+    circuit_breaker_enabled: bool = True
+    circuit_breaker_failure_threshold: int = 5  # Consecutive proxy-side request failures that eject a proxy
+    circuit_breaker_open_seconds: int = 30  # Cool-down before the first half-open trial; doubles per failed trial
+    circuit_breaker_half_open_successes: int = 2  # Successful trial requests needed to rejoin the rotation
+    
+    # Persistent health state
+    health_cache_enabled: bool = True
+    health_cache_file: str = "rota_health.db"
+    health_cache_max_age: int = 600  # Cached results newer than this (seconds) are trusted at startup
     
     # Rate limiting
     rate_limit_enabled: bool = True
     rate_limit_requests: int = 100  # requests per minute
     rate_limit_burst: int = 50  # burst capacity
+    rate_limit_key_header: str = ""  # Header identifying clients (e.g. X-API-Key); client address if unset
+    
+    # Metrics (Prometheus text format on a separate admin listener)
+    metrics_enabled: bool = False
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 9108
+    metrics_path: str = "/metrics"
     
     # Logging
     log_level: str = "INFO"
     log_file: str = "rota.log"
     
     # File monitoring
-    file_monitor_interval: int = 30  # seconds
+    file_monitor_enabled: bool = True
+    file_monitor_interval: int = 30  # seconds; fallback poll when inotify is unavailable
     
     def __post_init__(self):
         if self.proxy_files is None:
@@ -70,8 +111,17 @@ class Config:
                     server = config_data['server']
                     config.host = server.get('host', config.host)
                     config.port = server.get('port', config.port)
+                    config.server_engine = server.get('engine', config.server_engine)
                     config.max_connections = server.get('max_connections', config.max_connections)
                     config.connection_timeout = server.get('connection_timeout', config.connection_timeout)
+                    config.tunnel_idle_timeout = server.get('tunnel_idle_timeout', config.tunnel_idle_timeout)
+                
+                # SOCKS5 listener settings
+                if 'socks' in config_data:
+                    socks = config_data['socks']
+                    config.socks_enabled = socks.get('enabled', config.socks_enabled)
+                    config.socks_host = socks.get('host', config.socks_host)
+                    config.socks_port = socks.get('port', config.socks_port)
                 
                 # Proxy settings
                 if 'proxy' in config_data:
@@ -83,14 +133,48 @@ class Config:
                     config.max_proxy_age = proxy.get('max_proxy_age', config.max_proxy_age)
                     config.proxy_check_interval = proxy.get('check_interval', config.proxy_check_interval)
                 
+                # Sticky session settings
+                if 'sessions' in config_data:
+                    sessions = config_data['sessions']
+                    # null disables the header, same as an empty string
+                    config.session_header = sessions.get('header', config.session_header) or ""
+                    config.session_from_username = sessions.get('from_username', config.session_from_username)
+                    config.session_ring_replicas = sessions.get('ring_replicas', config.session_ring_replicas)
+                
+                # Connection pool settings
+                if 'connection_pool' in config_data:
+                    pool = config_data['connection_pool']
+                    config.pool_max_idle_per_proxy = pool.get('max_idle_per_proxy', config.pool_max_idle_per_proxy)
+                    config.pool_idle_timeout = pool.get('idle_timeout', config.pool_idle_timeout)
+                
                 # Health check settings
                 if 'health_check' in config_data:
                     health = config_data['health_check']
                     config.health_check_enabled = health.get('enabled', config.health_check_enabled)
+                    config.health_check_engine = health.get('engine', config.health_check_engine)
                     config.health_check_url = health.get('url', config.health_check_url)
                     config.health_check_timeout = health.get('timeout', config.health_check_timeout)
                     config.health_check_interval = health.get('interval', config.health_check_interval)
                     config.max_proxies_per_check = health.get('max_proxies_per_check', config.max_proxies_per_check)
+                    config.health_check_max_rate = health.get('max_rate', config.health_check_max_rate)
+                    config.health_check_max_backoff = health.get('max_backoff', config.health_check_max_backoff)
+                    config.health_check_workers = health.get('workers', config.health_check_workers)
+                    config.health_check_max_in_flight = health.get('max_in_flight', config.health_check_max_in_flight)
+                
+                # Circuit breaker settings
+                if 'circuit_breaker' in config_data:
+                    breaker = config_data['circuit_breaker']
+                    config.circuit_breaker_enabled = breaker.get('enabled', config.circuit_breaker_enabled)
+                    config.circuit_breaker_failure_threshold = breaker.get('failure_threshold', config.circuit_breaker_failure_threshold)
+                    config.circuit_breaker_open_seconds = breaker.get('open_seconds', config.circuit_breaker_open_seconds)
+                    config.circuit_breaker_half_open_successes = breaker.get('half_open_successes', config.circuit_breaker_half_open_successes)
+                
+                # Health cache settings
+                if 'health_cache' in config_data:
+                    cache = config_data['health_cache']
+                    config.health_cache_enabled = cache.get('enabled', config.health_cache_enabled)
+                    config.health_cache_file = cache.get('file', config.health_cache_file)
+                    config.health_cache_max_age = cache.get('max_age', config.health_cache_max_age)
                 
                 # Rate limiting settings
                 if 'rate_limit' in config_data:
@@ -98,6 +182,15 @@ class Config:
                     config.rate_limit_enabled = rate.get('enabled', config.rate_limit_enabled)
                     config.rate_limit_requests = rate.get('requests_per_minute', config.rate_limit_requests)
                     config.rate_limit_burst = rate.get('burst_capacity', config.rate_limit_burst)
+                    config.rate_limit_key_header = rate.get('key_header', config.rate_limit_key_header)
+                
+                # Metrics settings
+                if 'metrics' in config_data:
+                    metrics = config_data['metrics']
+                    config.metrics_enabled = metrics.get('enabled', config.metrics_enabled)
+                    config.metrics_host = metrics.get('host', config.metrics_host)
+                    config.metrics_port = metrics.get('port', config.metrics_port)
+                    config.metrics_path = metrics.get('path', config.metrics_path)
                 
                 # Logging settings
                 if 'logging' in config_data:
@@ -108,6 +201,7 @@ class Config:
                 # File monitoring
                 if 'file_monitor' in config_data:
                     monitor = config_data['file_monitor']
+                    config.file_monitor_enabled = monitor.get('enabled', config.file_monitor_enabled)
                     config.file_monitor_interval = monitor.get('interval', config.file_monitor_interval)
         
         return config
@@ -118,8 +212,15 @@ class Config:
             'server': {
                 'host': self.host,
                 'port': self.port,
+                'engine': self.server_engine,
                 'max_connections': self.max_connections,
-                'connection_timeout': self.connection_timeout
+                'connection_timeout': self.connection_timeout,
+                'tunnel_idle_timeout': self.tunnel_idle_timeout
+            },
+            'socks': {
+                'enabled': self.socks_enabled,
+                'host': self.socks_host,
+                'port': self.socks_port
             },
             'proxy': {
                 'files': self.proxy_files,
@@ -127,23 +228,56 @@ class Config:
                 'max_proxy_age': self.max_proxy_age,
                 'check_interval': self.proxy_check_interval
             },
+            'sessions': {
+                'header': self.session_header,
+                'from_username': self.session_from_username,
+                'ring_replicas': self.session_ring_replicas
+            },
+            'connection_pool': {
+                'max_idle_per_proxy': self.pool_max_idle_per_proxy,
+                'idle_timeout': self.pool_idle_timeout
+            },
             'health_check': {
                 'enabled': self.health_check_enabled,
+                'engine': self.health_check_engine,
                 'url': self.health_check_url,
                 'timeout': self.health_check_timeout,
                 'interval': self.health_check_interval,
-                'max_proxies_per_check': self.max_proxies_per_check
+                'max_proxies_per_check': self.max_proxies_per_check,
+                'max_rate': self.health_check_max_rate,
+                'max_backoff': self.health_check_max_backoff,
+                'workers': self.health_check_workers,
+                'max_in_flight': self.health_check_max_in_flight
+            },
+            'circuit_breaker': {
+                'enabled': self.circuit_breaker_enabled,
+                'failure_threshold': self.circuit_breaker_failure_threshold,
+                'open_seconds': self.circuit_breaker_open_seconds,
+                'half_open_successes': self.circuit_breaker_half_open_successes
+            },
+            'health_cache': {
+                'enabled': self.health_cache_enabled,
+                'file': self.health_cache_file,
+                'max_age': self.health_cache_max_age
             },
             'rate_limit': {
                 'enabled': self.rate_limit_enabled,
                 'requests_per_minute': self.rate_limit_requests,
-                'burst_capacity': self.rate_limit_burst
+                'burst_capacity': self.rate_limit_burst,
+                'key_header': self.rate_limit_key_header
+            },
+            'metrics': {
+                'enabled': self.metrics_enabled,
+                'host': self.metrics_host,
+                'port': self.metrics_port,
+                'path': self.metrics_path
             },
             'logging': {
                 'level': self.log_level,
                 'file': self.log_file
             },
             'file_monitor': {
+                'enabled': self.file_monitor_enabled,
                 'interval': self.file_monitor_interval
             }
         }
@@ -0,0 +1,210 @@
+"""
+Keep-alive connection pooling for upstream proxies in Rota
+"""
+
+import http.client
+import logging
+import select
+import ssl
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from rota.proxy import Proxy
+from rota.socks import is_socks, split_address
+from rota.tunnel import open_tunnel
+
+
+class ProxiedHTTPConnection(http.client.HTTPConnection):
+    """Plain HTTP connection to an upstream proxy, sending absolute-form requests"""
+    
+    def __init__(self, proxy: Proxy, timeout: float):
+        host, port = split_address(proxy.address)
+        super().__init__(host, port, timeout=timeout)
+        self.proxy = proxy
+
+
+class ProxiedHTTPSConnection(http.client.HTTPSConnection):
+    """TLS connection to an origin, tunnelled through an upstream proxy with CONNECT"""
+    
+    def __init__(self, proxy: Proxy, host: str, port: int, timeout: float,
+                 context: Optional[ssl.SSLContext] = None):
+        proxy_host, proxy_port = split_address(proxy.address)
+        super().__init__(proxy_host, proxy_port, timeout=timeout, context=context)
+        headers = {}
+        authorization = proxy.proxy_authorization()
+        if authorization:
+            headers['Proxy-Authorization'] = authorization
+        self.set_tunnel(host, port, headers=headers)
+        self.proxy = proxy
+
+
+class SocksHTTPConnection(http.client.HTTPConnection):
+    """Plain HTTP connection to an origin, tunnelled through a SOCKS upstream"""
+    
+    def __init__(self, proxy: Proxy, host: str, port: int, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self.proxy = proxy
+    
+    def connect(self):
+        self.sock = open_tunnel(self.proxy, self.host, self.port, self.timeout)[0]
+
+
+class SocksHTTPSConnection(http.client.HTTPSConnection):
+    """TLS connection to an origin, tunnelled through a SOCKS upstream"""
+    
+    def __init__(self, proxy: Proxy, host: str, port: int, timeout: float,
+                 context: Optional[ssl.SSLContext] = None):
+        super().__init__(host, port, timeout=timeout, context=context)
+        self.proxy = proxy
+    
+    def connect(self):
+        sock = open_tunnel(self.proxy, self.host, self.port, self.timeout)[0]
+        try:
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+        except BaseException:
+            sock.close()
+            raise
+
+
+def open_connection(proxy: Proxy, scheme: str, host: str, port: int, timeout: float,
+                    context: Optional[ssl.SSLContext] = None) -> http.client.HTTPConnection:
+    """Unconnected HTTP(S) connection to host:port through proxy, for any upstream protocol"""
+    if is_socks(proxy):
+        if scheme == 'https':
+            return SocksHTTPSConnection(proxy, host, port, timeout, context)
+        return SocksHTTPConnection(proxy, host, port, timeout)
+    if scheme == 'https':
+        return ProxiedHTTPSConnection(proxy, host, port, timeout, context)
+    return ProxiedHTTPConnection(proxy, timeout)
+
+
+PoolKey = Tuple
+
+
+class UpstreamConnectionPool:
+    """Bounded pool of idle keep-alive connections, keyed by upstream proxy"""
+    
+    def __init__(self, max_idle_per_proxy: int = 8, idle_timeout: float = 60,
+                 connect_timeout: float = 30):
+        self.max_idle_per_proxy = max_idle_per_proxy
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._idle: Dict[PoolKey, Deque[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._ssl_context = ssl.create_default_context()
+        self.logger = logging.getLogger(__name__)
+        
+        # Counters for get_stats()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+    
+    @staticmethod
+    def key_for(proxy: Proxy, scheme: str, host: str, port: int) -> PoolKey:
+        """Plain HTTP connections to an HTTP proxy serve any origin; tunnels are bound to one"""
+        if scheme == 'https' or is_socks(proxy):
+            return (proxy.key, scheme, host, port)
+        return (proxy.key,)
+    
+    def acquire(self, proxy: Proxy, scheme: str, host: str, port: int,
+                fresh: bool = False) -> Tuple[http.client.HTTPConnection, bool]:
+        """Get a warm connection if one is idle, otherwise a new one; returns (connection, reused)"""
+        key = self.key_for(proxy, scheme, host, port)
+        now = time.monotonic()
+        while not fresh:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                # Most recently used first: it is the least likely to have been
+                # closed by the peer
+                conn, last_used = idle.pop()
+                if not idle:
+                    del self._idle[key]
+            if now - last_used < self.idle_timeout and self._is_alive(conn):
+                self.reused += 1
+                return conn, True
+            self.discard(conn)
+        
+        self.created += 1
+        conn = open_connection(proxy, scheme, host, port, self.connect_timeout, self._ssl_context)
+        conn.pool_key = key
+        return conn, False
+    
+    def release(self, conn: http.client.HTTPConnection):
+        """Return a connection whose last response was fully read"""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(conn.pool_key, deque())
+            if len(idle) < self.max_idle_per_proxy:
+                idle.append((conn, now))
+                conn = None
+            sweep = now - self._last_sweep >= self.idle_timeout / 2
+            if sweep:
+                self._last_sweep = now
+        if conn is not None:
+            self.discard(conn)
+        if sweep:
+            self.evict_idle()
+    
+    def discard(self, conn: http.client.HTTPConnection):
+        """Close a connection that must not be reused"""
+        self.discarded += 1
+        try:
+            conn.close()
+        except OSError:
+            pass
+    
+    def evict_idle(self) -> int:
+        """Close connections idle longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for key in list(self._idle):
+                idle = self._idle[key]
+                # Deques are ordered oldest first
+                while idle and idle[0][1] < cutoff:
+                    expired.append(idle.popleft()[0])
+                if not idle:
+                    del self._idle[key]
+        for conn in expired:
+            self.discard(conn)
+        return len(expired)
+    
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            pooled = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        for conn in pooled:
+            self.discard(conn)
+    
+    def get_stats(self) -> Dict:
+        """Get pool statistics"""
+        with self._lock:
+            idle = sum(len(conns) for conns in self._idle.values())
+        return {
+            'idle_connections': idle,
+            'connections_created': self.created,
+            'connections_reused': self.reused,
+            'connections_discarded': self.discarded
+        }
+    
+    @staticmethod
+    def _is_alive(conn: http.client.HTTPConnection) -> bool:
+        """An idle keep-alive socket should have nothing to read; EOF or stray bytes mean it is dead"""
+        if conn.sock is None:
+            return False
+        try:
+            # poll() has no FD_SETSIZE limit; Windows only has select()
+            if hasattr(select, 'poll'):
+                poller = select.poll()
+                poller.register(conn.sock, select.POLLIN)
+                return not poller.poll(0)
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
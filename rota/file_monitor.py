@@ -0,0 +1,275 @@
+"""
+Proxy file monitoring for Rota
+Watches the configured proxy files and applies only the lines that changed,
+so edits never reload the pool or disturb proxies already in rotation.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from rota.config import Config
+from rota.proxy import Proxy
+from rota.proxy_parser import parse_proxy_line
+from rota.proxy_manager import ProxyManager
+
+
+# Bytes hashed per read when verifying that a file was only appended to
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+# inotify event bits (linux/inotify.h)
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+                  _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+_IN_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Minimal inotify binding that reports changes to a set of file names"""
+    
+    def __init__(self, paths: List[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Directories are watched rather than the files themselves, so editors
+        # that save by writing a new file and renaming it over are still seen
+        self._names: Dict[int, set] = {}
+        try:
+            for path in paths:
+                directory, name = os.path.split(os.path.abspath(path))
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+                self._names.setdefault(wd, set()).add(os.fsencode(name))
+        except BaseException:
+            os.close(self.fd)
+            raise
+    
+    def wait(self, timeout: float) -> bool:
+        """Block up to timeout; returns whether one of the watched files changed"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = _IN_EVENT_HEADER.unpack_from(data, offset)
+                offset += _IN_EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name in self._names.get(wd, ()):
+                    changed = True
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class _FileState:
+    """What was last read from one proxy file"""
+    
+    __slots__ = ('signature', 'offset', 'crc', 'partial', 'lines')
+    
+    def __init__(self):
+        self.signature: Optional[Tuple[int, int, int]] = None
+        # Bytes up to the end of the last complete line, and their CRC-32
+        self.offset = 0
+        self.crc = 0
+        # Proxy line after the last newline, if any; it may still be growing
+        self.partial = ''
+        self.lines: Counter = Counter()
+
+
+class ProxyFileMonitor:
+    """Applies edits of the configured proxy files to a ProxyManager as deltas"""
+    
+    def __init__(self, config: Config, proxy_manager: ProxyManager):
+        self.config = config
+        self.proxy_manager = proxy_manager
+        self._files: Dict[str, _FileState] = {}
+        # Proxy.key -> number of lines across all files naming that proxy, so a
+        # proxy listed in two files stays until it is gone from both
+        self._refs: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.logger = logging.getLogger(__name__)
+    
+    def start(self):
+        """Record the current file contents and start watching for changes"""
+        # The pool was loaded from these files already, so the first scan only
+        # establishes the baseline
+        self._collect_changes()
+        self._running = True
+        self._thread = threading.Thread(target=self._monitor_loop, name="rota-file-monitor", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop watching"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+    
+    def poll(self) -> Tuple[int, int]:
+        """Check the files once, apply any delta and return (added, removed)"""
+        added, removed = self._collect_changes()
+        if not added and not removed:
+            return 0, 0
+        new_proxies, removed_count = self.proxy_manager.apply_changes(added, removed)
+        self.logger.info(f"Proxy files changed: {len(new_proxies)} proxies added, {removed_count} removed")
+        return len(new_proxies), removed_count
+    
+    def _monitor_loop(self):
+        inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                inotify = _Inotify(self.config.proxy_files)
+                self.logger.info("Watching proxy files with inotify")
+            except (OSError, AttributeError) as e:
+                self.logger.debug(f"inotify unavailable, polling instead: {e}")
+        if inotify is None:
+            self.logger.info(f"Polling proxy files every {self.config.file_monitor_interval}s")
+        
+        deadline = time.monotonic() + self.config.file_monitor_interval
+        try:
+            while self._running:
+                # Wake at least once a second so stop() is prompt
+                timeout = max(0.0, min(1.0, deadline - time.monotonic()))
+                if inotify is not None:
+                    changed = inotify.wait(timeout)
+                else:
+                    time.sleep(timeout)
+                    changed = False
+                if not changed and time.monotonic() < deadline:
+                    continue
+                if changed:
+                    # Let a burst of writes settle into a single delta
+                    time.sleep(0.1)
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.logger.error(f"File monitor error: {e}")
+                deadline = time.monotonic() + self.config.file_monitor_interval
+        finally:
+            if inotify is not None:
+                inotify.close()
+    
+    def _collect_changes(self) -> Tuple[List[Proxy], List[Proxy]]:
+        """Scan every file and net out the per-proxy changes across files"""
+        delta: Counter = Counter()
+        malformed = 0
+        for path in self.config.proxy_files:
+            added, removed = self._scan(path)
+            for lines, sign in ((added, 1), (removed, -1)):
+                for line, count in lines.items():
+                    key = parse_proxy_line(line)
+                    if key[0] is not None:
+                        delta[key] += sign * count
+                    elif sign > 0:
+                        malformed += count
+        # The baseline scan in start() re-reads what the initial load already
+        # reported on
+        if malformed and self._running:
+            self.logger.warning(f"Skipped {malformed} malformed proxy lines")
+        
+        added_proxies, removed_proxies = [], []
+        for key, change in delta.items():
+            before = self._refs[key]
+            after = before + change
+            if after > 0:
+                self._refs[key] = after
+                if before <= 0:
+                    added_proxies.append(Proxy(*key))
+            else:
+                self._refs.pop(key, None)
+                if before > 0:
+                    removed_proxies.append(Proxy(*key))
+        return added_proxies, removed_proxies
+    
+    def _scan(self, path: str) -> Tuple[Counter, Counter]:
+        """Return (added, removed) proxy lines of one file since the last scan"""
+        state = self._files.get(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if state is None:
+                return Counter(), Counter()
+            del self._files[path]
+            return Counter(), state.lines
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if state is not None and state.signature == signature:
+            return Counter(), Counter()
+        
+        with open(path, 'rb') as f:
+            if (state is not None and state.offset and stat.st_ino == state.signature[0]
+                    and stat.st_size >= state.offset and self._prefix_crc(f, state.offset) == state.crc):
+                # Append-only change: only the bytes after the last complete
+                # line need parsing
+                previous = state.partial
+                added = self._consume(state, f.read())
+                removed = Counter()
+                if previous:
+                    state.lines[previous] -= 1
+                    removed[previous] = 1
+                state.lines += Counter()  # drop zero counts
+                state.signature = signature
+                unchanged = added & removed
+                return added - unchanged, removed - unchanged
+            
+            f.seek(0)
+            fresh = _FileState()
+            self._consume(fresh, f.read())
+        fresh.signature = signature
+        self._files[path] = fresh
+        if state is None:
+            return fresh.lines, Counter()
+        return fresh.lines - state.lines, state.lines - fresh.lines
+    
+    @staticmethod
+    def _prefix_crc(f, size: int) -> int:
+        crc = 0
+        remaining = size
+        while remaining:
+            block = f.read(min(remaining, _HASH_BLOCK_SIZE))
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            remaining -= len(block)
+        return crc
+    
+    @staticmethod
+    def _consume(state: _FileState, data: bytes) -> Counter:
+        """Count the proxy lines in data, which continues the file at state.offset"""
+        end = data.rfind(b'\n') + 1
+        state.offset += end
+        state.crc = zlib.crc32(data[:end], state.crc)
+        added = Counter()
+        state.partial = ''
+        for raw in data.decode('utf-8', 'replace').splitlines():
+            line = raw.strip()
+            if line and not line.startswith('#'):
+                added[line] += 1
+        tail = data[end:].decode('utf-8', 'replace').strip()
+        if tail and not tail.startswith('#'):
+            state.partial = tail
+        state.lines.update(added)
+        return added
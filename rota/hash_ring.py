@@ -0,0 +1,192 @@
+"""
+Consistent-hash ring for sticky sessions in Rota
+Every healthy proxy owns a number of points on a 64-bit ring and a session key
+maps to the owner of the first point at or after its own hash, so a session
+keeps its exit proxy for as long as that proxy stays healthy. When a proxy
+leaves the pool only the sessions it owned move, and when one joins it takes
+over a matching share.
+"""
+
+import hashlib
+import struct
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from rota.proxy import Proxy
+
+
+# One 64-byte digest yields this many ring points
+_POINTS_PER_DIGEST = 8
+_POINTS = struct.Struct(f'<{_POINTS_PER_DIGEST}Q')
+
+# Points are stored in sorted blocks of about this size; a block that grows
+# past twice the size is split
+_BLOCK_SIZE = 1024
+
+# Past this many changes to one block, rebuild it rather than edit in place
+_BULK_CHANGES = 16
+
+
+def _ring_points(proxy: Proxy, replicas: int) -> List[int]:
+    """The proxy's points on the ring, stable across restarts"""
+    # Passwords are left out so rotating a proxy's password keeps its sessions
+    identity = f"{proxy.protocol}|{proxy.username or ''}|{proxy.address}"
+    points = []
+    for block in range(-(-replicas // _POINTS_PER_DIGEST)):
+        digest = hashlib.blake2b(f"{identity}#{block}".encode(), digest_size=64).digest()
+        points.extend(_POINTS.unpack(digest))
+    return points[:replicas]
+
+
+def session_point(key: str) -> int:
+    """Position of a session key on the ring"""
+    return struct.unpack('<Q', hashlib.blake2b(key.encode('utf-8', 'replace'), digest_size=8).digest())[0]
+
+
+def _split(points: List[int]) -> List[List[int]]:
+    if len(points) <= 2 * _BLOCK_SIZE:
+        return [points] if points else []
+    return [points[start:start + _BLOCK_SIZE] for start in range(0, len(points), _BLOCK_SIZE)]
+
+
+class HashRing:
+    """Consistent-hash ring over the healthy pool, with O(log n) lookups"""
+    
+    # Not thread-safe for updates: the proxy manager calls add(), remove()
+    # and publish() with its lock held, as it maintains the healthy set.
+    # Lookups take no lock; they read the last published (blocks, maxes)
+    # pair, which is never modified once published. Keeping points in
+    # sorted blocks means a change rewrites only the blocks it touches
+    # rather than the whole ring.
+    
+    def __init__(self, replicas: int = 16):
+        self.replicas = max(1, replicas)
+        # Nothing is hashed until the first session asks for the ring
+        self.active = False
+        self._members: Dict[Proxy, None] = {}
+        # point -> owning proxy, including changes not yet published
+        self._owners: Dict[int, Proxy] = {}
+        self._added: List[int] = []
+        self._removed: Set[int] = set()
+        self._blocks: List[List[int]] = []
+        # Last point of each block, for the first bisect of a lookup
+        self._maxes: List[int] = []
+        self._published: Tuple[List[List[int]], List[int]] = ([], [])
+    
+    def __len__(self) -> int:
+        return len(self._members)
+    
+    def activate(self, proxies: Iterable[Proxy]):
+        """Start maintaining the ring, seeded with the current healthy proxies"""
+        self.active = True
+        for proxy in proxies:
+            self.add(proxy)
+        self.publish()
+    
+    def add(self, proxy: Proxy):
+        """Give a proxy its points; visible to lookups after publish()"""
+        if not self.active:
+            return
+        owners = self._owners
+        for point in _ring_points(proxy, self.replicas):
+            owner = owners.get(point)
+            if owner is None:
+                owners[point] = proxy
+                self._added.append(point)
+            elif owner == proxy or point in self._removed:
+                # Back before its removal was published, a newer object for
+                # the same proxy, or the same proxy with a new password; it
+                # takes the point over
+                owners[point] = proxy
+                self._removed.discard(point)
+            # Otherwise a 64-bit collision; the earlier owner keeps the point
+        self._members[proxy] = None
+    
+    def remove(self, proxy: Proxy):
+        """Take a proxy's points away; its sessions move on publish()"""
+        if not self.active or proxy not in self._members:
+            return
+        del self._members[proxy]
+        owners = self._owners
+        for point in _ring_points(proxy, self.replicas):
+            if owners.get(point) == proxy:
+                self._removed.add(point)
+    
+    def publish(self):
+        """Apply pending changes and make them visible to lookups"""
+        if not self._added and not self._removed:
+            return
+        removed = self._removed
+        added = sorted(point for point in self._added if point not in removed)
+        blocks = self._blocks
+        maxes = self._maxes
+        
+        if not blocks:
+            new_blocks = _split(added)
+        else:
+            # Block index -> (points to delete, points to insert)
+            touched: Dict[int, Tuple[List[int], List[int]]] = {}
+            for point in removed:
+                index = bisect_left(maxes, point)
+                if index < len(blocks):
+                    touched.setdefault(index, ([], []))[0].append(point)
+            last = len(blocks) - 1
+            for point in added:
+                touched.setdefault(min(bisect_left(maxes, point), last), ([], []))[1].append(point)
+            
+            new_blocks = []
+            for index, block in enumerate(blocks):
+                changes = touched.get(index)
+                if changes is None:
+                    new_blocks.append(block)
+                    continue
+                deletes, inserts = changes
+                if len(deletes) + len(inserts) > _BULK_CHANGES:
+                    block = [point for point in block if point not in removed] if deletes else list(block)
+                    # Two sorted runs; sorted() merges them in linear time
+                    block = sorted(block + inserts)
+                else:
+                    # Published blocks are never modified; edit a copy
+                    block = list(block)
+                    for point in deletes:
+                        position = bisect_left(block, point)
+                        if position < len(block) and block[position] == point:
+                            del block[position]
+                    for point in inserts:
+                        insort(block, point)
+                new_blocks.extend(_split(block))
+        
+        self._blocks = new_blocks
+        self._maxes = [block[-1] for block in new_blocks]
+        # One assignment, so lookups see either the old or the new ring
+        self._published = (self._blocks, self._maxes)
+        for point in removed:
+            self._owners.pop(point, None)
+        self._added = []
+        self._removed = set()
+    
+    def get(self, key: str) -> Optional[Proxy]:
+        """Proxy owning a session key, or None when the ring is empty"""
+        point = session_point(key)
+        for _ in range(2):
+            blocks, maxes = self._published
+            if not blocks:
+                return None
+            index = bisect_left(maxes, point)
+            if index == len(blocks):
+                # Past the last point: wrap around to the first
+                owner_point = blocks[0][0]
+            else:
+                block = blocks[index]
+                owner_point = block[bisect_left(block, point)]
+            owner = self._owners.get(owner_point)
+            # None only if a publish removed the point after it was read
+            if owner is not None:
+                return owner
+        return None
+    
+    def get_stats(self) -> Dict:
+        return {
+            'session_ring_proxies': len(self._members),
+            'session_ring_points': sum(len(block) for block in self._published[0])
+        }
@@ -0,0 +1,104 @@
+"""
+Persistent proxy health state for Rota
+Health check results are kept in a local SQLite database so a restart can put
+recently checked proxies straight back into service instead of re-checking
+the whole pool.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, Optional, Tuple
+
+from rota.proxy import Proxy
+
+
+# (proxy, is_healthy, response_time, last_checked)
+HealthRecord = Tuple[Proxy, bool, Optional[float], float]
+
+
+class HealthCache:
+    """SQLite-backed store of the last health check result per proxy"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Written from health check threads, so one connection is shared
+        # behind a lock
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS proxy_health ("
+            " address TEXT NOT NULL,"
+            " protocol TEXT NOT NULL,"
+            " username TEXT,"
+            " password TEXT,"
+            " is_healthy INTEGER NOT NULL,"
+            " response_time REAL,"
+            " last_checked REAL NOT NULL)"
+        )
+        # One row per Proxy.key; missing credentials stay distinct from empty ones
+        self._db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS proxy_health_key ON proxy_health"
+            " (address, protocol, ifnull(username, char(0)), ifnull(password, char(0)))"
+        )
+        self._db.commit()
+        self.logger = logging.getLogger(__name__)
+    
+    def record(self, records: Iterable[HealthRecord]):
+        """Store the latest result for each proxy"""
+        rows = [
+            (proxy.address, proxy.protocol, proxy.username, proxy.password,
+             1 if healthy else 0, response_time, checked)
+            for proxy, healthy, response_time, checked in records
+        ]
+        if rows:
+            self._execute("INSERT OR REPLACE INTO proxy_health VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    
+    def load(self, checked_since: float) -> Iterator[HealthRecord]:
+        """Yield the results recorded at or after the given time"""
+        with self._lock:
+            if self._db is None:
+                return
+            rows = self._db.execute(
+                "SELECT address, protocol, username, password, is_healthy, response_time, last_checked"
+                " FROM proxy_health WHERE last_checked >= ?", (checked_since,)
+            ).fetchall()
+        for address, protocol, username, password, healthy, response_time, checked in rows:
+            proxy = Proxy(address=address, protocol=protocol, username=username, password=password)
+            yield proxy, bool(healthy), response_time, checked
+    
+    def forget(self, proxies: Iterable[Proxy]):
+        """Drop the stored results of proxies no longer in the pool"""
+        keys = [(proxy.address, proxy.protocol, proxy.username, proxy.password) for proxy in proxies]
+        if not keys:
+            return
+        self._execute(
+            "DELETE FROM proxy_health WHERE address = ? AND protocol = ?"
+            " AND ifnull(username, char(0)) = ifnull(?, char(0))"
+            " AND ifnull(password, char(0)) = ifnull(?, char(0))", keys
+        )
+    
+    def expire(self, checked_before: float):
+        """Drop results recorded before the given time"""
+        self._execute("DELETE FROM proxy_health WHERE last_checked < ?", [(checked_before,)])
+    
+    def _execute(self, statement: str, rows: list):
+        with self._lock:
+            if self._db is None:
+                return
+            try:
+                with self._db:
+                    self._db.executemany(statement, rows)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Failed to update health cache {self.path}: {e}")
+    
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
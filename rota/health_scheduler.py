@@ -0,0 +1,149 @@
+"""
+Adaptive health check scheduling for Rota
+Every proxy has its own next-check time in a priority queue. Proxies that keep
+failing back off exponentially, healthy ones carrying traffic are re-checked
+sooner, and a token bucket caps the overall probe rate.
+"""
+
+import heapq
+import random
+import time
+from typing import Callable, Dict, List
+
+from rota.proxy_store import ProxyStore
+
+
+# Heap entries are single ints, (due << _ROW_BITS) | row, which keeps the
+# queue at one small object per proxy and makes comparisons cheap
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+# Random spread applied to every interval so proxies checked together do not
+# stay in lockstep
+_JITTER = 0.1
+
+# Highest traffic speed-up: busy healthy proxies are checked at most this
+# many times as often as idle ones
+_MAX_TRAFFIC_FACTOR = 4
+
+
+class HealthScheduler:
+    """Priority queue of per-proxy next-check times over a ProxyStore"""
+    
+    # Not thread-safe: the proxy manager calls every method with its lock
+    # held. Due times are whole milliseconds since the scheduler was created,
+    # plus one, and live in the store's check_due column so they follow rows
+    # through compaction. Queue entries whose time no longer matches the
+    # column are stale and skipped when they surface.
+    
+    def __init__(self, store: ProxyStore, interval: float, max_backoff: float,
+                 max_rate: float, max_batch: int, clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self._clock = clock
+        self.interval = interval
+        self.max_backoff = max(max_backoff, interval)
+        # Token bucket bounding the probe rate; max_rate <= 0 means unlimited
+        self.max_rate = max_rate
+        self.max_batch = max(1, max_batch)
+        self._tokens = float(self.max_batch)
+        self._refilled_at = self._clock()
+        
+        self._epoch = time.time()
+        self._queue: List[int] = []
+        # Rows below this have been given a first due time
+        self._synced = 0
+        self._token = store.token
+        
+        self.scheduled = 0
+    
+    def take(self, now: float) -> List[int]:
+        """Pop the rows due for a check, as many as the probe budget allows"""
+        self._sync(now)
+        budget = self._refill()
+        if budget <= 0:
+            return []
+        
+        due_limit = self._due(now)
+        queue = self._queue
+        dues = self.store.check_dues()
+        rows = []
+        while queue and len(rows) < budget and queue[0] >> _ROW_BITS <= due_limit:
+            entry = heapq.heappop(queue)
+            row = entry & _ROW_MASK
+            if row >= len(dues) or dues[row] != entry >> _ROW_BITS:
+                continue
+            rows.append(row)
+            # Until its result comes back the row is due again one interval
+            # from now, so a probe whose result is lost is eventually retried
+            self._push(row, now + self.interval, self.store.check_schedule(row)[1])
+        
+        self._tokens -= len(rows)
+        self.scheduled += len(rows)
+        return rows
+    
+    def record(self, row: int, healthy: bool, requests: int, elapsed: float, now: float):
+        """Schedule a row's next check from the result of the one just done"""
+        if healthy:
+            failures = 0
+            interval = self.interval
+            if requests and elapsed > 0:
+                # Proxies carrying traffic are checked more often
+                interval /= min(_MAX_TRAFFIC_FACTOR, 1 + requests / elapsed)
+        else:
+            failures = self.store.check_schedule(row)[1] + 1
+            interval = min(self.interval * 2 ** min(failures - 1, 32), self.max_backoff)
+        interval *= random.uniform(1 - _JITTER, 1 + _JITTER)
+        self._push(row, now + interval, failures)
+    
+    def wait_time(self, now: float) -> float:
+        """Seconds until take() may return something"""
+        self._sync(now)
+        queue = self._queue
+        if not queue:
+            return self.interval
+        wait = ((queue[0] >> _ROW_BITS) - self._due(now)) / 1000
+        if self.max_rate > 0 and self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.max_rate)
+        return max(wait, 0.0)
+    
+    def get_stats(self) -> Dict:
+        return {'health_checks_scheduled_total': self.scheduled}
+    
+    def _push(self, row: int, when: float, failures: int):
+        due = self._due(when)
+        self.store.set_check_schedule(row, due, failures)
+        heapq.heappush(self._queue, (due << _ROW_BITS) | row)
+    
+    def _due(self, when: float) -> int:
+        return max(1, int((when - self._epoch) * 1000) + 1)
+    
+    def _refill(self) -> int:
+        """Whole probes the budget allows right now"""
+        if self.max_rate <= 0:
+            return self.max_batch
+        now = self._clock()
+        self._tokens = min(self.max_batch, self._tokens + (now - self._refilled_at) * self.max_rate)
+        self._refilled_at = now
+        return min(int(self._tokens), self.max_batch)
+    
+    def _sync(self, now: float):
+        """Queue rows added to the store since the last call, rebuilding after renumbering"""
+        store = self.store
+        if self._token is not store.token:
+            # Rows were renumbered, so every queued row number is wrong
+            dues = store.check_dues()
+            self._queue = [(due << _ROW_BITS) | row for row, due in enumerate(dues) if due]
+            heapq.heapify(self._queue)
+            self._token = store.token
+            self._synced = 0
+        
+        count = len(store)
+        dues = store.check_dues()
+        for row in range(self._synced, count):
+            if dues[row]:
+                continue
+            # Proxies restored from the health cache keep their last result
+            # for one interval; never-checked ones are due straight away
+            last_checked = store.last_checked(row)
+            self._push(row, last_checked + self.interval if last_checked else now, 0)
+        self._synced = count
@@ -0,0 +1,269 @@
+"""
+Metrics for Rota
+Counters and latency histograms recorded on the request path, exposed in the
+Prometheus text format on a separate admin listener.
+"""
+
+import asyncio
+import collections
+import http.client
+import http.server
+import logging
+import socket
+import ssl
+import threading
+from bisect import bisect_left
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from rota.socks import SocksError
+from rota.tunnel import TunnelError
+
+
+# Counter name -> (help text, label name or None)
+COUNTERS = {
+    'rota_requests_total': ("Client requests received", 'type'),
+    'rota_upstream_errors_total': ("Requests that failed at the upstream proxy, by error class", 'class'),
+    'rota_rate_limited_total': ("Requests rejected by the rate limiter", None),
+    'rota_health_checks_total': ("Health check probes completed, by result", 'result'),
+}
+
+# Histogram name -> (help text, bucket upper bounds in seconds)
+HISTOGRAMS = {
+    'rota_proxy_selection_seconds': (
+        "Time taken to pick a proxy and take a connection slot on it",
+        (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+    ),
+    'rota_upstream_latency_seconds': (
+        "Time from contacting the upstream proxy to its response headers or tunnel",
+        (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    ),
+}
+
+# Shards of finished threads are folded into the totals once this many new
+# ones have been registered, so per-connection threads do not pile up
+_COLLECT_EVERY = 1024
+
+
+def classify_error(error: Optional[BaseException]) -> str:
+    """Coarse class of an upstream failure, used as a metric label"""
+    if error is None:
+        return 'unknown'
+    if isinstance(error, (socket.timeout, asyncio.TimeoutError, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, ConnectionRefusedError):
+        return 'refused'
+    if isinstance(error, (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError)):
+        return 'reset'
+    if isinstance(error, socket.gaierror):
+        return 'dns'
+    if isinstance(error, ssl.SSLError):
+        return 'tls'
+    if isinstance(error, (SocksError, TunnelError)):
+        return 'proxy_protocol'
+    if isinstance(error, (http.client.HTTPException, ValueError)):
+        return 'protocol'
+    if isinstance(error, OSError):
+        return 'network'
+    return 'other'
+
+
+class _Shard:
+    """One thread's metric values"""
+    
+    __slots__ = ('counters', 'histograms')
+    
+    def __init__(self):
+        # (name, label value) -> count
+        self.counters: Dict[Tuple[str, Optional[str]], float] = {}
+        # name -> [per-bucket counts..., +Inf count, sum]
+        self.histograms: Dict[str, List[float]] = {}
+    
+    def merge(self, other: '_Shard'):
+        counters = self.counters
+        for key, value in other.counters.copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for name, values in other.histograms.copy().items():
+            values = list(values)
+            mine = self.histograms.get(name)
+            if mine is None:
+                self.histograms[name] = values
+            else:
+                for index, value in enumerate(values):
+                    mine[index] += value
+
+
+class Metrics:
+    """Registry of counters and histograms sharded per thread"""
+    
+    # Recording touches only the calling thread's shard, so the request path
+    # never takes a lock and threads never contend on a shared value. A
+    # scrape adds up the shards of live threads and the folded totals of
+    # finished ones.
+    
+    def __init__(self):
+        self._local = threading.local()
+        # Shards waiting to be picked up by a collection; deque appends are
+        # atomic, so registering a thread takes no lock either
+        self._new_shards: Deque[Tuple[threading.Thread, _Shard]] = collections.deque()
+        # Guards _shards and _retired; taken by scrapes and collections only
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, _Shard]] = []
+        self._retired = _Shard()
+    
+    def inc(self, name: str, label: Optional[str] = None, amount: float = 1):
+        """Add to a counter"""
+        counters = self._shard().counters
+        key = (name, label)
+        counters[key] = counters.get(key, 0) + amount
+    
+    def observe(self, name: str, value: float):
+        """Record a value in a histogram"""
+        histograms = self._shard().histograms
+        values = histograms.get(name)
+        bounds = HISTOGRAMS[name][1]
+        if values is None:
+            values = histograms[name] = [0] * (len(bounds) + 2)
+        values[bisect_left(bounds, value)] += 1
+        values[-1] += value
+    
+    def snapshot(self) -> _Shard:
+        """Totals across all threads"""
+        with self._lock:
+            self._collect()
+            total = _Shard()
+            total.merge(self._retired)
+            for _, shard in self._shards:
+                total.merge(shard)
+        return total
+    
+    def count(self, name: str) -> float:
+        """Total of a counter across all its labels"""
+        return sum(value for (metric, _), value in self.snapshot().counters.items() if metric == name)
+    
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """All metrics, plus the given gauges, in the Prometheus text format"""
+        total = self.snapshot()
+        lines = []
+        for name, (description, label) in COUNTERS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            values = sorted(
+                (key[1], value) for key, value in total.counters.items() if key[0] == name
+            )
+            if label is None:
+                lines.append(f"{name} {_number(sum(value for _, value in values))}")
+            else:
+                for label_value, value in values:
+                    lines.append(f'{name}{{{label}="{_escape(label_value)}"}} {_number(value)}')
+        
+        for name, (description, bounds) in HISTOGRAMS.items():
+            values = total.histograms.get(name) or [0] * (len(bounds) + 2)
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(bounds, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            cumulative += values[-2]
+            lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum {_number(values[-1])}")
+            lines.append(f"{name}_count {cumulative}")
+        
+        for name, value in (gauges or {}).items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE rota_{name} gauge")
+            lines.append(f"rota_{name} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+    
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            self._new_shards.append((threading.current_thread(), shard))
+            if len(self._new_shards) >= _COLLECT_EVERY and self._lock.acquire(blocking=False):
+                try:
+                    self._collect()
+                finally:
+                    self._lock.release()
+            return shard
+    
+    def _collect(self):
+        """Adopt newly registered shards and fold those of finished threads (lock must be held)"""
+        while self._new_shards:
+            self._shards.append(self._new_shards.popleft())
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                # The thread can no longer write to it
+                self._retired.merge(shard)
+        self._shards = live
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: Optional[str]) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsServer:
+    """Admin HTTP listener serving the metrics in the Prometheus text format"""
+    
+    def __init__(self, metrics: Metrics, host: str, port: int, path: str = '/metrics',
+                 gauges: Optional[Callable[[], Dict[str, float]]] = None):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.path = path
+        # Supplies point-in-time values such as pool sizes, e.g. a server's get_stats
+        self.gauges = gauges
+        self.server: Optional[http.server.ThreadingHTTPServer] = None
+        self.server_thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+    
+    def start(self):
+        """Start serving on a background thread"""
+        owner = self
+        
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != owner.path:
+                    self.send_error(404)
+                    return
+                try:
+                    body = owner.render().encode()
+                except Exception as e:
+                    owner.logger.warning(f"Failed to render metrics: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                owner.logger.debug(format % args)
+        
+        self.server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name="rota-metrics",
+                                              daemon=True)
+        self.server_thread.start()
+        self.logger.info(f"Metrics available at http://{self.host}:{self.port}{self.path}")
+    
+    def render(self) -> str:
+        return self.metrics.render(self.gauges() if self.gauges else None)
+    
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.server_thread:
+            self.server_thread.join(timeout=5)
@@ -2,27 +2,46 @@
 Proxy data class for Rota
 """
 
+import base64
+import sys
 import time
 from typing import Optional
-from dataclasses import dataclass
 
 
-@dataclass
 class Proxy:
     """Proxy representation"""
-    address: str
-    protocol: str  # http, socks4, socks5
-    username: Optional[str] = None
-    password: Optional[str] = None
-    last_checked: Optional[float] = None
-    is_healthy: bool = False
-    response_time: Optional[float] = None
-    connection_count: int = 0
-    added_at: float = None
-    
-    def __post_init__(self):
-        if self.added_at is None:
-            self.added_at = time.time()
+    
+    # Slotted rather than a dataclass so the objects ProxyStore builds on
+    # demand stay small. address, protocol, username and password form the
+    # identity; the hash is computed once, so they must not be changed after
+    # construction.
+    __slots__ = ('address', 'protocol', 'username', 'password', 'last_checked', 'is_healthy',
+                 'response_time', 'connection_count', 'added_at', 'requests_since_check',
+                 '_hash', '_token', '_row')
+    
+    _FIELDS = ('address', 'protocol', 'username', 'password', 'last_checked', 'is_healthy',
+               'response_time', 'connection_count', 'added_at')
+    
+    def __init__(self, address: str, protocol: str, username: Optional[str] = None,
+                 password: Optional[str] = None, last_checked: Optional[float] = None,
+                 is_healthy: bool = False, response_time: Optional[float] = None,
+                 connection_count: int = 0, added_at: Optional[float] = None):
+        self.address = address
+        # A handful of distinct values shared by every proxy
+        self.protocol = sys.intern(protocol)  # http, socks4, socks5
+        self.username = username
+        self.password = password
+        self.last_checked = last_checked
+        self.is_healthy = is_healthy
+        self.response_time = response_time
+        self.connection_count = connection_count
+        self.added_at = time.time() if added_at is None else added_at
+        # Requests routed through the proxy since its last health check
+        self.requests_since_check = 0
+        self._hash = hash((address, self.protocol, username, password))
+        # Row cache set by the ProxyStore holding this proxy
+        self._token = None
+        self._row = -1
     
     def to_url(self) -> str:
         """Convert proxy to URL format"""
@@ -33,16 +52,31 @@ class Proxy:
         
         return f"{self.protocol}://{auth}{self.address}"
     
+    def proxy_authorization(self) -> Optional[str]:
+        """Value for a Proxy-Authorization header, if the proxy has credentials"""
+        if not self.username:
+            return None
+        credentials = f"{self.username}:{self.password or ''}".encode()
+        return f"Basic {base64.b64encode(credentials).decode()}"
+    
     def __str__(self) -> str:
         return self.to_url()
     
+    @property
+    def key(self) -> tuple:
+        """Canonical identity: protocol, address and credentials"""
+        return (self.address, self.protocol, self.username, self.password)
+    
     def __hash__(self):
-        return hash((self.address, self.protocol, self.username, self.password))
+        return self._hash
     
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, Proxy):
             return False
-        return (self.address == other.address and 
-                self.protocol == other.protocol and 
-                self.username == other.username and 
-                self.password == other.password)
\ No newline at end of file
+        return self._hash == other._hash and self.key == other.key
+    
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self._FIELDS)
+        return f"Proxy({fields})"
\ No newline at end of file
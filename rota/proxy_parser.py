@@ -0,0 +1,147 @@
+"""
+Proxy list parsing for Rota
+Whole files are parsed in one pass: lines are de-duplicated before parsing
+and proxies after normalisation, so no Proxy objects are built for
+duplicates and malformed lines are reported once per file.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+
+SUPPORTED_PROTOCOLS = frozenset(('http', 'https', 'socks4', 'socks5'))
+
+# Same layout as Proxy.key: (address, protocol, username, password)
+ProxyKey = Tuple[str, str, Optional[str], Optional[str]]
+
+# Malformed lines quoted in a report
+MAX_SAMPLES = 5
+
+
+class ParseReport:
+    """Summary of one parsed proxy list"""
+    
+    __slots__ = ('lines', 'duplicates', 'malformed', 'samples')
+    
+    def __init__(self):
+        # Non-blank, non-comment lines
+        self.lines = 0
+        # Lines naming a proxy already listed earlier
+        self.duplicates = 0
+        # Reason -> number of malformed lines
+        self.malformed: Counter = Counter()
+        self.samples: List[str] = []
+    
+    @property
+    def malformed_count(self) -> int:
+        return sum(self.malformed.values())
+    
+    def describe_malformed(self) -> str:
+        """One-line summary of the malformed lines, e.g. for a log message"""
+        reasons = ', '.join(f"{count} {reason}" for reason, count in self.malformed.most_common())
+        samples = ', '.join(repr(line) for line in self.samples)
+        return f"{self.malformed_count} malformed lines ({reasons}); e.g. {samples}"
+
+
+# Canonical port strings; anything else is validated and normalised the slow way
+_PORTS = frozenset(str(port) for port in range(1, 65536))
+
+# What parse_proxy_line() returns for a line it rejects
+Malformed = Tuple[None, str, str]
+
+
+def parse_proxy_line(line: str) -> Union[ProxyKey, Malformed]:
+    """Parse one stripped proxy line into a normalised key, or (None, reason, line)"""
+    # Accepted formats:
+    #   protocol://[user[:password]@]host:port
+    #   protocol:host:port[:user[:password]]
+    #   [user[:password]@]host:port
+    #   host:port[:user:password]
+    # Called once per line of very large files, so the common cases are kept
+    # free of helper calls
+    username = password = None
+    scheme, sep, rest = line.partition('://')
+    if sep:
+        protocol = scheme if scheme in SUPPORTED_PROTOCOLS else scheme.lower()
+        if protocol not in SUPPORTED_PROTOCOLS:
+            return None, "unsupported protocol", line
+        if '@' in rest:
+            auth, _, rest = rest.rpartition('@')
+            username, sep, password = auth.partition(':')
+            if not sep:
+                password = None
+        host, sep, port = rest.rstrip('/').rpartition(':')
+        if not sep:
+            return None, "missing port", line
+    elif '@' in line or line[0] == '[':
+        protocol = 'http'
+        auth, _, rest = line.rpartition('@')
+        if auth:
+            username, sep, password = auth.partition(':')
+            if not sep:
+                password = None
+        host, sep, port = rest.rpartition(':')
+        if not sep:
+            return None, "missing port", line
+    else:
+        parts = line.split(':')
+        count = len(parts)
+        if count == 2:
+            protocol = 'http'
+            host, port = parts
+        elif count == 1:
+            return None, "missing port", line
+        else:
+            head = parts[0].lower()
+            if head in SUPPORTED_PROTOCOLS:
+                protocol = head
+                host, port = parts[1], parts[2]
+                if count > 3:
+                    username = parts[3]
+                    password = ':'.join(parts[4:]) if count > 4 else None
+            elif count >= 4:
+                protocol = 'http'
+                host, port = parts[0], parts[1]
+                username, password = parts[2], ':'.join(parts[3:])
+            else:
+                return None, "unrecognised format", line
+    
+    if port not in _PORTS:
+        if not (port.isascii() and port.isdigit()) or not 0 < int(port) < 65536:
+            return None, "invalid port", line
+        port = str(int(port))
+    if not host:
+        return None, "missing host", line
+    if ':' in host and not (host[0] == '[' and host[-1] == ']'):
+        return None, "unbracketed IPv6 host", line
+    if protocol == 'https':
+        # Lists tag CONNECT-capable HTTP proxies "https"; they speak plain
+        # HTTP like any other, so they are stored, probed and used as http
+        protocol = 'http'
+    return f"{host.lower()}:{port}", protocol, username, password
+
+
+def parse_proxy_lines(lines: Iterable[str]) -> Tuple[List[ProxyKey], ParseReport]:
+    """Parse proxy lines into unique keys in first-seen order, with a report"""
+    report = ParseReport()
+    entries = [line for line in map(str.strip, lines) if line and line[0] != '#']
+    report.lines = len(entries)
+    # Counting the parsed keys de-duplicates them without building any Proxy
+    counts = Counter(map(parse_proxy_line, entries))
+    keys = []
+    for key, count in counts.items():
+        if key[0] is None:
+            report.malformed[key[1]] += count
+            if len(report.samples) < MAX_SAMPLES:
+                report.samples.append(key[2])
+        else:
+            keys.append(key)
+    report.duplicates = report.lines - report.malformed_count - len(keys)
+    return keys, report
+
+
+def read_proxy_file(path: str) -> Tuple[List[ProxyKey], ParseReport]:
+    """Parse a proxy list file, read in a single block"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return parse_proxy_lines(data.decode('utf-8', 'replace').splitlines())
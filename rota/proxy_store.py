@@ -0,0 +1,425 @@
+"""
+Compact proxy pool storage for Rota
+Proxies are kept as packed columns rather than one object each, so pools of
+hundreds of thousands of mostly dead proxies stay small. Proxy objects are
+built on demand; the ones in rotation are pinned so every caller shares them.
+"""
+
+import math
+import socket
+from array import array
+from collections.abc import Sequence
+from itertools import accumulate, compress
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from rota.proxy import Proxy
+
+
+# Column value standing in for a missing response time
+_MISSING = math.nan
+
+RowKey = Union[int, tuple]
+
+# Fibonacci hashing: the top bits of the 64-bit product pick a table slot
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+
+class ProxyStore(Sequence):
+    """Column-oriented proxy pool with O(1) de-duplication by identity"""
+    
+    def __init__(self):
+        # Dense columns, one entry per row. IPv4 addresses are packed into
+        # _hosts/_ports; anything else goes to the sparse _addresses column
+        self._hosts = array('I')
+        self._ports = array('H')
+        self._protocols = bytearray()
+        self._healthy = bytearray()
+        self._last_checked = array('d')  # 0.0 when never checked
+        self._response_time = array('d')  # NaN when unknown
+        self._added_at = array('d')
+        # Health check schedule kept for the HealthScheduler: when the next
+        # check is due (0 when unscheduled) and consecutive failed checks
+        self._check_due = array('q')
+        self._check_failures = bytearray()
+        # Sparse columns. _credentials holds the row's tuple key, whose last
+        # two items are the username and password
+        self._addresses: Dict[int, str] = {}
+        self._credentials: Dict[int, tuple] = {}
+        self._protocol_names: List[str] = []
+        self._protocol_codes: Dict[str, int] = {}
+        # Identity -> row. Packed proxies without credentials, normally nearly
+        # all of them, are found through an open-addressing table of row
+        # numbers (8 bytes a slot) whose keys are recomputed from the columns;
+        # the rest go in an ordinary dict
+        self._new_table(8)
+        self._table_used = 0
+        self._rows: Dict[tuple, int] = {}
+        # Row -> the Proxy object everyone shares while it is in rotation
+        self._pinned: Dict[int, Proxy] = {}
+        # Replaced whenever rows are renumbered; a row cached on a Proxy is
+        # only trusted while the proxy carries the current token
+        self._token = object()
+    
+    def __len__(self) -> int:
+        return len(self._ports)
+    
+    @property
+    def token(self) -> object:
+        """Opaque value that changes whenever rows are renumbered"""
+        return self._token
+    
+    def __getitem__(self, index: int) -> Proxy:
+        if not isinstance(index, int):
+            raise TypeError("ProxyStore indices must be integers")
+        if index < 0:
+            index += len(self._ports)
+        if not 0 <= index < len(self._ports):
+            raise IndexError("ProxyStore index out of range")
+        return self.materialize(index)
+    
+    def __iter__(self) -> Iterator[Proxy]:
+        for row in range(len(self._ports)):
+            yield self.materialize(row)
+    
+    def __contains__(self, proxy) -> bool:
+        return isinstance(proxy, Proxy) and self.row_of(proxy) is not None
+    
+    def add(self, proxy: Proxy, added_at: Optional[float] = None) -> bool:
+        """Store a proxy unless an identical one is present; returns whether it was added"""
+        if added_at is None:
+            added_at = proxy.added_at
+        row = self._append(proxy.key, proxy.is_healthy, proxy.last_checked, proxy.response_time, added_at)
+        if row is None:
+            return False
+        proxy.added_at = added_at
+        proxy._token, proxy._row = self._token, row
+        return True
+    
+    def extend(self, keys: Iterable[tuple], added_at: float) -> int:
+        """Store never-checked proxies given by Proxy.key without building objects; returns how many were new"""
+        # The bulk-load path for files of millions of lines: the row lookup
+        # and table insertion of _append() are inlined and the columns are
+        # extended once at the end
+        keys = list(keys)
+        self._reserve(len(keys))
+        table, shift = self._table, self._table_shift
+        mask = len(table) - 1
+        inet_pton, af_inet = socket.inet_pton, socket.AF_INET
+        start = len(self._ports)
+        hosts, ports, protocols = [], [], bytearray()
+        # Packed keys of the rows added so far, which are not in the columns yet
+        batch_keys = []
+        codes = {}
+        
+        for key in keys:
+            address, protocol, username, password = key
+            code = codes.get(protocol)
+            if code is None:
+                code = codes[protocol] = self._protocol_code(protocol)
+            row = start + len(ports)
+            host, _, port = address.rpartition(':')
+            try:
+                packed_host = int.from_bytes(inet_pton(af_inet, host), 'big')
+                port_number = int(port)
+                packs = 0 <= port_number <= 0xFFFF and f"{host}:{port_number}" == address
+            except (OSError, ValueError):
+                packs = False
+            
+            if not packs or username is not None or password is not None:
+                row_key = self._identify(key, register=True)[0]
+                if row_key in self._rows:
+                    continue
+                self._rows[row_key] = row
+                if not packs:
+                    packed_host = port_number = 0
+                    self._addresses[row] = address
+                if username is not None or password is not None:
+                    self._credentials[row] = row_key
+                batch_keys.append(-1)
+            else:
+                row_key = (packed_host << 24) | (port_number << 8) | code
+                slot = ((row_key * _HASH_MULTIPLIER) & _MASK_64) >> shift
+                while table[slot]:
+                    other = table[slot] - 1
+                    if (batch_keys[other - start] if other >= start else self._packed_key(other)) == row_key:
+                        break
+                    slot = (slot + 1) & mask
+                else:
+                    table[slot] = row + 1
+                    self._table_used += 1
+                    batch_keys.append(row_key)
+                    hosts.append(packed_host)
+                    ports.append(port_number)
+                    protocols.append(code)
+                continue
+            hosts.append(packed_host)
+            ports.append(port_number)
+            protocols.append(code)
+        
+        added = len(ports)
+        self._hosts.extend(hosts)
+        self._ports.extend(ports)
+        self._protocols += protocols
+        self._healthy += bytes(added)
+        self._last_checked.extend(array('d', [0.0]) * added)
+        self._response_time.extend(array('d', [_MISSING]) * added)
+        self._added_at.extend(array('d', [added_at]) * added)
+        self._check_due.extend(array('q', [0]) * added)
+        self._check_failures += bytes(added)
+        return added
+    
+    def _append(self, key: tuple, healthy: bool, last_checked: Optional[float],
+                response_time: Optional[float], added_at: float) -> Optional[int]:
+        """Add a row for a proxy key unless it is present; returns the new row"""
+        row_key, host, port, packed = self._identify(key, register=True)
+        if self._find(row_key) is not None:
+            return None
+        
+        row = len(self._ports)
+        self._hosts.append(host)
+        self._ports.append(port)
+        self._protocols.append(self._protocol_code(key[1]))
+        self._healthy.append(1 if healthy else 0)
+        self._last_checked.append(last_checked or 0.0)
+        self._response_time.append(_MISSING if response_time is None else response_time)
+        self._added_at.append(added_at)
+        self._check_due.append(0)
+        self._check_failures.append(0)
+        if not packed:
+            self._addresses[row] = key[0]
+        if isinstance(row_key, int):
+            self._insert(row)
+        else:
+            self._rows[row_key] = row
+            if key[2] is not None or key[3] is not None:
+                self._credentials[row] = row_key
+        return row
+    
+    def remove(self, proxies: Iterable[Proxy]) -> List[Proxy]:
+        """Drop proxies by identity in one compaction pass, returning the stored objects removed"""
+        dead = set()
+        removed = []
+        for proxy in proxies:
+            row = self.row_of(proxy)
+            if row is None or row in dead:
+                continue
+            dead.add(row)
+            removed.append(self._pinned.get(row, proxy))
+        if dead:
+            self._compact(dead)
+        return removed
+    
+    def row_of(self, proxy: Proxy) -> Optional[int]:
+        """Row holding this proxy's identity, or None if it is not stored"""
+        if proxy._token is self._token:
+            return proxy._row
+        row = self._find(self._identify(proxy.key)[0])
+        if row is not None:
+            proxy._token, proxy._row = self._token, row
+        return row
+    
+    def materialize(self, row: int) -> Proxy:
+        """The pinned Proxy for a row, or a new one built from its columns"""
+        pinned = self._pinned.get(row)
+        if pinned is not None:
+            return pinned
+        
+        address = self._addresses.get(row)
+        if address is None:
+            address = f"{socket.inet_ntoa(self._hosts[row].to_bytes(4, 'big'))}:{self._ports[row]}"
+        credentials = self._credentials.get(row)
+        username, password = credentials[-2:] if credentials else (None, None)
+        response_time = self._response_time[row]
+        proxy = Proxy(
+            address=address,
+            protocol=self._protocol_names[self._protocols[row]],
+            username=username,
+            password=password,
+            last_checked=self._last_checked[row] or None,
+            is_healthy=bool(self._healthy[row]),
+            response_time=None if math.isnan(response_time) else response_time,
+            added_at=self._added_at[row]
+        )
+        proxy._token, proxy._row = self._token, row
+        return proxy
+    
+    def canonical(self, proxy: Proxy) -> Optional[Proxy]:
+        """The object callers should update for this proxy: its pinned copy, itself, or None if not stored"""
+        row = self.row_of(proxy)
+        if row is None:
+            return None
+        return self._pinned.get(row, proxy)
+    
+    def save(self, proxy: Proxy):
+        """Write a proxy's health fields back to its row"""
+        row = self.row_of(proxy)
+        if row is None:
+            return
+        self._healthy[row] = 1 if proxy.is_healthy else 0
+        self._last_checked[row] = proxy.last_checked or 0.0
+        self._response_time[row] = _MISSING if proxy.response_time is None else proxy.response_time
+    
+    def pin(self, proxy: Proxy):
+        """Make this object the one materialize() returns for its row"""
+        row = self.row_of(proxy)
+        if row is not None:
+            self._pinned[row] = proxy
+    
+    def unpin(self, proxy: Proxy):
+        """Let the row fall back to its columns"""
+        row = self.row_of(proxy)
+        if row is not None and self._pinned.get(row) is proxy:
+            self.save(proxy)
+            del self._pinned[row]
+    
+    def stale_rows(self, checked_before: float) -> List[int]:
+        """Rows last checked before the given time (or never)"""
+        return [row for row, checked in enumerate(self._last_checked) if checked < checked_before]
+    
+    def expired_rows(self, added_before: float) -> List[int]:
+        """Unhealthy rows added at or before the given time"""
+        return [
+            row for row, (healthy, added_at) in enumerate(zip(self._healthy, self._added_at))
+            if not healthy and added_at <= added_before
+        ]
+    
+    def last_checked(self, row: int) -> float:
+        """When a row was last checked, 0.0 if never"""
+        return self._last_checked[row]
+    
+    def check_schedule(self, row: int) -> Tuple[int, int]:
+        """A row's (next check due, consecutive failed checks)"""
+        return self._check_due[row], self._check_failures[row]
+    
+    def set_check_schedule(self, row: int, due: int, failures: int):
+        self._check_due[row] = due
+        self._check_failures[row] = min(failures, 0xFF)
+    
+    def check_dues(self) -> array:
+        """The next-check-due column, indexed by row; not to be modified"""
+        return self._check_due
+    
+    def _identify(self, key: tuple, register: bool = False) -> Tuple[RowKey, int, int, bool]:
+        """Return (row key, packed host, port, whether the address packs) for a Proxy.key"""
+        address, protocol, username, password = key
+        host, _, port = address.rpartition(':')
+        try:
+            packed_host = int.from_bytes(socket.inet_pton(socket.AF_INET, host), 'big')
+            port_number = int(port)
+        except (OSError, ValueError):
+            return key, 0, 0, False
+        # Only pack addresses that format back to exactly the same string
+        if not 0 <= port_number <= 0xFFFF or f"{host}:{port_number}" != address:
+            return key, 0, 0, False
+        if username is not None or password is not None:
+            # The address string is not kept, so the key carries the packed form
+            return ((packed_host << 16) | port_number, protocol, username, password), packed_host, port_number, True
+        if register:
+            code = self._protocol_code(protocol)
+        else:
+            code = self._protocol_codes.get(protocol)
+            if code is None:
+                # No stored proxy uses this protocol, so any unmatched key will do
+                return key, packed_host, port_number, True
+        return (packed_host << 24) | (port_number << 8) | code, packed_host, port_number, True
+    
+    def _packed_key(self, row: int) -> int:
+        return (self._hosts[row] << 24) | (self._ports[row] << 8) | self._protocols[row]
+    
+    def _find(self, key: RowKey) -> Optional[int]:
+        """Row stored under key, or None"""
+        if not isinstance(key, int):
+            return self._rows.get(key)
+        table = self._table
+        mask = len(table) - 1
+        slot = ((key * _HASH_MULTIPLIER) & _MASK_64) >> self._table_shift
+        while table[slot]:
+            row = table[slot] - 1
+            if self._packed_key(row) == key:
+                return row
+            slot = (slot + 1) & mask
+        return None
+    
+    def _insert(self, row: int):
+        """Add a packed row to the row table, growing it to stay at most half full"""
+        self._reserve(1)
+        self._place(row)
+        self._table_used += 1
+    
+    def _reserve(self, count: int):
+        """Grow the row table ahead of inserting up to count packed rows"""
+        size = len(self._table)
+        while (self._table_used + count) * 2 > size:
+            size *= 2
+        if size != len(self._table):
+            self._rebuild_table(size)
+    
+    def _place(self, row: int):
+        table = self._table
+        mask = len(table) - 1
+        slot = ((self._packed_key(row) * _HASH_MULTIPLIER) & _MASK_64) >> self._table_shift
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = row + 1
+    
+    def _new_table(self, size: int):
+        self._table = array('q', bytes(8 * size))
+        self._table_shift = 64 - (size.bit_length() - 1)
+    
+    def _rebuild_table(self, size: int):
+        rows = [row - 1 for row in self._table if row]
+        self._new_table(size)
+        for row in rows:
+            self._place(row)
+    
+    def _protocol_code(self, protocol: str) -> int:
+        code = self._protocol_codes.get(protocol)
+        if code is None:
+            code = len(self._protocol_names)
+            if code > 0xFF:
+                raise ValueError("Too many distinct proxy protocols")
+            self._protocol_names.append(protocol)
+            self._protocol_codes[protocol] = code
+        return code
+    
+    def _compact(self, dead: set):
+        """Remove dead rows and renumber the rest"""
+        count = len(self._ports)
+        alive = bytearray(b'\x01') * count
+        for row in dead:
+            alive[row] = 0
+        # new_rows[row] is the row's number after compaction (for live rows)
+        new_rows = [position - 1 for position in accumulate(alive)]
+        
+        self._hosts = array('I', compress(self._hosts, alive))
+        self._ports = array('H', compress(self._ports, alive))
+        self._protocols = bytearray(compress(self._protocols, alive))
+        self._healthy = bytearray(compress(self._healthy, alive))
+        self._last_checked = array('d', compress(self._last_checked, alive))
+        self._response_time = array('d', compress(self._response_time, alive))
+        self._added_at = array('d', compress(self._added_at, alive))
+        self._check_due = array('q', compress(self._check_due, alive))
+        self._check_failures = bytearray(compress(self._check_failures, alive))
+        self._addresses = {new_rows[row]: value for row, value in self._addresses.items() if alive[row]}
+        self._credentials = {new_rows[row]: value for row, value in self._credentials.items() if alive[row]}
+        self._rows = {key: new_rows[row] for key, row in self._rows.items() if alive[row]}
+        packed_rows = [new_rows[row - 1] for row in self._table if row and alive[row - 1]]
+        size = 8
+        while len(packed_rows) * 2 > size:
+            size <<= 1
+        self._new_table(size)
+        self._table_used = len(packed_rows)
+        for row in packed_rows:
+            self._place(row)
+        
+        # Detached proxies holding the old token fall back to a key lookup
+        self._token = object()
+        pinned = {}
+        for row, proxy in self._pinned.items():
+            if alive[row]:
+                proxy._token, proxy._row = self._token, new_rows[row]
+                pinned[proxy._row] = proxy
+            else:
+                proxy._token, proxy._row = None, -1
+        self._pinned = pinned
@@ -0,0 +1,91 @@
+"""
+Per-client rate limiting for Rota
+"""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, List
+
+
+class TokenBucketRateLimiter:
+    """Token buckets per client, refilled at a steady rate up to a burst capacity"""
+    
+    def __init__(self, requests_per_minute: float, burst_capacity: int, stripes: int = 64,
+                 clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst_capacity)
+        # A bucket left alone this long is full again, so dropping it loses nothing
+        self.idle_timeout = max(1.0, self.capacity / self.rate) if self.rate > 0 else 3600.0
+        
+        # Clients are spread over independently locked stripes so concurrent
+        # requests from different clients rarely contend
+        size = 1
+        while size < stripes:
+            size <<= 1
+        self._mask = size - 1
+        self._locks = [threading.Lock() for _ in range(size)]
+        # key -> [tokens, last refill time]
+        self._buckets: List[Dict[Hashable, List[float]]] = [{} for _ in range(size)]
+        self._last_sweep = [clock()] * size
+        self._rejected = [0] * size
+    
+    def acquire(self, key: Hashable) -> float:
+        """Take a token for key; returns 0 if allowed, otherwise seconds until one is available"""
+        stripe = hash(key) & self._mask
+        now = self._clock()
+        with self._locks[stripe]:
+            buckets = self._buckets[stripe]
+            if now - self._last_sweep[stripe] >= self.idle_timeout:
+                self._last_sweep[stripe] = now
+                self._evict(buckets, now)
+            
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [float(self.capacity), now]
+            else:
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            self._rejected[stripe] += 1
+            if self.rate <= 0:
+                return math.inf
+            return (1 - bucket[0]) / self.rate
+    
+    def evict_idle(self) -> int:
+        """Drop buckets that have refilled completely"""
+        evicted = 0
+        now = self._clock()
+        for stripe, lock in enumerate(self._locks):
+            with lock:
+                self._last_sweep[stripe] = now
+                evicted += self._evict(self._buckets[stripe], now)
+        return evicted
+    
+    def _evict(self, buckets: Dict[Hashable, List[float]], now: float) -> int:
+        cutoff = now - self.idle_timeout
+        idle = [key for key, bucket in buckets.items() if bucket[1] <= cutoff]
+        for key in idle:
+            del buckets[key]
+        return len(idle)
+    
+    def __len__(self) -> int:
+        return sum(len(buckets) for buckets in self._buckets)
+    
+    def get_stats(self) -> Dict:
+        """Get rate limiter statistics"""
+        return {
+            'rate_limited_clients': len(self),
+            'rate_limit_rejections': sum(self._rejected)
+        }
+    
+    @staticmethod
+    def retry_after(wait: float) -> str:
+        """Format a wait in seconds as a Retry-After header value"""
+        if math.isinf(wait):
+            return '3600'
+        return str(max(1, math.ceil(wait)))
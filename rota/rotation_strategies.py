@@ -2,26 +2,32 @@
 Proxy rotation strategies for Rota
 """
 
+import itertools
 import random
+import threading
 import time
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
 from dataclasses import dataclass
-from enum import Enum
 
+from rota.config import RotationStrategy
 from rota.proxy import Proxy
 
 
-class RotationStrategy(Enum):
-    """Available proxy rotation strategies"""
-    RANDOM = "random"
-    ROUND_ROBIN = "roundrobin"
-    LEAST_CONNECTIONS = "least_conn"
-    TIME_BASED = "time_based"
+# Global state for round-robin rotation. next() on itertools.count is a
+# single C call, so concurrent callers each get a distinct ticket without
+# a lock.
+_round_robin_counter = itertools.count()
 
+# Weight of a new sample in a proxy's smoothed latency
+LATENCY_EWMA_WEIGHT = 0.3
 
-# Global state for round-robin rotation
-_round_robin_index = 0
-_round_robin_lock = None
+
+def ewma_latency(previous: Optional[float], sample: float) -> float:
+    """Fold a latency sample into a proxy's exponentially weighted latency"""
+    if previous is None:
+        return sample
+    return previous + LATENCY_EWMA_WEIGHT * (sample - previous)
 
 
 def get_random_proxy(proxies: List[Proxy]) -> Optional[Proxy]:
@@ -31,31 +37,24 @@ def get_random_proxy(proxies: List[Proxy]) -> Optional[Proxy]:
     return random.choice(proxies)
 
 
-def get_round_robin_proxy(proxies: List[Proxy]) -> Optional[Proxy]:
+def get_round_robin_proxy(proxies: Sequence[Proxy]) -> Optional[Proxy]:
     """Select proxies in round-robin fashion"""
-    global _round_robin_index
-    
     if not proxies:
         return None
     
-    proxy = proxies[_round_robin_index % len(proxies)]
-    _round_robin_index += 1
-    
-    return proxy
+    return proxies[next(_round_robin_counter) % len(proxies)]
 
 
-def get_least_connections_proxy(proxies: List[Proxy]) -> Optional[Proxy]:
+def get_least_connections_proxy(proxies: Sequence[Proxy]) -> Optional[Proxy]:
     """Select proxy with least number of active connections"""
     if not proxies:
         return None
     
-    # Sort by connection count, then by response time
-    sorted_proxies = sorted(
+    # Lowest connection count, then lowest response time
+    return min(
         proxies,
         key=lambda p: (p.connection_count, p.response_time or float('inf'))
     )
-    
-    return sorted_proxies[0]
 
 
 def get_time_based_proxy(proxies: List[Proxy]) -> Optional[Proxy]:
@@ -72,6 +71,32 @@ def get_time_based_proxy(proxies: List[Proxy]) -> Optional[Proxy]:
     return proxies[index]
 
 
+def get_latency_ewma_proxy(proxies: Sequence[Proxy]) -> Optional[Proxy]:
+    """Select the better of two random proxies by smoothed latency and load"""
+    if not proxies:
+        return None
+    
+    count = len(proxies)
+    if count == 1:
+        return proxies[0]
+    # Two distinct random candidates; O(1) whatever the pool size, and the
+    # randomness keeps concurrent callers from all piling onto the fastest proxy
+    first = random.randrange(count)
+    second = random.randrange(count - 1)
+    if second >= first:
+        second += 1
+    a, b = proxies[first], proxies[second]
+    
+    latency_a, latency_b = a.response_time, b.response_time
+    if latency_a is None or latency_b is None:
+        # Not measured yet: compare on load alone
+        return a if a.connection_count <= b.connection_count else b
+    # Expected wait if the request queued behind the proxy's in-flight ones
+    if latency_a * (a.connection_count + 1) <= latency_b * (b.connection_count + 1):
+        return a
+    return b
+
+
 def get_proxy_by_strategy(proxies: List[Proxy], strategy: RotationStrategy) -> Optional[Proxy]:
     """Get proxy using specified strategy"""
     if not proxies:
@@ -85,24 +110,128 @@ def get_proxy_by_strategy(proxies: List[Proxy], strategy: RotationStrategy) -> O
         return get_least_connections_proxy(proxies)
     elif strategy == RotationStrategy.TIME_BASED:
         return get_time_based_proxy(proxies)
+    elif strategy == RotationStrategy.LATENCY_EWMA:
+        return get_latency_ewma_proxy(proxies)
     else:
         return get_random_proxy(proxies)
 
 
+class ConnectionIndex:
+    """Bucket queue of proxies keyed by active connection count"""
+    
+    # Owns Proxy.connection_count for every proxy. Acquire, release and
+    # picking the least loaded proxy are O(1) amortized and atomic under one
+    # small lock whose hold time does not depend on the pool size. Entries are
+    # keyed by id() to avoid rebuilding Proxy.key tuples on every operation.
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # connection count -> {id(proxy): proxy} with that count. OrderedDict
+        # keeps taking the first entry O(1) under FIFO churn, where a plain
+        # dict has to skip the deleted slots left at its front.
+        self._buckets: Dict[int, OrderedDict] = {}
+        self._tracked: Dict[int, Proxy] = {}
+        self._min = 0
+    
+    def __len__(self) -> int:
+        return len(self._tracked)
+    
+    def track(self, proxy: Proxy):
+        """Make a proxy selectable"""
+        with self._lock:
+            ident = id(proxy)
+            if ident in self._tracked:
+                return
+            self._tracked[ident] = proxy
+            count = proxy.connection_count
+            self._buckets.setdefault(count, OrderedDict())[ident] = proxy
+            if len(self._tracked) == 1 or count < self._min:
+                self._min = count
+    
+    def untrack(self, proxy: Proxy):
+        """Stop selecting a proxy; its in-flight slots can still be released"""
+        with self._lock:
+            if self._tracked.pop(id(proxy), None) is not None:
+                self._unbucket(id(proxy), proxy.connection_count)
+                self._advance_min()
+    
+    def acquire(self, proxy: Proxy):
+        """Take a connection slot on a specific proxy"""
+        with self._lock:
+            self._move(proxy, 1)
+    
+    def acquire_least(self) -> Optional[Proxy]:
+        """Atomically pick the least loaded proxy and take a slot on it"""
+        with self._lock:
+            bucket = self._buckets.get(self._min)
+            if not bucket:
+                return None
+            # The acquired proxy moves to the back of the next bucket, so
+            # ties are served in rotation
+            proxy = next(iter(bucket.values()))
+            self._move(proxy, 1)
+            return proxy
+    
+    def least(self) -> Optional[Proxy]:
+        """Return the least loaded proxy without taking a slot"""
+        with self._lock:
+            bucket = self._buckets.get(self._min)
+            return next(iter(bucket.values())) if bucket else None
+    
+    def release(self, proxy: Proxy):
+        """Give back a connection slot"""
+        with self._lock:
+            if proxy.connection_count > 0:
+                self._move(proxy, -1)
+    
+    def _move(self, proxy: Proxy, delta: int):
+        count = proxy.connection_count
+        proxy.connection_count = count + delta
+        ident = id(proxy)
+        if ident not in self._tracked:
+            return
+        self._unbucket(ident, count)
+        bucket = self._buckets.get(count + delta)
+        if bucket is None:
+            bucket = self._buckets[count + delta] = OrderedDict()
+        bucket[ident] = proxy
+        if count + delta < self._min:
+            self._min = count + delta
+        elif count == self._min:
+            self._advance_min()
+    
+    def _unbucket(self, ident: int, count: int):
+        bucket = self._buckets.get(count)
+        if bucket is not None:
+            bucket.pop(ident, None)
+            if not bucket:
+                del self._buckets[count]
+    
+    def _advance_min(self):
+        if not self._tracked:
+            self._min = 0
+            return
+        # Counts only change by one at a time, so this walk is short
+        while self._min not in self._buckets:
+            self._min += 1
+
+
 class RotationStrategyFactory:
     """Factory for creating rotation strategy instances"""
     
     @staticmethod
-    def create(strategy: RotationStrategy):
+    def create(strategy: RotationStrategy, connections: Optional[ConnectionIndex] = None):
         """Create a rotation strategy instance"""
         if strategy == RotationStrategy.RANDOM:
             return RandomRotationStrategy()
         elif strategy == RotationStrategy.ROUND_ROBIN:
             return RoundRobinRotationStrategy()
         elif strategy == RotationStrategy.LEAST_CONNECTIONS:
-            return LeastConnectionsRotationStrategy()
+            return LeastConnectionsRotationStrategy(connections)
         elif strategy == RotationStrategy.TIME_BASED:
             return TimeBasedRotationStrategy()
+        elif strategy == RotationStrategy.LATENCY_EWMA:
+            return LatencyEwmaRotationStrategy()
         else:
             return RandomRotationStrategy()
 
@@ -110,9 +239,16 @@ class RotationStrategyFactory:
 class RotationStrategyBase:
     """Base class for rotation strategies"""
     
-    def get_next(self, proxies: List[Proxy]) -> Optional[Proxy]:
+    def get_next(self, proxies: Sequence[Proxy]) -> Optional[Proxy]:
         """Get next proxy from list"""
         raise NotImplementedError
+    
+    def acquire(self, proxies: Sequence[Proxy], connections: ConnectionIndex) -> Optional[Proxy]:
+        """Get next proxy and take a connection slot on it"""
+        proxy = self.get_next(proxies)
+        if proxy is not None:
+            connections.acquire(proxy)
+        return proxy
 
 
 class RandomRotationStrategy(RotationStrategyBase):
@@ -126,26 +262,46 @@ class RoundRobinRotationStrategy(RotationStrategyBase):
     """Round-robin proxy selection"""
     
     def __init__(self):
-        self.index = 0
+        # Treats the (stably ordered) proxy sequence as a ring: each call takes
+        # the next ticket and maps it onto the current ring size, so proxies
+        # joining or leaving only shift positions instead of resetting rotation
+        self._counter = itertools.count()
     
-    def get_next(self, proxies: List[Proxy]) -> Optional[Proxy]:
+    def get_next(self, proxies: Sequence[Proxy]) -> Optional[Proxy]:
         if not proxies:
             return None
         
-        proxy = proxies[self.index % len(proxies)]
-        self.index += 1
-        return proxy
+        return proxies[next(self._counter) % len(proxies)]
 
 
 class LeastConnectionsRotationStrategy(RotationStrategyBase):
     """Select proxy with least connections"""
     
-    def get_next(self, proxies: List[Proxy]) -> Optional[Proxy]:
+    def __init__(self, connections: Optional[ConnectionIndex] = None):
+        self.connections = connections
+    
+    def get_next(self, proxies: Sequence[Proxy]) -> Optional[Proxy]:
+        if self.connections is not None and len(self.connections):
+            return self.connections.least()
         return get_least_connections_proxy(proxies)
+    
+    def acquire(self, proxies: Sequence[Proxy], connections: ConnectionIndex) -> Optional[Proxy]:
+        # Selection and increment happen under one lock so concurrent callers
+        # spread across proxies instead of piling onto the same minimum
+        if len(connections):
+            return connections.acquire_least()
+        return super().acquire(proxies, connections)
 
 
 class TimeBasedRotationStrategy(RotationStrategyBase):
     """Time-based proxy selection"""
     
     def get_next(self, proxies: List[Proxy]) -> Optional[Proxy]:
-        return get_time_based_proxy(proxies)
\ No newline at end of file
+        return get_time_based_proxy(proxies)
+
+
+class LatencyEwmaRotationStrategy(RotationStrategyBase):
+    """Power-of-two-choices selection by smoothed latency"""
+    
+    def get_next(self, proxies: Sequence[Proxy]) -> Optional[Proxy]:
+        return get_latency_ewma_proxy(proxies)
\ No newline at end of file
@@ -3,27 +3,97 @@ Proxy server implementation for Rota
 Simplified version using standard HTTP server
 """
 
+import base64
 import logging
 import time
 import threading
+import http.client
 import http.server
 import socketserver
-import urllib.request
 import urllib.parse
 from typing import Optional
 from http import HTTPStatus
 
 from rota.config import Config
+from rota.connection_pool import UpstreamConnectionPool
 from rota.proxy_manager import ProxyManager
 from rota.proxy import Proxy
+from rota.rate_limiter import TokenBucketRateLimiter
+from rota.socks import SocksError, is_socks, split_address
+from rota.socks_server import Socks5Server
+from rota.tunnel import TunnelError, open_tunnel, relay
+
+
+# Response bodies are relayed in chunks of at most this size, so memory per
+# request stays bounded regardless of the response size
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Headers that apply to a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade'
+])
+
+
+def resolve_target_url(path: str, host: Optional[str], forwarded_proto: Optional[str] = None) -> Optional[str]:
+    """Work out the target URL of a proxied request from its request target and Host header"""
+    # Absolute-form request target (standard forward proxy usage)
+    if path.startswith('http://') or path.startswith('https://'):
+        return path
+    
+    # Check query parameter
+    query_params = urllib.parse.parse_qs(urllib.parse.urlparse(path).query)
+    if 'target' in query_params:
+        return query_params['target'][0]
+    
+    # Check path (for simple proxy usage)
+    if path.startswith('/http://') or path.startswith('/https://'):
+        return path[1:]  # Remove leading slash
+    
+    # Check Host header for transparent proxy
+    if host:
+        scheme = 'https' if forwarded_proto == 'https' else 'http'
+        return f"{scheme}://{host}{path}"
+    
+    return None
+
+
+def resolve_session_key(config: Config, session_header: Optional[str],
+                        authorization: Optional[str]) -> Optional[str]:
+    """Work out a request's sticky session key from the session header or the Proxy-Authorization username"""
+    if session_header and session_header.strip():
+        return session_header.strip()
+    if not config.session_from_username or not authorization:
+        return None
+    scheme, _, credentials = authorization.strip().partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        decoded = base64.b64decode(credentials.strip(), validate=True).decode('utf-8', 'replace')
+    except ValueError:
+        return None
+    return decoded.partition(':')[0] or None
 
 
 class ProxyHTTPHandler(http.server.BaseHTTPRequestHandler):
     """HTTP request handler for proxy server"""
     
-    def __init__(self, *args, proxy_manager: ProxyManager, config: Config, **kwargs):
+    # HTTP/1.1 lets us pass bodies of unknown length through as chunked
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle hold the
+    # body back waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+    
+    def __init__(self, *args, proxy_manager: ProxyManager, config: Config,
+                 connection_pool: UpstreamConnectionPool,
+                 rate_limiter: Optional[TokenBucketRateLimiter] = None, **kwargs):
         self.proxy_manager = proxy_manager
         self.config = config
+        self.connection_pool = connection_pool
+        self.rate_limiter = rate_limiter
+        # Idle keep-alive clients give their thread back after this long
+        self.timeout = config.connection_timeout
+        self._response_started = False
         super().__init__(*args, **kwargs)
     
     def do_GET(self):
@@ -50,11 +120,60 @@ class ProxyHTTPHandler(http.server.BaseHTTPRequestHandler):
         """Handle OPTIONS requests"""
         self._handle_request()
     
+    def do_CONNECT(self):
+        """Handle CONNECT requests by tunnelling through an upstream proxy"""
+        self.proxy_manager.metrics.inc('rota_requests_total', 'connect')
+        if not self._check_rate_limit():
+            return
+        
+        try:
+            host, port = split_address(self.path)
+        except ValueError:
+            self.send_error(HTTPStatus.BAD_REQUEST, "CONNECT target must be host:port")
+            return
+        
+        proxy = self.proxy_manager.acquire_proxy(session=self._session_key())
+        if not proxy:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "No healthy proxies available")
+            return
+        
+        try:
+            started = time.monotonic()
+            try:
+                upstream, upstream_data = open_tunnel(proxy, host, port, self.config.connection_timeout)
+            except (OSError, SocksError, TunnelError) as e:
+                self.proxy_manager.report_outcome(proxy, False, error=e)
+                self.send_error(HTTPStatus.BAD_GATEWAY, f"Proxy error: {str(e)}")
+                return
+            self.proxy_manager.report_outcome(proxy, True, time.monotonic() - started)
+            
+            try:
+                self.send_response(HTTPStatus.OK, "Connection Established")
+                self.end_headers()
+                self.wfile.flush()
+                self.close_connection = True
+                relay(self.connection, upstream, self.config.tunnel_idle_timeout,
+                      client_data=self._drain_buffered_input(), upstream_data=upstream_data)
+            finally:
+                upstream.close()
+        finally:
+            self.proxy_manager.release_proxy(proxy)
+    
+    def _drain_buffered_input(self) -> bytes:
+        """Return client bytes already read into rfile's buffer (e.g. an eager TLS ClientHello)"""
+        self.connection.setblocking(False)
+        try:
+            return self.rfile.read1(64 * 1024) or b''
+        except (BlockingIOError, OSError):
+            return b''
+        finally:
+            self.connection.setblocking(True)
+    
     def _handle_request(self):
         """Handle all HTTP requests"""
+        self.proxy_manager.metrics.inc('rota_requests_total', 'http')
         # Check rate limiting
         if not self._check_rate_limit():
-            self.send_error(HTTPStatus.TOO_MANY_REQUESTS, "Rate limit exceeded")
             return
         
         # Get target URL
@@ -63,100 +182,184 @@ class ProxyHTTPHandler(http.server.BaseHTTPRequestHandler):
             self.send_error(HTTPStatus.BAD_REQUEST, "No target URL specified")
             return
         
-        # Select proxy
-        proxy = self.proxy_manager.get_proxy()
+        if 'Transfer-Encoding' in self.headers:
+            # Chunked uploads would need re-framing; ask for a sized body instead.
+            # The unread body would otherwise be parsed as the next request.
+            self.send_error(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+            self.close_connection = True
+            return
+        
+        # Select proxy and take a connection slot on it
+        proxy = self.proxy_manager.acquire_proxy(session=self._session_key())
         if not proxy:
             self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "No healthy proxies available")
             return
         
         # Forward request
+        self._response_started = False
+        self._upstream_started: Optional[float] = None
+        self._upstream_latency: Optional[float] = None
+        self._upstream_error: Optional[BaseException] = None
         try:
-            proxy.connection_count += 1
             self._forward_request(target_url, proxy)
         except Exception as e:
-            self.send_error(HTTPStatus.BAD_GATEWAY, f"Proxy error: {str(e)}")
+            self._upstream_error = e
+            if self._response_started:
+                # Too late for an error page; cut the connection so the client
+                # sees a truncated response instead of a corrupt one
+                self.close_connection = True
+            else:
+                self.send_error(HTTPStatus.BAD_GATEWAY, f"Proxy error: {str(e)}")
         finally:
-            proxy.connection_count -= 1
+            self._report_outcome(proxy)
+            self.proxy_manager.release_proxy(proxy)
+    
+    def _report_outcome(self, proxy: Proxy):
+        """Feed the upstream's result for this request back to the proxy manager"""
+        # A response header block counts as success; failing before one
+        # arrived counts against the proxy only if it was actually contacted
+        if self._upstream_latency is not None:
+            self.proxy_manager.report_outcome(proxy, True, self._upstream_latency)
+        elif self._upstream_started is not None:
+            self.proxy_manager.report_outcome(proxy, False, error=self._upstream_error)
+    
+    def _session_key(self) -> Optional[str]:
+        """Sticky session key sent by the client, if any"""
+        header = self.config.session_header
+        return resolve_session_key(self.config, self.headers.get(header) if header else None,
+                                   self.headers.get('Proxy-Authorization'))
     
     def _check_rate_limit(self) -> bool:
-        """Simple rate limiting"""
-        if not self.config.rate_limit_enabled:
+        """Per-client token bucket; answers 429 with Retry-After when the bucket is empty"""
+        if self.rate_limiter is None:
             return True
         
-        # This is a simplified version - in production you'd want more sophisticated rate limiting
-        current_time = time.time()
-        elapsed = current_time - self.server.last_reset
-        
-        if elapsed >= 60:  # Reset every minute
-            self.server.request_count = 0
-            self.server.last_reset = current_time
-        
-        if self.server.request_count >= self.config.rate_limit_requests:
-            return False
+        key = None
+        if self.config.rate_limit_key_header:
+            key = self.headers.get(self.config.rate_limit_key_header)
+        wait = self.rate_limiter.acquire(key or self.client_address[0])
+        if not wait:
+            return True
         
-        self.server.request_count += 1
-        return True
+        self.proxy_manager.metrics.inc('rota_rate_limited_total')
+        body = b"Rate limit exceeded\n"
+        self.send_response(HTTPStatus.TOO_MANY_REQUESTS)
+        self.send_header('Retry-After', TokenBucketRateLimiter.retry_after(wait))
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return False
     
     def _get_target_url(self) -> Optional[str]:
         """Extract target URL from request"""
-        # Check query parameter
-        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-        if 'target' in query_params:
-            return query_params['target'][0]
-        
-        # Check path (for simple proxy usage)
-        path = self.path
-        if path.startswith('/http://') or path.startswith('/https://'):
-            return path[1:]  # Remove leading slash
-        
-        # Check Host header for transparent proxy
-        host = self.headers.get('Host')
-        if host:
-            scheme = 'https' if self.headers.get('X-Forwarded-Proto') == 'https' else 'http'
-            return f"{scheme}://{host}{self.path}"
-        
-        return None
+        return resolve_target_url(self.path, self.headers.get('Host'), self.headers.get('X-Forwarded-Proto'))
     
     def _forward_request(self, target_url: str, proxy: Proxy):
         """Forward request through proxy"""
         # Prepare headers
         headers = {}
+        session_header = (self.config.session_header or "").lower()
         for key, value in self.headers.items():
-            if key.lower() not in ['host', 'connection', 'proxy-connection']:
+            lowered = key.lower()
+            # The session header is addressed to us, not the origin
+            if lowered != 'host' and lowered not in HOP_BY_HOP_HEADERS and lowered != session_header:
                 headers[key] = value
+        # Keep-alive is negotiated per hop, with our own upstream connections
+        headers['Connection'] = 'keep-alive'
         
         # Prepare request data
         content_length = int(self.headers.get('Content-Length', 0))
         data = self.rfile.read(content_length) if content_length > 0 else None
         
-        # Create proxy handler
-        proxy_url = proxy.to_url()
-        proxy_handler = urllib.request.ProxyHandler({
-            'http': proxy_url,
-            'https': proxy_url
-        })
-        
-        opener = urllib.request.build_opener(proxy_handler)
+        url = urllib.parse.urlsplit(target_url)
+        scheme = url.scheme.lower()
+        if scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f"Unsupported target URL {target_url}")
+        port = url.port or (443 if scheme == 'https' else 80)
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        headers['Host'] = url.netloc.rpartition('@')[2]
         
-        # Make the request
-        req = urllib.request.Request(
-            url=target_url,
-            data=data,
-            headers=headers,
-            method=self.command
-        )
+        if scheme == 'https' or is_socks(proxy):
+            # Tunnelled: the origin sees an ordinary origin-form request
+            request_target = path
+        else:
+            # Plain HTTP proxies take the absolute URL and the credentials per request
+            request_target = f"http://{headers['Host']}{path}"
+            authorization = proxy.proxy_authorization()
+            if authorization:
+                headers['Proxy-Authorization'] = authorization
         
-        with opener.open(req, timeout=self.config.connection_timeout) as response:
-            # Send response back to client
-            self.send_response(response.status)
+        self._upstream_started = time.monotonic()
+        conn, reused = self.connection_pool.acquire(proxy, scheme, url.hostname, port)
+        try:
+            try:
+                conn.request(self.command, request_target, body=data, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # The pooled connection died while idle; retry once on a fresh one
+                self.connection_pool.discard(conn)
+                conn, reused = self.connection_pool.acquire(proxy, scheme, url.hostname, port, fresh=True)
+                conn.request(self.command, request_target, body=data, headers=headers)
+                response = conn.getresponse()
+            self._upstream_latency = time.monotonic() - self._upstream_started
             
-            # Copy headers
-            for header, value in response.headers.items():
+            self._relay_response(response.status, response.msg, response)
+            # Bodiless responses still need a read to mark them complete
+            if not response.isclosed():
+                response.read()
+        except BaseException:
+            self.connection_pool.discard(conn)
+            raise
+        
+        if response.will_close:
+            self.connection_pool.discard(conn)
+        else:
+            self.connection_pool.release(conn)
+    
+    def _relay_response(self, status: int, headers, body):
+        """Stream an upstream response to the client in bounded chunks"""
+        has_body = (self.command != 'HEAD' and status >= 200 and
+                    status not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED))
+        length = headers.get('Content-Length')
+        # Bodies of unknown length are re-chunked for HTTP/1.1 clients and
+        # delimited by closing the connection for HTTP/1.0 ones
+        chunked = has_body and length is None and self.request_version == 'HTTP/1.1'
+        if has_body and length is None and not chunked:
+            self.close_connection = True
+        
+        self.send_response(status)
+        for header, value in headers.items():
+            if header.lower() not in HOP_BY_HOP_HEADERS:
                 self.send_header(header, value)
-            self.end_headers()
-            
-            # Copy response body
-            self.wfile.write(response.read())
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self._response_started = True
+        
+        if not has_body:
+            return
+        
+        read = getattr(body, 'read1', body.read)
+        while True:
+            chunk = read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
     
     def log_message(self, format, *args):
         """Custom logging"""
@@ -171,11 +374,21 @@ class ProxyServer:
         self.proxy_manager = proxy_manager
         self.server: Optional[socketserver.ThreadingTCPServer] = None
         self.server_thread: Optional[threading.Thread] = None
+        self.socks_server: Optional[Socks5Server] = None
+        self.socks_port: Optional[int] = None
         self.logger = logging.getLogger(__name__)
         
-        # Rate limiting state
-        self.request_count = 0
-        self.last_reset = time.time()
+        self.start_time = time.time()
+        
+        self.rate_limiter: Optional[TokenBucketRateLimiter] = None
+        if config.rate_limit_enabled:
+            self.rate_limiter = TokenBucketRateLimiter(config.rate_limit_requests, config.rate_limit_burst)
+        
+        self.connection_pool = UpstreamConnectionPool(
+            max_idle_per_proxy=config.pool_max_idle_per_proxy,
+            idle_timeout=config.pool_idle_timeout,
+            connect_timeout=config.connection_timeout
+        )
     
     def start(self):
         """Start the proxy server"""
@@ -183,7 +396,9 @@ class ProxyServer:
         handler_class = lambda *args: ProxyHTTPHandler(
             *args, 
             proxy_manager=self.proxy_manager, 
-            config=self.config
+            config=self.config,
+            connection_pool=self.connection_pool,
+            rate_limiter=self.rate_limiter
         )
         
         self.server = socketserver.ThreadingTCPServer(
@@ -192,8 +407,6 @@ class ProxyServer:
         )
         
         # Add our attributes to the server instance
-        self.server.request_count = self.request_count
-        self.server.last_reset = self.last_reset
         self.server.logger = self.logger
         
         self.server_thread = threading.Thread(target=self.server.serve_forever)
@@ -201,20 +414,31 @@ class ProxyServer:
         self.server_thread.start()
         
         self.logger.info(f"Proxy server started on {self.config.host}:{self.config.port}")
+        
+        if self.config.socks_enabled:
+            self.socks_server = Socks5Server(self.config, self.proxy_manager, self.rate_limiter)
+            self.socks_server.start()
+            self.socks_port = self.socks_server.port
     
     def stop(self):
         """Stop the proxy server"""
+        if self.socks_server:
+            self.socks_server.stop()
         if self.server:
             self.server.shutdown()
             self.server.server_close()
         if self.server_thread:
             self.server_thread.join(timeout=5)
+        self.connection_pool.close_all()
     
     def get_stats(self) -> dict:
         """Get server statistics"""
         stats = self.proxy_manager.get_stats()
         stats.update({
-            'request_count': self.request_count,
-            'uptime': time.time() - self.last_reset
+            'request_count': int(self.proxy_manager.metrics.count('rota_requests_total')),
+            'uptime': time.time() - self.start_time
         })
+        stats.update(self.connection_pool.get_stats())
+        if self.rate_limiter is not None:
+            stats.update(self.rate_limiter.get_stats())
         return stats
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+SOCKS4/4a/5 client protocol support for Rota
+Message builders and parsers are kept free of I/O so the blocking and
+asyncio code paths share the same wire format handling.
+"""
+
+import ipaddress
+import socket
+import struct
+from typing import Optional, Tuple
+
+from rota.proxy import Proxy
+
+
+SOCKS4_VERSION = 0x04
+SOCKS5_VERSION = 0x05
+
+SOCKS4_GRANTED = 0x5A
+
+SOCKS5_AUTH_NONE = 0x00
+SOCKS5_AUTH_USERPASS = 0x02
+SOCKS5_AUTH_UNACCEPTABLE = 0xFF
+
+SOCKS5_CMD_CONNECT = 0x01
+
+SOCKS5_ATYP_IPV4 = 0x01
+SOCKS5_ATYP_DOMAIN = 0x03
+SOCKS5_ATYP_IPV6 = 0x04
+
+SOCKS4_ERRORS = {
+    0x5B: "request rejected or failed",
+    0x5C: "identd unreachable",
+    0x5D: "identd user mismatch",
+}
+
+SOCKS5_ERRORS = {
+    0x01: "general SOCKS server failure",
+    0x02: "connection not allowed by ruleset",
+    0x03: "network unreachable",
+    0x04: "host unreachable",
+    0x05: "connection refused",
+    0x06: "TTL expired",
+    0x07: "command not supported",
+    0x08: "address type not supported",
+}
+
+
+# SOCKS5 replies by which the server reports that the destination, not the
+# server, failed
+SOCKS5_DESTINATION_ERRORS = frozenset((0x03, 0x04, 0x05, 0x06))
+
+
+class SocksError(Exception):
+    """Raised when a SOCKS handshake fails"""
+
+
+class SocksDestinationError(SocksError):
+    """Raised when a SOCKS server could not reach the requested destination"""
+
+
+def is_socks(proxy: Proxy) -> bool:
+    """Check whether a proxy speaks SOCKS"""
+    return proxy.protocol in ('socks4', 'socks5')
+
+
+def split_address(address: str) -> Tuple[str, int]:
+    """Split a host:port address, accepting bracketed IPv6 hosts"""
+    host, _, port = address.rpartition(':')
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    return host, int(port)
+
+
+def _ip_literal(host: str):
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        return None
+
+
+def build_socks4_connect(host: str, port: int, user_id: Optional[str] = None) -> bytes:
+    """Build a SOCKS4 CONNECT request, using SOCKS4a for hostnames"""
+    user = (user_id or '').encode() + b'\x00'
+    ip = _ip_literal(host)
+    if ip is not None and ip.version == 4:
+        return struct.pack('>BBH', SOCKS4_VERSION, 0x01, port) + ip.packed + user
+    if ip is not None:
+        raise SocksError("SOCKS4 does not support IPv6 destinations")
+    # SOCKS4a: invalid IP 0.0.0.x followed by the hostname for remote DNS
+    return (struct.pack('>BBH', SOCKS4_VERSION, 0x01, port) + b'\x00\x00\x00\x01' +
+            user + host.encode('idna') + b'\x00')
+
+
+def parse_socks4_reply(data: bytes):
+    """Validate the 8-byte SOCKS4 reply"""
+    if len(data) != 8 or data[0] != 0x00:
+        raise SocksError("Invalid SOCKS4 reply")
+    if data[1] != SOCKS4_GRANTED:
+        raise SocksError(f"SOCKS4 {SOCKS4_ERRORS.get(data[1], f'error 0x{data[1]:02x}')}")
+
+
+def build_socks5_greeting(proxy: Proxy) -> bytes:
+    """Build the SOCKS5 method negotiation message"""
+    if proxy.username:
+        return bytes([SOCKS5_VERSION, 2, SOCKS5_AUTH_NONE, SOCKS5_AUTH_USERPASS])
+    return bytes([SOCKS5_VERSION, 1, SOCKS5_AUTH_NONE])
+
+
+def parse_socks5_method(data: bytes) -> int:
+    """Return the authentication method chosen by the SOCKS5 server"""
+    if len(data) != 2 or data[0] != SOCKS5_VERSION:
+        raise SocksError("Invalid SOCKS5 method reply")
+    if data[1] == SOCKS5_AUTH_UNACCEPTABLE:
+        raise SocksError("SOCKS5 server accepted none of our auth methods")
+    if data[1] not in (SOCKS5_AUTH_NONE, SOCKS5_AUTH_USERPASS):
+        raise SocksError(f"SOCKS5 server chose unsupported auth method 0x{data[1]:02x}")
+    return data[1]
+
+
+def build_socks5_userpass(proxy: Proxy) -> bytes:
+    """Build the RFC 1929 username/password sub-negotiation"""
+    if not proxy.username:
+        raise SocksError("SOCKS5 server requires authentication")
+    username = proxy.username.encode()
+    password = (proxy.password or '').encode()
+    if len(username) > 255 or len(password) > 255:
+        raise SocksError("SOCKS5 credentials too long")
+    return bytes([0x01, len(username)]) + username + bytes([len(password)]) + password
+
+
+def parse_socks5_auth_reply(data: bytes):
+    """Validate the username/password sub-negotiation reply"""
+    if len(data) != 2 or data[1] != 0x00:
+        raise SocksError("SOCKS5 authentication failed")
+
+
+def build_socks5_connect(host: str, port: int) -> bytes:
+    """Build a SOCKS5 CONNECT request, leaving hostnames for remote DNS"""
+    ip = _ip_literal(host)
+    if ip is not None and ip.version == 4:
+        address = bytes([SOCKS5_ATYP_IPV4]) + ip.packed
+    elif ip is not None:
+        address = bytes([SOCKS5_ATYP_IPV6]) + ip.packed
+    else:
+        name = host.encode('idna')
+        if len(name) > 255:
+            raise SocksError("Hostname too long for SOCKS5")
+        address = bytes([SOCKS5_ATYP_DOMAIN, len(name)]) + name
+    return bytes([SOCKS5_VERSION, SOCKS5_CMD_CONNECT, 0x00]) + address + struct.pack('>H', port)
+
+
+def parse_socks5_reply_header(data: bytes) -> int:
+    """Validate the first 5 reply bytes and return how many bytes remain"""
+    if len(data) != 5 or data[0] != SOCKS5_VERSION:
+        raise SocksError("Invalid SOCKS5 reply")
+    if data[1] != 0x00:
+        error = SocksDestinationError if data[1] in SOCKS5_DESTINATION_ERRORS else SocksError
+        raise error(f"SOCKS5 {SOCKS5_ERRORS.get(data[1], f'error 0x{data[1]:02x}')}")
+    # The fifth byte is the first byte of the bound address (or its length)
+    atyp = data[3]
+    if atyp == SOCKS5_ATYP_IPV4:
+        return 3 + 2
+    if atyp == SOCKS5_ATYP_IPV6:
+        return 15 + 2
+    if atyp == SOCKS5_ATYP_DOMAIN:
+        return data[4] + 2
+    raise SocksError(f"Invalid SOCKS5 address type 0x{atyp:02x}")
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise SocksError("SOCKS server closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+def socks_handshake(sock: socket.socket, proxy: Proxy, host: str, port: int):
+    """Open a SOCKS tunnel to host:port over a blocking socket already connected to the proxy"""
+    if proxy.protocol == 'socks4':
+        sock.sendall(build_socks4_connect(host, port, proxy.username))
+        parse_socks4_reply(recv_exact(sock, 8))
+        return
+    
+    sock.sendall(build_socks5_greeting(proxy))
+    if parse_socks5_method(recv_exact(sock, 2)) == SOCKS5_AUTH_USERPASS:
+        sock.sendall(build_socks5_userpass(proxy))
+        parse_socks5_auth_reply(recv_exact(sock, 2))
+    
+    sock.sendall(build_socks5_connect(host, port))
+    remaining = parse_socks5_reply_header(recv_exact(sock, 5))
+    recv_exact(sock, remaining)
+
+
+async def socks_handshake_async(reader, writer, proxy: Proxy, host: str, port: int):
+    """Open a SOCKS tunnel to host:port over an asyncio stream already connected to the proxy"""
+    if proxy.protocol == 'socks4':
+        writer.write(build_socks4_connect(host, port, proxy.username))
+        await writer.drain()
+        parse_socks4_reply(await reader.readexactly(8))
+        return
+    
+    writer.write(build_socks5_greeting(proxy))
+    await writer.drain()
+    if parse_socks5_method(await reader.readexactly(2)) == SOCKS5_AUTH_USERPASS:
+        writer.write(build_socks5_userpass(proxy))
+        await writer.drain()
+        parse_socks5_auth_reply(await reader.readexactly(2))
+    
+    writer.write(build_socks5_connect(host, port))
+    await writer.drain()
+    remaining = parse_socks5_reply_header(await reader.readexactly(5))
+    await reader.readexactly(remaining)
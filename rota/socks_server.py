@@ -0,0 +1,334 @@
+"""
+SOCKS5 front end for Rota
+Accepts SOCKS5 CONNECT requests from clients that cannot use an HTTP proxy,
+picks an upstream through the ProxyManager and relays the TCP stream exactly
+like an HTTP CONNECT tunnel. Handlers are provided for both server engines.
+"""
+
+import asyncio
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Optional, Tuple
+
+from rota.config import Config
+from rota.metrics import classify_error
+from rota.proxy_manager import ProxyManager
+from rota.rate_limiter import TokenBucketRateLimiter
+from rota.socks import (
+    SOCKS5_ATYP_DOMAIN, SOCKS5_ATYP_IPV4, SOCKS5_ATYP_IPV6, SOCKS5_AUTH_NONE, SOCKS5_AUTH_UNACCEPTABLE,
+    SOCKS5_AUTH_USERPASS, SOCKS5_CMD_CONNECT, SOCKS5_VERSION, SocksError, recv_exact
+)
+from rota.tunnel import TunnelError, open_tunnel, open_tunnel_async, relay, relay_async
+
+
+# Reply codes sent to our clients (RFC 1928 section 6)
+REPLY_SUCCEEDED = 0x00
+REPLY_GENERAL_FAILURE = 0x01
+REPLY_NOT_ALLOWED = 0x02
+REPLY_HOST_UNREACHABLE = 0x04
+REPLY_CONNECTION_REFUSED = 0x05
+REPLY_COMMAND_NOT_SUPPORTED = 0x07
+REPLY_ADDRESS_NOT_SUPPORTED = 0x08
+
+
+class SocksRequestError(SocksError):
+    """Raised for a well-formed request we cannot serve; carries the reply code to send"""
+    
+    def __init__(self, reply: int, message: str):
+        super().__init__(message)
+        self.reply = reply
+
+
+def choose_method(methods: bytes, want_username: bool = False) -> int:
+    """Pick an authentication method from the client's offer"""
+    # Rota has no client credentials of its own; a username is accepted so
+    # clients that always authenticate still work, and any password passes.
+    # It is asked for first when usernames double as session keys.
+    if want_username and SOCKS5_AUTH_USERPASS in methods:
+        return SOCKS5_AUTH_USERPASS
+    if SOCKS5_AUTH_NONE in methods:
+        return SOCKS5_AUTH_NONE
+    if SOCKS5_AUTH_USERPASS in methods:
+        return SOCKS5_AUTH_USERPASS
+    return SOCKS5_AUTH_UNACCEPTABLE
+
+
+def check_request_header(data: bytes) -> int:
+    """Validate VER CMD RSV ATYP and return how many address bytes follow (0 for a length-prefixed name)"""
+    if data[0] != SOCKS5_VERSION:
+        raise SocksError("Invalid SOCKS5 request")
+    if data[1] != SOCKS5_CMD_CONNECT:
+        raise SocksRequestError(REPLY_COMMAND_NOT_SUPPORTED, f"Unsupported SOCKS5 command 0x{data[1]:02x}")
+    if data[3] == SOCKS5_ATYP_IPV4:
+        return 4
+    if data[3] == SOCKS5_ATYP_IPV6:
+        return 16
+    if data[3] == SOCKS5_ATYP_DOMAIN:
+        return 0
+    raise SocksRequestError(REPLY_ADDRESS_NOT_SUPPORTED, f"Unsupported SOCKS5 address type 0x{data[3]:02x}")
+
+
+def decode_address(atyp: int, raw: bytes) -> str:
+    """Destination host of a request; hostnames stay unresolved for the upstream to look up"""
+    if atyp == SOCKS5_ATYP_IPV4:
+        return socket.inet_ntop(socket.AF_INET, raw)
+    if atyp == SOCKS5_ATYP_IPV6:
+        return socket.inet_ntop(socket.AF_INET6, raw)
+    try:
+        return raw.decode('idna')
+    except UnicodeError:
+        raise SocksRequestError(REPLY_ADDRESS_NOT_SUPPORTED, "Invalid SOCKS5 hostname")
+
+
+def build_reply(code: int) -> bytes:
+    """Reply to a CONNECT request; the bound address is not meaningful through an upstream"""
+    return bytes([SOCKS5_VERSION, code, 0x00, SOCKS5_ATYP_IPV4]) + b'\x00' * 6
+
+
+def failure_reply(error: BaseException) -> int:
+    """Reply code for a tunnel that could not be opened"""
+    kind = classify_error(error)
+    if kind == 'refused':
+        return REPLY_CONNECTION_REFUSED
+    if kind in ('timeout', 'dns'):
+        return REPLY_HOST_UNREACHABLE
+    return REPLY_GENERAL_FAILURE
+
+
+def read_request(sock: socket.socket, want_username: bool = False) -> Tuple[str, int, Optional[str]]:
+    """Run the server side of a SOCKS5 handshake on a blocking socket; returns (host, port, username)"""
+    version, count = recv_exact(sock, 2)
+    if version != SOCKS5_VERSION:
+        raise SocksError(f"Unsupported SOCKS version {version}")
+    method = choose_method(recv_exact(sock, count), want_username)
+    sock.sendall(bytes([SOCKS5_VERSION, method]))
+    if method == SOCKS5_AUTH_UNACCEPTABLE:
+        raise SocksError("Client offered no usable authentication method")
+    
+    username = None
+    if method == SOCKS5_AUTH_USERPASS:
+        _, length = recv_exact(sock, 2)
+        username = recv_exact(sock, length).decode('utf-8', 'replace')
+        recv_exact(sock, recv_exact(sock, 1)[0])
+        sock.sendall(b'\x01\x00')
+    
+    header = recv_exact(sock, 4)
+    length = check_request_header(header) or recv_exact(sock, 1)[0]
+    host = decode_address(header[3], recv_exact(sock, length))
+    port = struct.unpack('>H', recv_exact(sock, 2))[0]
+    return host, port, username
+
+
+async def read_request_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             want_username: bool = False) -> Tuple[str, int, Optional[str]]:
+    """Run the server side of a SOCKS5 handshake on an asyncio stream; returns (host, port, username)"""
+    version, count = await reader.readexactly(2)
+    if version != SOCKS5_VERSION:
+        raise SocksError(f"Unsupported SOCKS version {version}")
+    method = choose_method(await reader.readexactly(count), want_username)
+    writer.write(bytes([SOCKS5_VERSION, method]))
+    if method == SOCKS5_AUTH_UNACCEPTABLE:
+        raise SocksError("Client offered no usable authentication method")
+    
+    username = None
+    if method == SOCKS5_AUTH_USERPASS:
+        _, length = await reader.readexactly(2)
+        username = (await reader.readexactly(length)).decode('utf-8', 'replace')
+        await reader.readexactly((await reader.readexactly(1))[0])
+        writer.write(b'\x01\x00')
+    
+    header = await reader.readexactly(4)
+    length = check_request_header(header) or (await reader.readexactly(1))[0]
+    host = decode_address(header[3], await reader.readexactly(length))
+    port = struct.unpack('>H', await reader.readexactly(2))[0]
+    return host, port, username
+
+
+class Socks5Handler(socketserver.BaseRequestHandler):
+    """Serves one SOCKS5 client connection on its own thread"""
+    
+    def __init__(self, *args, proxy_manager: ProxyManager, config: Config,
+                 rate_limiter: Optional[TokenBucketRateLimiter] = None, **kwargs):
+        self.proxy_manager = proxy_manager
+        self.config = config
+        self.rate_limiter = rate_limiter
+        super().__init__(*args, **kwargs)
+    
+    def handle(self):
+        sock: socket.socket = self.request
+        sock.settimeout(self.config.connection_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            host, port, username = read_request(sock, self.config.session_from_username)
+        except SocksRequestError as e:
+            self._reply(e.reply)
+            self.server.logger.debug(f"SOCKS5 request from {self.client_address[0]} rejected: {e}")
+            return
+        except (OSError, SocksError, ValueError) as e:
+            self.server.logger.debug(f"SOCKS5 handshake with {self.client_address[0]} failed: {e}")
+            return
+        
+        self.proxy_manager.metrics.inc('rota_requests_total', 'socks')
+        if self.rate_limiter is not None and self.rate_limiter.acquire(self.client_address[0]):
+            self.proxy_manager.metrics.inc('rota_rate_limited_total')
+            self._reply(REPLY_NOT_ALLOWED)
+            return
+        
+        session = username if self.config.session_from_username else None
+        proxy = self.proxy_manager.acquire_proxy(session=session)
+        if not proxy:
+            self._reply(REPLY_GENERAL_FAILURE)
+            return
+        
+        try:
+            started = time.monotonic()
+            try:
+                upstream, upstream_data = open_tunnel(proxy, host, port, self.config.connection_timeout)
+            except (OSError, SocksError, TunnelError) as e:
+                self.proxy_manager.report_outcome(proxy, False, error=e)
+                self._reply(failure_reply(e))
+                self.server.logger.info(f"{self.client_address[0]} SOCKS5 CONNECT {host}:{port} failed: {e}")
+                return
+            self.proxy_manager.report_outcome(proxy, True, time.monotonic() - started)
+            
+            try:
+                sock.sendall(build_reply(REPLY_SUCCEEDED))
+                self.server.logger.info(f"{self.client_address[0]} SOCKS5 CONNECT {host}:{port}")
+                relay(sock, upstream, self.config.tunnel_idle_timeout, upstream_data=upstream_data)
+            finally:
+                upstream.close()
+        except OSError:
+            pass
+        finally:
+            self.proxy_manager.release_proxy(proxy)
+    
+    def _reply(self, code: int):
+        try:
+            self.request.sendall(build_reply(code))
+        except OSError:
+            pass
+
+
+class Socks5Server:
+    """Threaded SOCKS5 listener, run alongside ProxyServer"""
+    
+    def __init__(self, config: Config, proxy_manager: ProxyManager,
+                 rate_limiter: Optional[TokenBucketRateLimiter] = None):
+        self.config = config
+        self.proxy_manager = proxy_manager
+        self.rate_limiter = rate_limiter
+        self.port = config.socks_port
+        self.server: Optional[socketserver.ThreadingTCPServer] = None
+        self.server_thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+    
+    def start(self):
+        """Start the SOCKS5 listener on a background thread"""
+        handler_class = lambda *args: Socks5Handler(
+            *args,
+            proxy_manager=self.proxy_manager,
+            config=self.config,
+            rate_limiter=self.rate_limiter
+        )
+        
+        self.server = socketserver.ThreadingTCPServer((self.config.socks_host, self.config.socks_port),
+                                                      handler_class)
+        self.server.daemon_threads = True
+        self.server.logger = self.logger
+        self.port = self.server.server_address[1]
+        
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name="rota-socks",
+                                              daemon=True)
+        self.server_thread.start()
+        self.logger.info(f"SOCKS5 listener started on {self.config.socks_host}:{self.port}")
+    
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.server_thread:
+            self.server_thread.join(timeout=5)
+
+
+class AsyncSocks5Handler:
+    """Serves SOCKS5 clients on AsyncProxyServer's event loop; pass it to asyncio.start_server"""
+    
+    def __init__(self, config: Config, proxy_manager: ProxyManager,
+                 rate_limiter: Optional[TokenBucketRateLimiter] = None,
+                 connection_slots: Optional[asyncio.Semaphore] = None):
+        self.config = config
+        self.proxy_manager = proxy_manager
+        self.rate_limiter = rate_limiter
+        # Shared with the HTTP listener, so max_connections covers both
+        self.connection_slots = connection_slots
+        self.logger = logging.getLogger(__name__)
+    
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            if self.connection_slots is None:
+                await self._handle(reader, writer)
+            else:
+                async with self.connection_slots:
+                    await self._handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+            pass
+        except asyncio.CancelledError:
+            # Server shutdown; end quietly rather than failing the task
+            pass
+        except Exception as e:
+            self.logger.debug(f"SOCKS5 client connection error: {e}")
+        finally:
+            writer.close()
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else ''
+        try:
+            host, port, username = await asyncio.wait_for(
+                read_request_async(reader, writer, self.config.session_from_username),
+                self.config.connection_timeout
+            )
+        except SocksRequestError as e:
+            writer.write(build_reply(e.reply))
+            self.logger.debug(f"SOCKS5 request from {client} rejected: {e}")
+            return
+        except (SocksError, ValueError) as e:
+            self.logger.debug(f"SOCKS5 handshake with {client} failed: {e}")
+            return
+        
+        self.proxy_manager.metrics.inc('rota_requests_total', 'socks')
+        if self.rate_limiter is not None and self.rate_limiter.acquire(client):
+            self.proxy_manager.metrics.inc('rota_rate_limited_total')
+            writer.write(build_reply(REPLY_NOT_ALLOWED))
+            return
+        
+        session = username if self.config.session_from_username else None
+        proxy = self.proxy_manager.acquire_proxy(session=session)
+        if not proxy:
+            writer.write(build_reply(REPLY_GENERAL_FAILURE))
+            return
+        
+        try:
+            started = time.monotonic()
+            try:
+                upstream = await open_tunnel_async(proxy, host, port, self.config.connection_timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, SocksError, TunnelError) as e:
+                self.proxy_manager.report_outcome(proxy, False, error=e)
+                writer.write(build_reply(failure_reply(e)))
+                self.logger.info(f"{client} SOCKS5 CONNECT {host}:{port} failed: {e}")
+                return
+            self.proxy_manager.report_outcome(proxy, True, time.monotonic() - started)
+            
+            try:
+                writer.write(build_reply(REPLY_SUCCEEDED))
+                await writer.drain()
+                self.logger.info(f"{client} SOCKS5 CONNECT {host}:{port}")
+                await relay_async((reader, writer), upstream, self.config.tunnel_idle_timeout)
+            finally:
+                upstream[1].close()
+        finally:
+            self.proxy_manager.release_proxy(proxy)
@@ -0,0 +1,228 @@
+"""
+TCP tunnels through upstream proxies for Rota
+Opens CONNECT (HTTP) or SOCKS tunnels and relays raw bytes between sockets
+"""
+
+import asyncio
+import socket
+import threading
+import time
+from typing import Tuple
+
+from rota.proxy import Proxy
+from rota.socks import is_socks, socks_handshake, socks_handshake_async, split_address
+
+
+# Per-direction relay buffer; large enough that bulk transfers move in few syscalls
+RELAY_BUFFER_SIZE = 256 * 1024
+
+# Upper bound on the upstream's CONNECT response headers
+MAX_CONNECT_RESPONSE = 64 * 1024
+
+
+class TunnelError(Exception):
+    """Raised when an upstream proxy refuses or breaks a tunnel"""
+
+
+class TunnelDestinationError(TunnelError):
+    """Raised when an upstream proxy could not reach the tunnel's destination"""
+
+
+# CONNECT statuses by which a proxy reports that the destination, not the
+# proxy, failed: it could not connect to it or timed out waiting for it
+DESTINATION_FAILURE_STATUSES = frozenset((b'502', b'504'))
+
+
+def connect_to_proxy(proxy: Proxy, timeout: float) -> socket.socket:
+    """Open a TCP connection to the upstream proxy itself"""
+    sock = socket.create_connection(split_address(proxy.address), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def _connect_request(proxy: Proxy, host: str, port: int) -> bytes:
+    authority = f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+    request = f"CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n"
+    authorization = proxy.proxy_authorization()
+    if authorization:
+        request += f"Proxy-Authorization: {authorization}\r\n"
+    return (request + "\r\n").encode()
+
+
+def _check_connect_response(head: bytes):
+    status_line = head.split(b'\r\n', 1)[0]
+    parts = status_line.split(None, 2)
+    if len(parts) >= 2 and parts[0].startswith(b'HTTP/') and parts[1] in DESTINATION_FAILURE_STATUSES:
+        raise TunnelDestinationError(f"Upstream proxy could not reach the destination: "
+                                     f"{status_line.decode('latin-1')}")
+    if len(parts) < 2 or not parts[0].startswith(b'HTTP/') or parts[1] != b'200':
+        raise TunnelError(f"Upstream proxy refused CONNECT: {status_line.decode('latin-1')}")
+
+
+def http_connect(sock: socket.socket, proxy: Proxy, host: str, port: int) -> bytes:
+    """Ask an HTTP proxy for a CONNECT tunnel, returning any bytes read past its headers"""
+    sock.sendall(_connect_request(proxy, host, port))
+    
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise TunnelError("Upstream proxy closed the connection during CONNECT")
+        response += chunk
+        if len(response) > MAX_CONNECT_RESPONSE:
+            raise TunnelError("Upstream proxy sent oversized CONNECT response")
+    
+    head, _, leftover = response.partition(b'\r\n\r\n')
+    _check_connect_response(head)
+    return leftover
+
+
+async def http_connect_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             proxy: Proxy, host: str, port: int):
+    """Ask an HTTP proxy for a CONNECT tunnel over an asyncio stream"""
+    writer.write(_connect_request(proxy, host, port))
+    await writer.drain()
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        raise TunnelError("Upstream proxy closed the connection during CONNECT")
+    except asyncio.LimitOverrunError:
+        raise TunnelError("Upstream proxy sent oversized CONNECT response")
+    # Anything the upstream sent past its headers stays buffered in the reader
+    _check_connect_response(head)
+
+
+def open_tunnel(proxy: Proxy, host: str, port: int, timeout: float) -> Tuple[socket.socket, bytes]:
+    """Open a tunnel to host:port through proxy, returning the socket and any early upstream bytes"""
+    sock = connect_to_proxy(proxy, timeout)
+    try:
+        if is_socks(proxy):
+            socks_handshake(sock, proxy, host, port)
+            leftover = b''
+        else:
+            leftover = http_connect(sock, proxy, host, port)
+    except BaseException:
+        sock.close()
+        raise
+    return sock, leftover
+
+
+async def open_tunnel_async(proxy: Proxy, host: str, port: int, timeout: float
+                            ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Open a tunnel to host:port through proxy as an asyncio stream pair"""
+    async def handshake():
+        proxy_host, proxy_port = split_address(proxy.address)
+        reader, writer = await asyncio.open_connection(proxy_host, proxy_port, limit=MAX_CONNECT_RESPONSE)
+        try:
+            if is_socks(proxy):
+                await socks_handshake_async(reader, writer, proxy, host, port)
+            else:
+                await http_connect_async(reader, writer, proxy, host, port)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+    
+    return await asyncio.wait_for(handshake(), timeout)
+
+
+def _pump(source: socket.socket, destination: socket.socket, stats: list, index: int,
+          idle_timeout: float):
+    """Copy one direction until EOF, then half-close the destination"""
+    buffer = bytearray(RELAY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    try:
+        while True:
+            try:
+                received = source.recv_into(buffer)
+            except socket.timeout:
+                # Only give up once neither direction has moved data for a full timeout
+                if time.monotonic() - stats[2] < idle_timeout:
+                    continue
+                raise
+            if not received:
+                break
+            destination.sendall(view[:received])
+            stats[index] += received
+            stats[2] = time.monotonic()
+    except OSError:
+        # Reset or idle timeout: tear down both directions
+        for sock in (source, destination):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return
+    try:
+        destination.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+def relay(client: socket.socket, upstream: socket.socket, idle_timeout: float,
+          client_data: bytes = b'', upstream_data: bytes = b'') -> Tuple[int, int]:
+    """Relay bytes both ways until both sides finish, returning (bytes_up, bytes_down)"""
+    # Each direction runs in its own blocking loop so a slow reader on one
+    # side never stalls the other, and EOF on one side only half-closes.
+    # stats: [bytes up, bytes down, last activity]
+    stats = [0, 0, time.monotonic()]
+    for sock in (client, upstream):
+        sock.settimeout(idle_timeout)
+    
+    if client_data:
+        upstream.sendall(client_data)
+        stats[0] += len(client_data)
+    if upstream_data:
+        client.sendall(upstream_data)
+        stats[1] += len(upstream_data)
+    
+    downstream = threading.Thread(
+        target=_pump, args=(upstream, client, stats, 1, idle_timeout), daemon=True
+    )
+    downstream.start()
+    _pump(client, upstream, stats, 0, idle_timeout)
+    downstream.join()
+    return stats[0], stats[1]
+
+
+async def _pump_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, stats: list,
+                      index: int, idle_timeout: float):
+    """Copy one direction until EOF, then half-close the destination"""
+    while True:
+        try:
+            data = await asyncio.wait_for(reader.read(RELAY_BUFFER_SIZE), idle_timeout)
+        except asyncio.TimeoutError:
+            # Only give up once neither direction has moved data for a full timeout
+            if time.monotonic() - stats[2] < idle_timeout:
+                continue
+            raise
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+        stats[index] += len(data)
+        stats[2] = time.monotonic()
+    if writer.can_write_eof():
+        writer.write_eof()
+
+
+async def relay_async(client: Tuple[asyncio.StreamReader, asyncio.StreamWriter],
+                      upstream: Tuple[asyncio.StreamReader, asyncio.StreamWriter],
+                      idle_timeout: float) -> Tuple[int, int]:
+    """Relay bytes both ways between two stream pairs, returning (bytes_up, bytes_down)"""
+    stats = [0, 0, time.monotonic()]
+    pumps = [
+        asyncio.ensure_future(_pump_async(client[0], upstream[1], stats, 0, idle_timeout)),
+        asyncio.ensure_future(_pump_async(upstream[0], client[1], stats, 1, idle_timeout)),
+    ]
+    try:
+        # Wait for both half-closes; a failure on either side tears down both
+        for pump in asyncio.as_completed(pumps):
+            await pump
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        for pump in pumps:
+            pump.cancel()
+        await asyncio.gather(*pumps, return_exceptions=True)
+    return stats[0], stats[1]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.circuit_breaker
+Checks which live request failures count against a proxy, and the breaker's
+closed, open and half-open transitions under a fake clock.
+
+    python -m pytest -q test_circuit_breaker.py
+"""
+
+import sys
+import os
+import socket
+import ssl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import math
+
+from proxy_fixtures import FakeClock, make_manager, make_proxies
+from rota.circuit_breaker import CircuitBreaker, is_destination_failure
+from rota.socks import SocksDestinationError, SocksError, parse_socks5_reply_header
+from rota.tunnel import TunnelDestinationError, TunnelError, _check_connect_response
+
+
+def test_destination_failures_are_told_apart():
+    # The proxy answered, but could not reach the origin
+    for head in (b"HTTP/1.1 502 Bad Gateway", b"HTTP/1.0 504 Gateway Timeout"):
+        try:
+            _check_connect_response(head)
+        except TunnelDestinationError as e:
+            assert is_destination_failure(e)
+        else:
+            raise AssertionError(head)
+    for code in (0x03, 0x04, 0x05, 0x06):
+        try:
+            parse_socks5_reply_header(bytes([5, code, 0, 1, 0]))
+        except SocksDestinationError as e:
+            assert is_destination_failure(e)
+        else:
+            raise AssertionError(code)
+    assert is_destination_failure(ssl.SSLCertVerificationError("certificate verify failed"))
+    
+    # The proxy itself failed
+    for head in (b"HTTP/1.1 407 Proxy Authentication Required", b"HTTP/1.1 403 Forbidden", b"garbage"):
+        try:
+            _check_connect_response(head)
+        except TunnelError as e:
+            assert not is_destination_failure(e)
+        else:
+            raise AssertionError(head)
+    for code in (0x01, 0x02, 0x07):
+        try:
+            parse_socks5_reply_header(bytes([5, code, 0, 1, 0]))
+        except SocksError as e:
+            assert not is_destination_failure(e)
+    for error in (ConnectionRefusedError(), socket.timeout(), SocksError("SOCKS5 authentication failed"),
+                  TunnelError("Upstream proxy closed the connection during CONNECT"), None):
+        assert not is_destination_failure(error)
+
+
+def test_destination_failures_do_not_eject():
+    manager = make_manager(make_proxies(3), circuit_breaker_failure_threshold=3)
+    try:
+        proxy = manager._healthy_snapshot[0]
+        for _ in range(10):
+            manager.report_outcome(proxy, False, error=TunnelDestinationError("502 Bad Gateway"))
+            manager.report_outcome(proxy, False, error=ssl.SSLCertVerificationError("bad certificate"))
+        assert len(manager._healthy_snapshot) == 3
+        assert not manager._breaker.is_open(proxy)
+        
+        # Neutral outcomes do not reset a streak of real failures either
+        manager.report_outcome(proxy, False, error=ConnectionRefusedError())
+        manager.report_outcome(proxy, False, error=TunnelDestinationError("504 Gateway Timeout"))
+        manager.report_outcome(proxy, False, error=ConnectionRefusedError())
+        assert len(manager._healthy_snapshot) == 3
+        manager.report_outcome(proxy, False, error=TunnelError("Upstream proxy refused CONNECT: HTTP/1.1 407"))
+        assert manager._breaker.is_open(proxy)
+        assert proxy not in manager._healthy_snapshot
+        assert len(manager._healthy_snapshot) == 2
+    finally:
+        manager.stop_health_check()
+
+
+def make_breaker(clock: FakeClock) -> CircuitBreaker:
+    # Eject after 3 failures, try again after 10s, rejoin after 2 good trials
+    return CircuitBreaker(3, 10.0, 2, max_open_seconds=40.0, clock=clock)
+
+
+def eject(breaker: CircuitBreaker, proxy):
+    assert not breaker.record_failure(proxy)
+    assert not breaker.record_failure(proxy)
+    assert breaker.record_failure(proxy)
+
+
+def test_opens_after_threshold():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    proxy, other = make_proxies(2)
+    
+    # A success in between resets the streak
+    breaker.record_failure(proxy)
+    breaker.record_failure(proxy)
+    assert not breaker.record_success(proxy)
+    breaker.record_failure(proxy)
+    breaker.record_failure(proxy)
+    assert not breaker.is_open(proxy)
+    
+    assert breaker.record_failure(proxy)
+    assert breaker.is_open(proxy)
+    assert not breaker.is_open(other)
+    # Further failures while open change nothing
+    assert not breaker.record_failure(proxy)
+    assert breaker.get_stats()['circuit_opened_total'] == 1
+
+
+def test_half_open_after_cooldown():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    proxy = make_proxies(1)[0]
+    eject(breaker, proxy)
+    assert breaker.next_trial_at == clock.now + 10
+    
+    clock.advance(9.9)
+    assert breaker.take_trial() is None
+    clock.advance(0.1)
+    assert breaker.take_trial() is proxy
+    # One trial at a time
+    assert breaker.take_trial() is None
+    assert breaker.get_stats()['circuit_trials_total'] == 1
+
+
+def test_successful_trials_close():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    proxy = make_proxies(1)[0]
+    eject(breaker, proxy)
+    
+    # A request that started before the ejection is not a trial
+    assert not breaker.record_success(proxy)
+    assert breaker.take_trial() is None
+    
+    clock.advance(10)
+    assert breaker.take_trial() is proxy
+    assert not breaker.record_success(proxy)
+    # The second trial may follow straight away
+    assert breaker.take_trial() is proxy
+    assert breaker.record_success(proxy)
+    assert not breaker.is_open(proxy)
+    assert breaker.next_trial_at == math.inf
+    assert breaker.get_stats()['circuit_closed_total'] == 1
+    
+    # Closed again with a clean record
+    assert not breaker.record_failure(proxy)
+
+
+def test_failed_trial_reopens_for_longer():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    proxy = make_proxies(1)[0]
+    eject(breaker, proxy)
+    
+    for cooldown in (20, 40, 40):
+        clock.advance(breaker.next_trial_at - clock.now)
+        assert breaker.take_trial() is proxy
+        assert not breaker.record_failure(proxy)
+        assert breaker.is_open(proxy)
+        assert breaker.next_trial_at == clock.now + cooldown
+    
+    # A failure resets the successes a trial run had gathered
+    clock.advance(40)
+    assert breaker.take_trial() is proxy
+    breaker.record_success(proxy)
+    assert breaker.take_trial() is proxy
+    breaker.record_failure(proxy)
+    clock.advance(40)
+    assert breaker.take_trial() is proxy
+    assert not breaker.record_success(proxy)
+    assert breaker.is_open(proxy)
+
+
+def test_unreported_and_neutral_trials():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    proxy = make_proxies(1)[0]
+    eject(breaker, proxy)
+    clock.advance(10)
+    assert breaker.take_trial() is proxy
+    
+    # A trial whose outcome never arrives is retried after another cool-down
+    clock.advance(9)
+    assert breaker.take_trial() is None
+    clock.advance(1)
+    assert breaker.take_trial() is proxy
+    
+    # An inconclusive trial can be retried straight away
+    breaker.record_neutral(proxy)
+    assert breaker.is_open(proxy)
+    assert breaker.take_trial() is proxy
+    breaker.record_success(proxy)
+    assert breaker.take_trial() is proxy
+    assert breaker.record_success(proxy)
+
+
+def test_forget():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    proxy, streak = make_proxies(2)
+    eject(breaker, proxy)
+    breaker.record_failure(streak)
+    breaker.record_failure(streak)
+    breaker.forget(proxy)
+    breaker.forget(streak)
+    assert not breaker.is_open(proxy)
+    assert breaker.next_trial_at == math.inf
+    clock.advance(10)
+    assert breaker.take_trial() is None
+    # The streak started over
+    assert not breaker.record_failure(streak)
+    assert not breaker.record_failure(streak)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.rotation_strategies.ConnectionIndex
+Checks that the least loaded proxy is always picked, ties rotate, and
+connection counts stay right as proxies are tracked and untracked.
+
+    python -m pytest -q test_connection_index.py
+"""
+
+import sys
+import os
+import random
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from proxy_fixtures import make_proxies
+from rota.rotation_strategies import ConnectionIndex
+
+
+def test_acquire_least_balances():
+    index = ConnectionIndex()
+    proxies = make_proxies(4)
+    for proxy in proxies:
+        index.track(proxy)
+    assert len(index) == 4
+    
+    # Ties are served in rotation, so every proxy gets one before any gets two
+    first_round = [index.acquire_least() for _ in range(4)]
+    assert set(first_round) == set(proxies)
+    second_round = [index.acquire_least() for _ in range(4)]
+    assert second_round == first_round
+    assert all(proxy.connection_count == 2 for proxy in proxies)
+    
+    index.release(proxies[2])
+    assert index.least() is proxies[2]
+    assert index.acquire_least() is proxies[2]
+
+
+def test_acquire_specific_and_release():
+    index = ConnectionIndex()
+    busy, idle = make_proxies(2)
+    index.track(busy)
+    index.track(idle)
+    for _ in range(3):
+        index.acquire(busy)
+    assert busy.connection_count == 3
+    assert index.least() is idle
+    
+    for _ in range(5):
+        index.release(busy)
+    # Counts never go below zero
+    assert busy.connection_count == 0
+    index.acquire(idle)
+    assert index.least() is busy
+
+
+def test_untrack_keeps_counting_releases():
+    index = ConnectionIndex()
+    gone, kept = make_proxies(2)
+    index.track(gone)
+    index.track(kept)
+    index.acquire(gone)
+    index.untrack(gone)
+    assert len(index) == 1
+    
+    # In-flight slots on an untracked proxy are still released
+    index.release(gone)
+    assert gone.connection_count == 0
+    for _ in range(3):
+        assert index.acquire_least() is kept
+    
+    # Tracked again, it joins at its current count and is preferred
+    index.track(gone)
+    index.track(gone)
+    assert len(index) == 2
+    assert index.least() is gone
+
+
+def test_empty_index():
+    index = ConnectionIndex()
+    assert index.least() is None
+    assert index.acquire_least() is None
+    proxy = make_proxies(1)[0]
+    index.track(proxy)
+    index.untrack(proxy)
+    assert index.acquire_least() is None
+    index.untrack(proxy)
+
+
+def test_minimum_matches_counts():
+    index = ConnectionIndex()
+    proxies = make_proxies(20)
+    rng = random.Random(1)
+    tracked = set()
+    for _ in range(2000):
+        proxy = rng.choice(proxies)
+        action = rng.random()
+        if action < 0.15:
+            index.track(proxy)
+            tracked.add(proxy)
+        elif action < 0.25:
+            index.untrack(proxy)
+            tracked.discard(proxy)
+        elif action < 0.6:
+            index.acquire_least()
+        else:
+            index.release(proxy)
+        least = index.least()
+        if tracked:
+            assert least.connection_count == min(proxy.connection_count for proxy in tracked)
+        else:
+            assert least is None
+
+
+def test_concurrent_acquire_release():
+    index = ConnectionIndex()
+    proxies = make_proxies(8)
+    for proxy in proxies:
+        index.track(proxy)
+    
+    def worker():
+        for _ in range(2000):
+            proxy = index.acquire_least()
+            index.release(proxy)
+    
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(proxy.connection_count == 0 for proxy in proxies)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
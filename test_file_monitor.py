@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.file_monitor.ProxyFileMonitor
+Appends to, rewrites, truncates and deletes temporary proxy files and checks
+the deltas, including that appends take the incremental path.
+
+    python -m pytest -q test_file_monitor.py
+"""
+
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rota.config import Config
+from rota.file_monitor import ProxyFileMonitor
+from rota.proxy_manager import ProxyManager
+
+
+def write(path: str, text: str, mode: str = "w"):
+    with open(path, mode) as f:
+        f.write(text)
+    # Same-size rewrites within one mtime tick must still look changed
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def make_monitor(*paths: str) -> ProxyFileMonitor:
+    config = Config()
+    config.proxy_files = list(paths)
+    # The delta logic is tested on its own; no manager is needed to collect changes
+    monitor = ProxyFileMonitor(config, None)
+    # Baseline scan, as start() does
+    monitor._collect_changes()
+    return monitor
+
+
+def changes(monitor: ProxyFileMonitor):
+    added, removed = monitor._collect_changes()
+    return sorted(proxy.address for proxy in added), sorted(proxy.address for proxy in removed)
+
+
+def test_append_parses_only_the_tail():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "proxies.txt")
+        write(path, "# list\n1.1.1.1:80\n1.1.1.2:80\n")
+        monitor = make_monitor(path)
+        state = monitor._files[path]
+        assert changes(monitor) == ([], [])
+        
+        write(path, "1.1.1.3:80\n1.1.1.1:80\n", "a")
+        assert changes(monitor) == (["1.1.1.3:80"], [])
+        # The append path updates the state in place instead of re-reading
+        assert monitor._files[path] is state
+        assert state.offset == os.path.getsize(path)
+        
+        # A line without its newline yet is taken as is, and replaced once it grows
+        write(path, "1.1.1.4:80", "a")
+        assert changes(monitor) == (["1.1.1.4:80"], [])
+        write(path, "81\n", "a")
+        assert changes(monitor) == (["1.1.1.4:8081"], ["1.1.1.4:80"])
+        assert monitor._files[path] is state
+
+
+def test_rewrite_falls_back_to_full_reload():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "proxies.txt")
+        write(path, "1.1.1.1:80\n1.1.1.2:80\n1.1.1.3:80\n")
+        monitor = make_monitor(path)
+        state = monitor._files[path]
+        
+        # Same size, different prefix: the CRC check rejects the append path
+        write(path, "1.1.1.9:80\n1.1.1.2:80\n1.1.1.3:80\n")
+        assert changes(monitor) == (["1.1.1.9:80"], ["1.1.1.1:80"])
+        assert monitor._files[path] is not state
+        
+        # Rewritten and grown past the old size
+        write(path, "1.1.1.2:80\n1.1.1.3:80\n1.1.1.5:80\n1.1.1.6:80\n")
+        assert changes(monitor) == (["1.1.1.5:80", "1.1.1.6:80"], ["1.1.1.9:80"])
+        
+        # Replaced by a new file renamed over it, as editors save
+        replacement = os.path.join(directory, "proxies.tmp")
+        write(replacement, "1.1.1.2:80\n1.1.1.3:80\n1.1.1.5:80\n1.1.1.6:80\n1.1.1.7:80\n")
+        os.replace(replacement, path)
+        assert changes(monitor) == (["1.1.1.7:80"], [])
+
+
+def test_truncate_and_delete():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "proxies.txt")
+        write(path, "1.1.1.1:80\n1.1.1.2:80\n1.1.1.3:80\n")
+        monitor = make_monitor(path)
+        
+        write(path, "1.1.1.1:80\n")
+        assert changes(monitor) == ([], ["1.1.1.2:80", "1.1.1.3:80"])
+        write(path, "")
+        assert changes(monitor) == ([], ["1.1.1.1:80"])
+        write(path, "1.1.1.4:80\n", "a")
+        assert changes(monitor) == (["1.1.1.4:80"], [])
+        
+        os.unlink(path)
+        assert changes(monitor) == ([], ["1.1.1.4:80"])
+        write(path, "1.1.1.4:80\n")
+        assert changes(monitor) == (["1.1.1.4:80"], [])
+
+
+def test_proxies_shared_between_files():
+    with tempfile.TemporaryDirectory() as directory:
+        first = os.path.join(directory, "a.txt")
+        second = os.path.join(directory, "b.txt")
+        write(first, "1.1.1.1:80\nhttp://1.1.1.2:80\n")
+        write(second, "1.1.1.2:80\n")
+        monitor = make_monitor(first, second)
+        
+        # Still listed in the other file, so nothing is removed yet
+        write(first, "1.1.1.1:80\n")
+        assert changes(monitor) == ([], [])
+        write(second, "")
+        assert changes(monitor) == ([], ["1.1.1.2:80"])
+        
+        # Listed twice in one file, removed once: still present
+        write(first, "1.1.1.1:80\n1.1.1.1:80\n")
+        assert changes(monitor) == ([], [])
+        write(first, "1.1.1.1:80\n")
+        assert changes(monitor) == ([], [])
+
+
+def test_poll_applies_changes_to_the_pool():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "proxies.txt")
+        # Closed local ports, so the health checks of new proxies fail fast
+        write(path, "127.0.0.1:9\n127.0.0.1:19\n")
+        config = Config()
+        config.proxy_files = [path]
+        config.health_check_enabled = False
+        config.health_cache_enabled = False
+        config.health_check_timeout = 1
+        manager = ProxyManager(config)
+        try:
+            manager._load_proxies_from_file(path)
+            monitor = ProxyFileMonitor(config, manager)
+            monitor._collect_changes()
+            
+            write(path, "127.0.0.1:9\n127.0.0.1:29\n")
+            assert monitor.poll() == (1, 1)
+            assert sorted(proxy.address for proxy in manager.proxies) == ["127.0.0.1:29", "127.0.0.1:9"]
+            assert monitor.poll() == (0, 0)
+        finally:
+            manager.stop_health_check()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.hash_ring.HashRing
+Checks lookups against a brute-force walk of the ring, and that only the
+sessions of departed proxies move when the pool changes.
+
+    python -m pytest -q test_hash_ring.py
+"""
+
+import sys
+import os
+import random
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from proxy_fixtures import make_proxies
+from rota import hash_ring
+from rota.hash_ring import HashRing, session_point
+from rota.proxy import Proxy
+
+
+SESSIONS = [f"session-{index}" for index in range(2000)]
+
+
+def owners(ring: HashRing):
+    return {key: ring.get(key) for key in SESSIONS}
+
+
+def expected_owner(ring: HashRing, key: str):
+    """The owner found by walking a flat sorted copy of the ring"""
+    points = sorted(ring._owners)
+    position = bisect_left(points, session_point(key))
+    return ring._owners[points[position % len(points)]]
+
+
+def test_inactive_ring_is_empty():
+    ring = HashRing(8)
+    for proxy in make_proxies(3):
+        ring.add(proxy)
+    ring.publish()
+    assert ring.get("anything") is None
+    assert ring.get_stats() == {'session_ring_proxies': 0, 'session_ring_points': 0}
+    
+    ring.activate([])
+    assert ring.get("anything") is None
+
+
+def test_lookups_match_ring_walk():
+    saved = hash_ring._BLOCK_SIZE
+    # Small blocks so the ring spans many of them and splits as it grows
+    hash_ring._BLOCK_SIZE = 4
+    try:
+        proxies = make_proxies(60)
+        ring = HashRing(8)
+        ring.activate(proxies[:20])
+        for proxy in proxies[20:]:
+            ring.add(proxy)
+        ring.publish()
+        
+        blocks, maxes = ring._published
+        assert len(blocks) > 1
+        flat = [point for block in blocks for point in block]
+        assert flat == sorted(set(flat))
+        assert maxes == [block[-1] for block in blocks]
+        assert ring.get_stats() == {'session_ring_proxies': 60, 'session_ring_points': 60 * 8}
+        for key in SESSIONS:
+            assert ring.get(key) is expected_owner(ring, key)
+    finally:
+        hash_ring._BLOCK_SIZE = saved
+
+
+def test_only_departed_sessions_move():
+    proxies = make_proxies(50)
+    ring = HashRing(16)
+    ring.activate(proxies)
+    before = owners(ring)
+    assert set(before.values()) <= set(proxies)
+    # Same keys, same owners
+    assert owners(ring) == before
+    
+    gone = set(random.Random(1).sample(proxies, 5))
+    for proxy in gone:
+        ring.remove(proxy)
+    # Nothing changes until publish()
+    assert owners(ring) == before
+    ring.publish()
+    
+    after = owners(ring)
+    for key in SESSIONS:
+        assert after[key] not in gone
+        if before[key] not in gone:
+            assert after[key] is before[key]
+    
+    # Fresh objects for the returning proxies take their sessions back
+    fresh = {proxy: Proxy(address=proxy.address, protocol=proxy.protocol) for proxy in gone}
+    for proxy in fresh.values():
+        ring.add(proxy)
+    ring.publish()
+    again = owners(ring)
+    for key in SESSIONS:
+        assert again[key] == before[key]
+        if before[key] in gone:
+            assert again[key] is fresh[before[key]]
+
+
+def test_remove_and_add_in_one_batch():
+    proxies = make_proxies(10)
+    ring = HashRing(16)
+    ring.activate(proxies)
+    before = owners(ring)
+    published = ring._published
+    
+    ring.remove(proxies[3])
+    ring.add(proxies[3])
+    ring.publish()
+    assert ring._published is published
+    assert owners(ring) == before
+    
+    # Removing a proxy twice, or one never added, is harmless
+    ring.remove(proxies[4])
+    ring.remove(proxies[4])
+    ring.remove(Proxy(address="10.9.9.9:9", protocol="http"))
+    ring.publish()
+    assert ring.get_stats()['session_ring_points'] == 9 * 16
+
+
+def test_password_is_not_part_of_identity():
+    old = Proxy(address="10.0.0.1:8080", protocol="http", username="user", password="old")
+    new = Proxy(address="10.0.0.1:8080", protocol="http", username="user", password="new")
+    other = Proxy(address="10.0.0.1:8080", protocol="http", username="other", password="old")
+    assert hash_ring._ring_points(old, 16) == hash_ring._ring_points(new, 16)
+    assert hash_ring._ring_points(old, 16) != hash_ring._ring_points(other, 16)
+    assert len(hash_ring._ring_points(old, 13)) == 13
+    
+    # A password change within one batch hands the points to the new object
+    ring = HashRing(16)
+    ring.activate([old, other])
+    before = owners(ring)
+    ring.remove(old)
+    ring.add(new)
+    ring.publish()
+    assert ring.get_stats() == {'session_ring_proxies': 2, 'session_ring_points': 32}
+    for key in SESSIONS:
+        assert ring.get(key) is (new if before[key] is old else other)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.health_scheduler.HealthScheduler
+Checks due ordering, failure backoff and traffic speed-up, survival of the
+queue across row renumbering, and the probe budget.
+
+    python -m pytest -q test_health_scheduler.py
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from proxy_fixtures import FakeClock, make_proxies
+from rota.health_scheduler import HealthScheduler
+from rota.proxy import Proxy
+from rota.proxy_store import ProxyStore
+
+
+INTERVAL = 60.0
+
+
+def make_scheduler(count: int, max_rate: float = 0, max_batch: int = 1000, clock=None):
+    store = ProxyStore()
+    for proxy in make_proxies(count):
+        store.add(proxy)
+    scheduler = HealthScheduler(store, INTERVAL, max_backoff=600.0, max_rate=max_rate, max_batch=max_batch,
+                                clock=clock or FakeClock())
+    return store, scheduler
+
+
+def due_in(store: ProxyStore, scheduler: HealthScheduler, row: int, now: float) -> float:
+    """Seconds from now until a row is due"""
+    return (store.check_schedule(row)[0] - scheduler._due(now)) / 1000
+
+
+def test_due_ordering():
+    store, scheduler = make_scheduler(0)
+    now = time.time()
+    # Restored from the health cache: due one interval after the last check
+    store.add(Proxy("10.1.0.1:8080", "http", last_checked=now - 50))
+    store.add(Proxy("10.1.0.2:8080", "http", last_checked=now - 10))
+    for proxy in make_proxies(3):
+        store.add(proxy)
+    
+    # Never-checked rows are due straight away, in row order
+    assert scheduler.take(now) == [2, 3, 4]
+    assert scheduler.take(now) == []
+    assert abs(scheduler.wait_time(now) - 10) < 0.01
+    assert scheduler.take(now + 10) == [0]
+    assert scheduler.take(now + 50) == [1]
+    
+    # Results reschedule rows, which come back earliest first: busier
+    # proxies sooner (intervals of 60s, 30s and 15s, each within 10%)
+    later = now + 50
+    for row, requests in ((0, 0), (1, 0), (2, 0), (3, 240), (4, 60)):
+        scheduler.record(row, True, requests, 60.0, later)
+    assert scheduler.take(later + 17) == [3]
+    assert scheduler.take(later + 34) == [4]
+    assert sorted(scheduler.take(later + 67)) == [0, 1, 2]
+    assert scheduler.take(later + 67) == []
+
+
+def test_backoff_grows_and_resets():
+    store, scheduler = make_scheduler(1)
+    now = time.time()
+    assert scheduler.take(now) == [0]
+    
+    for failures, expected in ((1, 60), (2, 120), (3, 240), (4, 480), (5, 600), (6, 600)):
+        scheduler.record(0, False, 0, 0, now)
+        assert store.check_schedule(0)[1] == failures
+        wait = due_in(store, scheduler, 0, now)
+        assert expected * 0.89 <= wait <= expected * 1.11, (failures, wait)
+    
+    # One good result resets the streak and the interval
+    scheduler.record(0, True, 0, 0, now)
+    assert store.check_schedule(0)[1] == 0
+    assert 60 * 0.89 <= due_in(store, scheduler, 0, now) <= 60 * 1.11
+    scheduler.record(0, False, 0, 0, now)
+    assert store.check_schedule(0)[1] == 1
+
+
+def test_traffic_speeds_up_checks():
+    store, scheduler = make_scheduler(3)
+    now = time.time()
+    scheduler.take(now)
+    scheduler.record(0, True, 0, 60.0, now)
+    scheduler.record(1, True, 60, 60.0, now)  # one request a second: twice as often
+    scheduler.record(2, True, 6000, 60.0, now)  # capped at four times as often
+    for row, expected in ((0, 60), (1, 30), (2, 15)):
+        assert expected * 0.89 <= due_in(store, scheduler, row, now) <= expected * 1.11
+
+
+def test_renumbering_skips_stale_entries():
+    store, scheduler = make_scheduler(10)
+    now = time.time()
+    assert scheduler.take(now) == list(range(10))
+    # Even rows are due again in about a minute, odd rows after their backoff
+    for row in range(10):
+        scheduler.record(row, row % 2 == 0, 0, 0, now if row % 2 == 0 else now + 1000)
+    
+    # Dropping rows 0-3 moves the rest down by four, so every queued entry
+    # names the wrong row; the queue is rebuilt from the store's columns
+    store.remove([store[row] for row in range(4)])
+    assert [proxy.address for proxy in store][:3] == ["10.0.0.4:8080", "10.0.0.5:8080", "10.0.0.6:8080"]
+    taken = scheduler.take(now + 70)
+    assert sorted(store[row].address for row in taken) == ["10.0.0.4:8080", "10.0.0.6:8080", "10.0.0.8:8080"]
+    assert sorted(taken) == [0, 2, 4]
+    assert scheduler.take(now + 70) == []
+    
+    # Rows added after the renumbering are picked up too
+    store.add(Proxy("10.1.0.1:8080", "http"))
+    assert scheduler.take(now + 70) == [6]
+
+
+def test_probe_budget():
+    clock = FakeClock()
+    # Two probes a second, at most three at once
+    store, scheduler = make_scheduler(10, max_rate=2, max_batch=3, clock=clock)
+    now = time.time()
+    assert scheduler.take(now) == [0, 1, 2]
+    assert scheduler.take(now) == []
+    assert scheduler.wait_time(now) == 0.5
+    
+    clock.advance(0.5)
+    assert scheduler.take(now) == [3]
+    clock.advance(1.0)
+    assert scheduler.take(now) == [4, 5]
+    # The bucket holds at most one batch
+    clock.advance(60)
+    assert scheduler.take(now) == [6, 7, 8]
+    assert scheduler.get_stats() == {'health_checks_scheduled_total': 9}
+    
+    # Unlimited rate: only the batch size applies
+    store, scheduler = make_scheduler(10, max_rate=0, max_batch=4)
+    assert scheduler.take(now) == [0, 1, 2, 3]
+    assert scheduler.take(now) == [4, 5, 6, 7]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
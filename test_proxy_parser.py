@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.proxy_parser
+Checks the accepted line formats, normalisation and the parse report.
+
+    python -m pytest -q test_proxy_parser.py
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rota.proxy_parser import parse_proxy_line, parse_proxy_lines
+
+
+def test_line_formats():
+    assert parse_proxy_line("1.2.3.4:8080") == ("1.2.3.4:8080", "http", None, None)
+    assert parse_proxy_line("socks5://user:pw@1.2.3.4:1080") == ("1.2.3.4:1080", "socks5", "user", "pw")
+    assert parse_proxy_line("SOCKS4:Proxy.Example.com:1080") == ("proxy.example.com:1080", "socks4", None, None)
+    assert parse_proxy_line("1.2.3.4:8080:user:p:w") == ("1.2.3.4:8080", "http", "user", "p:w")
+    assert parse_proxy_line("user@[2001:db8::1]:3128") == ("[2001:db8::1]:3128", "http", "user", None)
+    assert parse_proxy_line("http://1.2.3.4:08080/") == ("1.2.3.4:8080", "http", None, None)
+
+
+def test_https_lines_are_http_proxies():
+    # "https" in a list means an HTTP proxy that supports CONNECT
+    assert parse_proxy_line("https://1.2.3.4:443") == ("1.2.3.4:443", "http", None, None)
+    assert parse_proxy_line("HTTPS://user:pw@1.2.3.4:443") == ("1.2.3.4:443", "http", "user", "pw")
+    assert parse_proxy_line("https:1.2.3.4:443") == ("1.2.3.4:443", "http", None, None)
+    assert parse_proxy_line("https:1.2.3.4:443:user:pw") == ("1.2.3.4:443", "http", "user", "pw")
+    
+    # So they de-duplicate against the same proxy listed as http
+    keys, report = parse_proxy_lines(["https://1.2.3.4:443", "http://1.2.3.4:443", "https:1.2.3.4:443"])
+    assert keys == [("1.2.3.4:443", "http", None, None)]
+    assert report.duplicates == 2
+
+
+def test_malformed_lines():
+    for line, reason in [
+        ("ftp://1.2.3.4:21", "unsupported protocol"),
+        ("1.2.3.4", "missing port"),
+        ("1.2.3.4:0", "invalid port"),
+        ("1.2.3.4:http", "invalid port"),
+        (":8080", "missing host"),
+        ("http://2001:db8::1:8080", "unbracketed IPv6 host"),
+        ("foo:1.2.3.4:8080", "unrecognised format"),
+    ]:
+        assert parse_proxy_line(line) == (None, reason, line)
+
+
+def test_report():
+    keys, report = parse_proxy_lines([
+        "# comment", "", "1.2.3.4:80", " 1.2.3.4:80 ", "http://1.2.3.4:80", "bad", "bad", "5.6.7.8:81"
+    ])
+    assert keys == [("1.2.3.4:80", "http", None, None), ("5.6.7.8:81", "http", None, None)]
+    assert report.lines == 6
+    assert report.duplicates == 2
+    assert report.malformed == {"missing port": 2}
+    assert report.samples == ["bad"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.proxy_store.ProxyStore
+Covers de-duplication on both insertion paths, the packed, credential and
+plain-address row kinds, and row renumbering when proxies are removed.
+
+    python -m pytest -q test_proxy_store.py
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rota.proxy import Proxy
+from rota.proxy_store import ProxyStore
+
+
+# One of each row kind: packed IPv4, packed with credentials, and addresses
+# that do not pack (hostname, IPv6, a port that does not format back)
+MIXED_KEYS = [
+    ("10.0.0.1:8080", "http", None, None),
+    ("10.0.0.1:8080", "socks5", None, None),
+    ("10.0.0.1:8080", "http", "alice", "secret"),
+    ("10.0.0.1:8080", "http", "bob", "secret"),
+    ("proxy.example.com:3128", "http", None, None),
+    ("[2001:db8::1]:1080", "socks5", None, None),
+    ("10.0.0.2:08080", "http", None, None),
+    ("proxy.example.com:3128", "http", "alice", None),
+]
+
+
+def make_proxy(key, **fields) -> Proxy:
+    address, protocol, username, password = key
+    return Proxy(address=address, protocol=protocol, username=username, password=password, **fields)
+
+
+def ipv4_keys(count: int, protocol: str = "http"):
+    return [(f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}:{1024 + index % 5000}", protocol, None, None)
+            for index in range(count)]
+
+
+def test_add_and_contains():
+    store = ProxyStore()
+    for key in MIXED_KEYS:
+        assert store.add(make_proxy(key))
+    assert len(store) == len(MIXED_KEYS)
+    
+    for key in MIXED_KEYS:
+        # A fresh object with the same identity is found by key, not by row cache
+        assert make_proxy(key) in store
+        assert not store.add(make_proxy(key))
+    assert len(store) == len(MIXED_KEYS)
+    
+    assert make_proxy(("10.0.0.1:8080", "socks4", None, None)) not in store
+    assert make_proxy(("10.0.0.1:8080", "http", "alice", "other")) not in store
+    assert make_proxy(("10.0.0.2:8080", "http", None, None)) not in store
+    assert "10.0.0.1:8080" not in store
+
+
+def test_materialize_round_trip():
+    store = ProxyStore()
+    for key in MIXED_KEYS:
+        store.add(make_proxy(key, is_healthy=True, last_checked=1000.0, response_time=0.25, added_at=500.0))
+    store.add(make_proxy(("10.0.0.3:80", "http", None, None), added_at=600.0))
+    
+    for row, key in enumerate(MIXED_KEYS):
+        proxy = store[row]
+        assert proxy.key == key
+        assert proxy.is_healthy and proxy.last_checked == 1000.0
+        assert proxy.response_time == 0.25 and proxy.added_at == 500.0
+        assert store.row_of(proxy) == row
+    
+    unchecked = store[-1]
+    assert unchecked.key == ("10.0.0.3:80", "http", None, None)
+    assert not unchecked.is_healthy
+    assert unchecked.last_checked is None and unchecked.response_time is None
+    assert [proxy.key for proxy in store] == MIXED_KEYS + [unchecked.key]
+
+
+def test_extend_skips_duplicates():
+    store = ProxyStore()
+    store.add(make_proxy(MIXED_KEYS[0]))
+    store.add(make_proxy(MIXED_KEYS[2]))
+    
+    # Duplicates within the batch and of rows already stored, for every row kind
+    batch = MIXED_KEYS + MIXED_KEYS[::-1] + ipv4_keys(300) + ipv4_keys(300)
+    added = store.extend(batch, added_at=42.0)
+    assert added == len(MIXED_KEYS) - 2 + 300
+    assert len(store) == len(MIXED_KEYS) + 300
+    assert store.extend(batch, added_at=43.0) == 0
+    
+    stored = [proxy.key for proxy in store]
+    assert len(set(stored)) == len(stored)
+    assert set(stored) == set(MIXED_KEYS) | set(ipv4_keys(300))
+    for key in batch:
+        assert make_proxy(key) in store
+    assert all(proxy.added_at == 42.0 for proxy in list(store)[2:])
+    
+    # Rows added by extend() are found by add() and the other way round
+    assert not store.add(make_proxy(ipv4_keys(1)[0]))
+    assert store.add(make_proxy(("10.9.9.9:9", "http", None, None)))
+    assert store.extend([("10.9.9.9:9", "http", None, None)], added_at=44.0) == 0
+
+
+def test_remove_compacts_and_keeps_lookups():
+    store = ProxyStore()
+    keys = MIXED_KEYS + ipv4_keys(200)
+    store.extend(keys, added_at=1.0)
+    
+    removed_keys = keys[::3]
+    removed = store.remove([make_proxy(key) for key in removed_keys])
+    assert [proxy.key for proxy in removed] == removed_keys
+    survivors = [key for key in keys if key not in set(removed_keys)]
+    
+    assert len(store) == len(survivors)
+    assert [proxy.key for proxy in store] == survivors
+    for row, key in enumerate(survivors):
+        assert store.row_of(make_proxy(key)) == row
+    for key in removed_keys:
+        assert make_proxy(key) not in store
+    
+    # Removing twice, or something never stored, is a no-op
+    assert store.remove([make_proxy(removed_keys[0]), make_proxy(("10.8.8.8:8", "http", None, None))]) == []
+    
+    # Removed identities can come back, in either insertion path
+    assert store.add(make_proxy(removed_keys[0]))
+    assert store.extend(removed_keys, added_at=2.0) == len(removed_keys) - 1
+    assert len(store) == len(keys)
+    for key in keys:
+        assert make_proxy(key) in store
+
+
+def test_remove_everything():
+    store = ProxyStore()
+    keys = MIXED_KEYS + ipv4_keys(50)
+    store.extend(keys, added_at=1.0)
+    store.remove(list(store))
+    assert len(store) == 0
+    assert list(store) == []
+    assert store.extend(keys, added_at=2.0) == len(keys)
+
+
+def test_token_changes_on_renumbering():
+    store = ProxyStore()
+    store.extend(ipv4_keys(20), added_at=1.0)
+    token = store.token
+    
+    pinned = store[10]
+    store.pin(pinned)
+    assert store[10] is pinned
+    detached = store[15]
+    doomed = store[2]
+    store.pin(doomed)
+    
+    # Lookups and health updates leave rows alone
+    store.save(pinned)
+    assert store.row_of(make_proxy(ipv4_keys(20)[4])) == 4
+    assert store.token is token
+    
+    removed = store.remove([make_proxy(ipv4_keys(20)[0]), doomed])
+    assert removed[1] is doomed
+    assert store.token is not token
+    
+    # Pinned objects are moved to their new rows; removed ones are cut loose
+    assert store.row_of(pinned) == 8
+    assert store[8] is pinned
+    assert doomed._row == -1 and store.row_of(doomed) is None
+    # A detached object still carries the old token, so it falls back to its key
+    assert detached._token is token
+    assert store.row_of(detached) == 13
+    assert detached._token is store.token
+    assert store.canonical(make_proxy(pinned.key)) is pinned
+
+
+def test_save_and_unpin_write_back():
+    store = ProxyStore()
+    store.extend(ipv4_keys(5), added_at=1.0)
+    proxy = store[3]
+    store.pin(proxy)
+    proxy.is_healthy = True
+    proxy.last_checked = 99.0
+    proxy.response_time = 0.5
+    
+    # While pinned, materialize() hands out the live object
+    assert store[3] is proxy
+    store.unpin(proxy)
+    copy = store[3]
+    assert copy is not proxy
+    assert copy.is_healthy and copy.last_checked == 99.0 and copy.response_time == 0.5
+    assert store.expired_rows(10.0) == [0, 1, 2, 4]
+    assert store.stale_rows(100.0) == [0, 1, 2, 3, 4]
+    assert store.stale_rows(50.0) == [0, 1, 2, 4]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for rota.rate_limiter.TokenBucketRateLimiter
+Drives the buckets with a fake clock to check burst, refill, per-client
+isolation and eviction of idle clients.
+
+    python -m pytest -q test_rate_limiter.py
+"""
+
+import sys
+import os
+import math
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from proxy_fixtures import FakeClock
+from rota.rate_limiter import TokenBucketRateLimiter
+
+
+def test_burst_then_refill():
+    clock = FakeClock()
+    # One token a second, bursts of up to five
+    limiter = TokenBucketRateLimiter(60, 5, clock=clock)
+    assert [limiter.acquire("client") for _ in range(5)] == [0.0] * 5
+    assert limiter.acquire("client") == 1.0
+    
+    clock.advance(0.5)
+    assert limiter.acquire("client") == 0.5
+    clock.advance(0.5)
+    assert limiter.acquire("client") == 0.0
+    assert limiter.acquire("client") == 1.0
+    
+    # Refill stops at the burst capacity
+    clock.advance(60)
+    assert [limiter.acquire("client") for _ in range(5)] == [0.0] * 5
+    assert limiter.acquire("client") > 0
+    assert limiter.get_stats()['rate_limit_rejections'] == 4
+
+
+def test_clients_are_isolated():
+    clock = FakeClock()
+    limiter = TokenBucketRateLimiter(60, 2, stripes=4, clock=clock)
+    for _ in range(2):
+        assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") > 0
+    # Other clients, on the same stripe or not, keep their own buckets
+    for key in ["b", "c", ("10.0.0.1", 1), 42]:
+        assert limiter.acquire(key) == 0.0
+        assert limiter.acquire(key) == 0.0
+        assert limiter.acquire(key) > 0
+    assert len(limiter) == 5
+
+
+def test_idle_clients_are_evicted():
+    clock = FakeClock()
+    # Two tokens a second and a burst of four: a bucket is full again after 2s
+    limiter = TokenBucketRateLimiter(120, 4, stripes=1, clock=clock)
+    assert limiter.idle_timeout == 2.0
+    limiter.acquire("old")
+    clock.advance(1)
+    limiter.acquire("recent")
+    assert limiter.evict_idle() == 0
+    
+    clock.advance(1)
+    assert limiter.evict_idle() == 1
+    assert len(limiter) == 1
+    
+    # Requests sweep their stripe once per idle timeout as well
+    clock.advance(2)
+    limiter.acquire("new")
+    assert len(limiter) == 1
+    # An evicted client starts again with a full bucket
+    assert [limiter.acquire("old") for _ in range(4)] == [0.0] * 4
+
+
+def test_zero_rate():
+    clock = FakeClock()
+    limiter = TokenBucketRateLimiter(0, 1, clock=clock)
+    assert limiter.acquire("client") == 0.0
+    # Nothing refills, until the bucket has been idle for an hour and is dropped
+    clock.advance(60)
+    assert math.isinf(limiter.acquire("client"))
+    assert TokenBucketRateLimiter.retry_after(math.inf) == '3600'
+    assert TokenBucketRateLimiter.retry_after(0.2) == '1'
+    assert TokenBucketRateLimiter.retry_after(2.5) == '3'
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")